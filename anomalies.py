@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Anomaly Detection
+Streaming detector for unusual stock-outs and shrinkage.
+
+The detector subscribes to a store (Store.subscribe) and receives every
+committed batch of movements. The write path only puts the batch on a
+bounded queue; a background worker replays it into per-SKU statistics
+and raises alerts. If the worker falls behind and the queue is full,
+batches are dropped (and counted) rather than slowing down writes.
+
+Per SKU it keeps, in constant memory:
+
+  - EWMA mean and variance of OUT sizes: an OUT more than `threshold`
+    standard deviations above the mean is an "outlier"
+  - EWMA mean and variance of OUT units per `window` seconds: a window
+    exceeding them the same way is a "burst"
+  - a streak of negative adjustments (OUTs outside an order whose notes
+    read like a write-off or count correction): every `streak` of them
+    in a row is "shrinkage"
+
+Statistics need `warmup` observations before they flag anything.
+
+Enable for the default store with PLUMBERRY_ANOMALIES=1 (alerts are
+printed to stderr), or attach one yourself:
+
+    detector = AnomalyDetector(on_alert=print).attach(store)
+"""
+
+import math
+import queue
+import sys
+import threading
+import weakref
+from collections import deque
+from datetime import datetime
+
+import metrics
+
+ADJUSTMENT_WORDS = ("adjust", "count", "damage", "shrink", "lost", "missing", "write", "expired",
+                    "broken", "theft")
+
+# Per-SKU state slots
+N, MEAN, VAR, WINDOW, UNITS, RATE_N, RATE_MEAN, RATE_VAR, STREAK, FLAGGED = range(10)
+
+
+class Anomaly:
+    """One alert: kind is 'outlier', 'burst' or 'shrinkage'"""
+
+    def __init__(self, kind, sku, record_id, timestamp, value, expected, message):
+        self.kind = kind
+        self.sku = sku
+        self.record_id = record_id
+        self.timestamp = timestamp
+        self.value = value
+        self.expected = expected
+        self.message = message
+
+    def __str__(self):
+        return f"[{self.kind}] {self.sku}: {self.message}"
+
+    def to_dict(self):
+        return {'kind': self.kind, 'sku': self.sku, 'record_id': self.record_id,
+                'timestamp': self.timestamp, 'value': self.value, 'expected': self.expected,
+                'message': self.message}
+
+
+def is_adjustment(record):
+    """OUT outside an order that reads like a write-off or count correction"""
+    if record.get('order_id'):
+        return False
+    notes = (record.get('notes') or "").lower()
+    return any(word in notes for word in ADJUSTMENT_WORDS)
+
+
+class AnomalyDetector:
+    """Per-SKU EWMA statistics over the movement stream, fed by a worker thread"""
+
+    def __init__(self, alpha=0.05, threshold=4.0, window=60, warmup=20, streak=3,
+                 queue_size=4096, on_alert=None, max_alerts=1000):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.window = window
+        self.warmup = warmup
+        self.streak = streak
+        self.on_alert = on_alert
+        self.alerts = deque(maxlen=max_alerts)
+        self.processed = 0
+        self.dropped = 0
+        self._state = {}
+        self._stamp = (None, 0)
+        self._queue = queue.Queue(queue_size)
+        self._worker = threading.Thread(target=self._run, name="anomaly-detector", daemon=True)
+        self._worker.start()
+
+    def attach(self, store):
+        """Subscribe to a store's committed movements; returns self
+
+        The detector becomes store.anomalies, so a front end reuses it
+        instead of starting another, and its worker stops once the store
+        is garbage collected (e.g. with a Streamlit session).
+        """
+        store.subscribe(self.submit)
+        store.anomalies = self
+        weakref.finalize(store, self.close).atexit = False
+        return self
+
+    def submit(self, records):
+        """Queue a committed batch (never blocks; drops it if the queue is full)"""
+        try:
+            self._queue.put_nowait(records)
+        except queue.Full:
+            self.dropped += 1
+            metrics.incr("anomaly_batches_dropped")
+
+    def drain(self):
+        """Wait until every queued batch has been processed"""
+        self._queue.join()
+
+    def close(self):
+        """Process what is queued, then stop the worker"""
+        if self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+
+    def _run(self):
+        while True:
+            records = self._queue.get()
+            try:
+                if records is None:
+                    return
+                self.process(records)
+            except Exception as e:
+                print(f"Anomaly detector error: {e}", file=sys.stderr)
+            finally:
+                self._queue.task_done()
+
+    # Statistics
+
+    def _seconds(self, timestamp):
+        # Movements in a batch share one timestamp string
+        if timestamp != self._stamp[0]:
+            self._stamp = (timestamp, datetime.fromisoformat(timestamp).timestamp())
+        return self._stamp[1]
+
+    def process(self, records):
+        """Update statistics with a batch of transaction records (worker thread)"""
+        alpha = self.alpha
+        threshold = self.threshold
+        warmup = self.warmup
+        states = self._state
+        for record in records:
+            if record['type'] != 'OUT':
+                continue
+            sku = record['sku']
+            quantity = record['quantity']
+            state = states.get(sku)
+            window = self._seconds(record['timestamp']) // self.window
+            if state is None:
+                state = states[sku] = [0, 0.0, 0.0, window, 0, 0, 0.0, 0.0, 0, -1]
+
+            # Size of this OUT against the EWMA of earlier ones
+            if state[N] >= warmup:
+                spread = max(math.sqrt(state[VAR]), 1.0)
+                if quantity > state[MEAN] + threshold * spread:
+                    self._alert('outlier', record, quantity, state[MEAN],
+                                f"removed {quantity} units, usually {state[MEAN]:.1f} "
+                                f"± {spread:.1f}")
+            diff = quantity - state[MEAN]
+            step = alpha * diff
+            state[MEAN] += step
+            state[VAR] = (1 - alpha) * (state[VAR] + diff * step)
+            state[N] += 1
+
+            # Units per window: close the finished windows (empty ones included)
+            if window > state[WINDOW]:
+                self._close_windows(state, window)
+            state[UNITS] += quantity
+            if state[RATE_N] >= warmup and state[FLAGGED] != window:
+                spread = max(math.sqrt(state[RATE_VAR]), 1.0)
+                if state[UNITS] > state[RATE_MEAN] + threshold * spread:
+                    state[FLAGGED] = window
+                    self._alert('burst', record, state[UNITS], state[RATE_MEAN],
+                                f"{state[UNITS]} units out within {self.window} s, "
+                                f"usually {state[RATE_MEAN]:.1f}")
+
+            # Negative adjustments in a row
+            if is_adjustment(record):
+                state[STREAK] += 1
+                if state[STREAK] % self.streak == 0:
+                    self._alert('shrinkage', record, state[STREAK], 0,
+                                f"{state[STREAK]} stock adjustments in a row")
+            else:
+                state[STREAK] = 0
+        self.processed += len(records)
+
+    def _close_windows(self, state, window):
+        alpha = self.alpha
+        units = state[UNITS]
+        # The finished window, then the empty ones in between (capped: after
+        # a long gap the averages have decayed to idle anyway)
+        for _ in range(int(min(window - state[WINDOW], 200))):
+            diff = units - state[RATE_MEAN]
+            step = alpha * diff
+            state[RATE_MEAN] += step
+            state[RATE_VAR] = (1 - alpha) * (state[RATE_VAR] + diff * step)
+            state[RATE_N] += 1
+            units = 0
+        state[WINDOW] = window
+        state[UNITS] = 0
+
+    def _alert(self, kind, record, value, expected, message):
+        anomaly = Anomaly(kind, record['sku'], record.get('id'), record['timestamp'],
+                          value, expected, message)
+        self.alerts.append(anomaly)
+        metrics.incr(f"anomalies_{kind}")
+        if self.on_alert is not None:
+            self.on_alert(anomaly)
+
+    # Queries
+
+    def stats(self, sku):
+        """Current statistics of a SKU, or None if it has had no OUTs"""
+        state = self._state.get(sku)
+        if state is None:
+            return None
+        return {'outs': state[N], 'mean': state[MEAN], 'stddev': math.sqrt(state[VAR]),
+                'rate_mean': state[RATE_MEAN], 'rate_stddev': math.sqrt(state[RATE_VAR]),
+                'streak': state[STREAK]}
+
+    def recent(self, limit=20):
+        """Latest alerts, newest first"""
+        return list(self.alerts)[::-1][:limit]
+
+
+def print_alert(anomaly):
+    print(f"⚠️  {anomaly}", file=sys.stderr)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Audit Journal
+Tamper-evident, hash-chained journal of stock transactions.
+
+Every committed transaction is hashed (SHA-256 of its canonical JSON) and
+chained to the one before it:
+
+    leaf(r)  = H(0x00 || canonical(r))      canonical(r) includes r's uid
+    chain(r) = H(chain(r - 1) || leaf(r))
+
+Every BLOCK_SIZE transactions the journal writes a checkpoint with the
+Merkle root of that block's leaves and the chain head. Checkpoints are
+chained as well, and their roots form a second Merkle tree, so:
+
+  - an auditor who trusted checkpoint k only rehashes the transactions
+    after it (verify(store, start=k))
+  - a single transaction's inclusion is proven with O(log n) hashes:
+    its path inside the block plus the block's path among checkpoints
+
+The journal is an append-only JSON-lines file:
+
+    {"batch": last_id, "chain": hex}
+    {"checkpoint": k, "first_id": ..., "last_id": ..., "root": hex, "chain": hex, "hash": hex}
+
+Enable it with PLUMBERRY_AUDIT=<path> (see storage.get_store).
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+BLOCK_SIZE = 1024
+
+FIELDS = ('id', 'sku', 'product_name', 'type', 'quantity', 'timestamp', 'notes',
+          'unit_cost', 'order_id', 'uid')
+# Transactions recorded before uids hash the fields without it, unversioned
+FIELDS_V1 = FIELDS[:-1]
+HASH_VERSION = 2
+
+GENESIS = bytes(32)
+
+
+def _h(data):
+    return hashlib.sha256(data).digest()
+
+
+def record_hash(record):
+    """Leaf hash of a transaction record
+
+    Records with a uid hash [HASH_VERSION, *FIELDS], so the uid cannot be
+    rewritten; older records without one keep their original hash.
+    """
+    if record.get('uid') is None:
+        values = [record.get(field) for field in FIELDS_V1]
+    else:
+        values = [HASH_VERSION, *(record.get(field) for field in FIELDS)]
+    canonical = json.dumps(values, separators=(',', ':'), ensure_ascii=False)
+    return _h(b"\x00" + canonical.encode())
+
+
+def node_hash(left, right):
+    return _h(b"\x01" + left + right)
+
+
+def merkle_root(leaves):
+    """Root over a list of leaf hashes (RFC 6962 shape)"""
+    tree = MerkleTree()
+    for leaf in leaves:
+        tree.append(leaf)
+    return tree.root()
+
+
+class MerkleTree:
+    """Append-only Merkle tree with O(log n) append and audit paths
+
+    levels[0] holds the leaves; a node is added to the level above as soon
+    as both of its children exist. The complete subtrees at the right
+    edge ("peaks") are folded together for the root.
+    """
+
+    def __init__(self):
+        self.levels = [[]]
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    def append(self, leaf):
+        self.levels[0].append(leaf)
+        level = 0
+        while len(self.levels[level]) % 2 == 0:
+            nodes = self.levels[level]
+            parent = node_hash(nodes[-2], nodes[-1])
+            level += 1
+            if level == len(self.levels):
+                self.levels.append([])
+            self.levels[level].append(parent)
+
+    def _peaks(self):
+        """(height, hash) of the complete subtrees, largest first"""
+        return [(height, nodes[-1]) for height, nodes in reversed(list(enumerate(self.levels)))
+                if len(nodes) % 2]
+
+    def root(self):
+        peaks = self._peaks()
+        if not peaks:
+            return GENESIS
+        root = peaks[-1][1]
+        for _, peak in reversed(peaks[:-1]):
+            root = node_hash(peak, root)
+        return root
+
+    def path(self, index):
+        """Audit path for leaf `index`: [(sibling hash, sibling is left), ...]"""
+        size = len(self)
+        if not 0 <= index < size:
+            raise IndexError(index)
+        peaks = self._peaks()
+        # Find the peak holding the leaf
+        start = 0
+        for position, (height, _) in enumerate(peaks):
+            if index < start + (1 << height):
+                break
+            start += 1 << height
+
+        path = []
+        for level in range(height):
+            node = index >> level
+            sibling = node ^ 1
+            path.append((self.levels[level][sibling], sibling < node))
+
+        # Smaller peaks to the right fold into one right sibling,
+        # then each larger peak to the left is a left sibling
+        right = peaks[position + 1:]
+        if right:
+            carry = right[-1][1]
+            for _, peak in reversed(right[:-1]):
+                carry = node_hash(peak, carry)
+            path.append((carry, False))
+        for _, peak in reversed(peaks[:position]):
+            path.append((peak, True))
+        return path
+
+
+def fold_path(leaf, path):
+    """Root implied by a leaf and its audit path"""
+    node = leaf
+    for sibling, is_left in path:
+        node = node_hash(sibling, node) if is_left else node_hash(node, sibling)
+    return node
+
+
+def verify_proof(record, proof, root):
+    """Check an inclusion proof from AuditLog.prove against a trusted root (hex)"""
+    block_root = fold_path(record_hash(record), _unhex_path(proof['block_path']))
+    return fold_path(block_root, _unhex_path(proof['checkpoint_path'])).hex() == root
+
+
+def _hex_path(path):
+    return [[sibling.hex(), is_left] for sibling, is_left in path]
+
+
+def _unhex_path(path):
+    return [(bytes.fromhex(sibling), is_left) for sibling, is_left in path]
+
+
+class AuditLog:
+    """Hash chain and Merkle checkpoints over a store's transactions
+
+    Attach with store.journal = AuditLog.open(path, store); the store then
+    appends every committed batch. path=None keeps the journal in memory.
+    """
+
+    def __init__(self, path=None, block_size=BLOCK_SIZE):
+        self.path = path
+        self.block_size = block_size
+        self.last_id = 0
+        self.chain = GENESIS
+        self.checkpoints = []
+        self.tree = MerkleTree()
+        self._block = []
+        self._block_start = 0
+        self._waiting = {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path, store=None, block_size=BLOCK_SIZE):
+        """Load a journal file and catch up with the store's transactions"""
+        log = cls(path, block_size)
+        if path and os.path.exists(path):
+            log._load()
+        if store is not None:
+            log.resume(store)
+            count = store.transaction_count()
+            if count < log.last_id:
+                raise ValueError(f"Audit journal {path} covers {log.last_id} transactions "
+                                 f"but the store has only {count}")
+            if count > log.last_id:
+                log.append(store.get_transactions(log.last_id + 1, count))
+        return log
+
+    def _load(self):
+        checkpoint_hash = GENESIS
+        block_start = 0
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if 'checkpoint' in entry:
+                    expected = self._checkpoint_hash(checkpoint_hash, entry)
+                    if entry['hash'] != expected.hex():
+                        raise ValueError(f"Audit journal {self.path}: checkpoint "
+                                         f"{entry['checkpoint']} is broken")
+                    checkpoint_hash = expected
+                    self.checkpoints.append(entry)
+                    self.tree.append(bytes.fromhex(entry['root']))
+                    block_start = entry['last_id']
+                self.last_id = entry.get('last_id', entry.get('batch'))
+                self.chain = bytes.fromhex(entry['chain'])
+        # Leaves of the open block are rebuilt from the store by resume();
+        # until then only the chain head is known
+        self._block = None
+        self._block_start = block_start
+
+    @staticmethod
+    def _checkpoint_hash(previous, entry):
+        return _h(previous + json.dumps([entry['checkpoint'], entry['first_id'], entry['last_id'],
+                                         entry['root'], entry['chain']]).encode())
+
+    # Writing
+
+    def append(self, records):
+        """Journal a committed batch; batches may arrive out of order"""
+        if not records:
+            return
+        with self._lock:
+            self._waiting[records[0]['id']] = records
+            while self.last_id + 1 in self._waiting:
+                self._append(self._waiting.pop(self.last_id + 1))
+
+    def _append(self, records):
+        if self._block is None:
+            raise RuntimeError("call resume(store) before appending to a reopened journal")
+        lines = []
+        chain = self.chain
+        for record in records:
+            leaf = record_hash(record)
+            chain = _h(chain + leaf)
+            self._block.append(leaf)
+            self.last_id = record['id']
+            if len(self._block) == self.block_size:
+                lines.append(self._seal(chain))
+        self.chain = chain
+        lines.append({'batch': self.last_id, 'chain': chain.hex()})
+        self._write(lines)
+
+    def _seal(self, chain):
+        previous = bytes.fromhex(self.checkpoints[-1]['hash']) if self.checkpoints else GENESIS
+        root = merkle_root(self._block)
+        entry = {'checkpoint': len(self.checkpoints), 'first_id': self.last_id - len(self._block) + 1,
+                 'last_id': self.last_id, 'root': root.hex(), 'chain': chain.hex()}
+        entry['hash'] = self._checkpoint_hash(previous, entry).hex()
+        self.checkpoints.append(entry)
+        self.tree.append(root)
+        self._block = []
+        return entry
+
+    def _write(self, lines):
+        if not self.path:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write("".join(json.dumps(line) + "\n" for line in lines))
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Auditing
+
+    def root(self):
+        """Merkle root over all checkpoints (hex); publish it to pin history"""
+        return self.tree.root().hex()
+
+    def verify(self, store, start=0):
+        """Rehash transactions from checkpoint `start` on and compare
+
+        Checkpoints before `start` are trusted (already verified). Returns
+        (success, message).
+        """
+        if start > len(self.checkpoints):
+            return False, f"No checkpoint {start}"
+        chain = bytes.fromhex(self.checkpoints[start - 1]['chain']) if start else GENESIS
+        first_id = self.checkpoints[start - 1]['last_id'] + 1 if start else 1
+        checked = 0
+        for entry in self.checkpoints[start:]:
+            records = store.get_transactions(entry['first_id'], entry['last_id'])
+            leaves = [record_hash(record) for record in records]
+            for leaf in leaves:
+                chain = _h(chain + leaf)
+            if (len(records) != entry['last_id'] - entry['first_id'] + 1
+                    or merkle_root(leaves).hex() != entry['root'] or chain.hex() != entry['chain']):
+                return False, (f"Transactions {entry['first_id']}-{entry['last_id']} do not match "
+                               f"checkpoint {entry['checkpoint']}")
+            checked += len(records)
+            first_id = entry['last_id'] + 1
+
+        # The open block is covered by the chain head only
+        for record in store.get_transactions(first_id, self.last_id):
+            chain = _h(chain + record_hash(record))
+            checked += 1
+        if chain != self.chain:
+            return False, f"Transactions {first_id}-{self.last_id} do not match the journal"
+        return True, (f"Verified {checked:,} transactions from checkpoint {start} "
+                      f"({len(self.checkpoints)} checkpoints, {self.last_id:,} transactions)")
+
+    def prove(self, store, record_id):
+        """Inclusion proof for a transaction in a sealed block, or None"""
+        block = (record_id - 1) // self.block_size
+        if record_id < 1 or block >= len(self.checkpoints):
+            return None
+        entry = self.checkpoints[block]
+        leaves = [record_hash(r) for r in store.get_transactions(entry['first_id'], entry['last_id'])]
+        tree = MerkleTree()
+        for leaf in leaves:
+            tree.append(leaf)
+        return {
+            'record_id': record_id,
+            'checkpoint': block,
+            'block_path': _hex_path(tree.path(record_id - entry['first_id'])),
+            'checkpoint_path': _hex_path(self.tree.path(block)),
+            'root': self.root(),
+        }
+
+    def resume(self, store):
+        """Rebuild the open block's leaves after reopening a journal"""
+        if self._block is None:
+            self._block = [record_hash(record) for record in
+                           store.get_transactions(self._block_start + 1, self.last_id)]
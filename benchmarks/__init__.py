@@ -0,0 +1,4 @@
+"""
+Plumberry Inventory Management System - Benchmarks
+Run from the project root, e.g.  python -m benchmarks.backends
+"""
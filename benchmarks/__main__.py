@@ -0,0 +1,136 @@
+"""
+Plumberry Inventory Management System - Benchmark Runner
+
+    python -m benchmarks run --sizes 1000 100000 --backends memory sqlite
+    python -m benchmarks compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+
+Results are saved as JSON (one file per commit by default) so runs from
+different commits can be compared.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+from benchmarks.harness import print_table
+from benchmarks.suite import OPERATIONS, run_suite
+from benchmarks.workload import SIZES
+from storage import BACKENDS
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def git_commit():
+    """Short hash of the checked-out commit, or 'unknown'"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def cmd_run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            for size in args.sizes:
+                print(f"Running {backend} with {size:,} SKUs...", file=sys.stderr)
+                path = os.path.join(tmp, f"bench-{size}.{backend}")
+                results.extend(run_suite(backend, size, args.ops, args.scan_ops, path,
+                                         args.operations, args.zipf, args.order_lines))
+
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'ops': args.ops,
+            'scan_ops': args.scan_ops,
+            'zipf_s': args.zipf,
+            'order_lines': args.order_lines,
+        },
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    rows = [[r['backend'], f"{r['skus']:,}", r['operation'], f"{r['ops_per_sec']:,.0f}",
+             r['p50_us'], r['p99_us']] for r in results]
+    print_table(f"Benchmark results ({commit})",
+                ["backend", "skus", "operation", "ops/sec", "p50 us", "p99 us"], rows)
+    print(f"\nSaved to {output}")
+    return 0
+
+
+def cmd_compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    def key(r):
+        return r['backend'], r['skus'], r['operation']
+
+    baseline = {key(r): r for r in old['results']}
+    rows = []
+    regressions = 0
+    for r in new['results']:
+        before = baseline.get(key(r))
+        if before is None:
+            continue
+        change = (r['ops_per_sec'] / before['ops_per_sec'] - 1) * 100 if before['ops_per_sec'] else 0.0
+        flag = ""
+        if change < -args.threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        rows.append([r['backend'], f"{r['skus']:,}", r['operation'],
+                     f"{before['ops_per_sec']:,.0f}", f"{r['ops_per_sec']:,.0f}",
+                     f"{change:+.1f}%", before['p99_us'], r['p99_us'], flag])
+
+    print_table(f"{old['meta']['commit']} -> {new['meta']['commit']}",
+                ["backend", "skus", "operation", "old ops/sec", "new ops/sec", "change",
+                 "old p99", "new p99", ""], rows or [["-"] * 9])
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0f}%")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Plumberry inventory benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run the benchmark suite")
+    run.add_argument("--sizes", type=int, nargs="+", default=SIZES[:3],
+                     help=f"catalogue sizes in SKUs (up to {SIZES[-1]:,})")
+    run.add_argument("--backends", nargs="+", default=["memory"], choices=list(BACKENDS))
+    run.add_argument("--operations", nargs="+", choices=list(OPERATIONS))
+    run.add_argument("--ops", type=int, default=10000, help="timed calls per operation")
+    run.add_argument("--scan-ops", type=int, default=20,
+                     help="timed calls for full-catalogue operations")
+    run.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of SKU popularity")
+    run.add_argument("--order-lines", type=int, default=40, help="line items per order")
+    run.add_argument("--output", help="JSON file (default: benchmarks/results/<commit>.json)")
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="compare two JSON result files")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=10.0,
+                         help="flag throughput drops larger than this percentage")
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Plumberry Inventory Management System - Storage Backend Benchmark
+Runs the same workload against every storage backend and compares
+throughput.
+
+    python -m benchmarks.backends --products 10000 --movements 50000
+"""
+
+import argparse
+import os
+import tempfile
+
+from benchmarks.harness import ops_per_sec, print_table, run_batches, run_each
+from benchmarks.workload import catalogue, movement_stream
+from storage import BACKENDS, get_store
+
+
+def make_workload(num_products, num_movements):
+    """Synthetic catalogue and a Zipf-skewed IN/OUT movement stream over it"""
+    return list(catalogue(num_products)), list(movement_stream(num_products, num_movements))
+
+
+def bench_backend(backend, path, products, movements, batch_size):
+    """Run the workload on one backend; return {operation: ops/sec}"""
+    store = get_store(backend, path)
+    results = {}
+    try:
+        results['add_product'] = ops_per_sec(
+            len(products), run_each(store.add_product, products))
+
+        half = len(movements) // 2
+        single = movements[:half]
+        results['movement'] = ops_per_sec(
+            len(single), run_each(lambda s, t, q, n: store.apply_movements([(s, t, q, n)]), single))
+
+        batched = movements[half:]
+        results['movement (batched)'] = ops_per_sec(
+            len(batched), run_batches(store.apply_movements, batched, batch_size))
+
+        lookups = [(m[0],) for m in movements]
+        results['lookup'] = ops_per_sec(len(lookups), run_each(store.get_product, lookups))
+
+        history = [(50,)] * 1000
+        results['recent history'] = ops_per_sec(
+            len(history), run_each(store.recent_transactions, history))
+    finally:
+        store.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare storage backend throughput")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--movements", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    args = parser.parse_args()
+
+    products, movements = make_workload(args.products, args.movements)
+
+    all_results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            path = os.path.join(tmp, f"bench.{backend}")
+            print(f"Running {backend}...")
+            all_results[backend] = bench_backend(backend, path, products, movements, args.batch_size)
+
+    operations = list(next(iter(all_results.values())))
+    rows = [[op] + [f"{all_results[b][op]:,.0f}" for b in args.backends] for op in operations]
+    print_table(f"Throughput (ops/sec) - {args.products:,} products, {args.movements:,} movements",
+                ["operation"] + args.backends, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Plumberry Inventory Management System - Benchmark Harness
+Shared timing and reporting helpers for the benchmark scripts
+"""
+
+import time
+
+
+def timed(fn, *args, **kwargs):
+    """Call fn once; return (result, seconds)"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_each(fn, items):
+    """Call fn(*item) for every item; return elapsed seconds"""
+    start = time.perf_counter()
+    for item in items:
+        fn(*item)
+    return time.perf_counter() - start
+
+
+def run_batches(fn, items, batch_size):
+    """Call fn(batch) for consecutive slices of items; return elapsed seconds"""
+    start = time.perf_counter()
+    for i in range(0, len(items), batch_size):
+        fn(items[i:i + batch_size])
+    return time.perf_counter() - start
+
+
+def ops_per_sec(count, seconds):
+    """Throughput, guarding against a zero timer reading"""
+    return count / seconds if seconds > 0 else float('inf')
+
+
+def print_table(title, columns, rows):
+    """Print results as a fixed-width table"""
+    widths = [max(len(str(c)), *(len(str(r[i])) for r in rows)) for i, c in enumerate(columns)]
+    print("\n" + title)
+    print("=" * (sum(widths) + 3 * (len(widths) - 1)))
+    print(" | ".join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    print("-" * (sum(widths) + 3 * (len(widths) - 1)))
+    for row in rows:
+        print(" | ".join(str(v).rjust(w) if i else str(v).ljust(w)
+                         for i, (v, w) in enumerate(zip(row, widths))))
+
+
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0
+    index = max(0, min(len(sorted_samples) - 1, int(round(pct / 100.0 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def measure(fn, items):
+    """Call fn(*item) for every item, timing each call
+
+    Returns a dict with the operation count, total seconds, throughput
+    and p50/p99/max latency in microseconds.
+    """
+    timer = time.perf_counter_ns
+    samples = []
+    append = samples.append
+    for item in items:
+        start = timer()
+        fn(*item)
+        append(timer() - start)
+    return summarize(samples)
+
+
+def summarize(samples_ns):
+    """Throughput and latency percentiles from per-call nanosecond samples"""
+    samples_ns = sorted(samples_ns)
+    seconds = sum(samples_ns) / 1e9
+    return {
+        'ops': len(samples_ns),
+        'seconds': round(seconds, 6),
+        'ops_per_sec': round(ops_per_sec(len(samples_ns), seconds), 1),
+        'p50_us': round(percentile(samples_ns, 50) / 1000.0, 2),
+        'p99_us': round(percentile(samples_ns, 99) / 1000.0, 2),
+        'max_us': round(samples_ns[-1] / 1000.0, 2) if samples_ns else 0,
+    }
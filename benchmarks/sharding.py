@@ -0,0 +1,54 @@
+"""
+Plumberry Inventory Management System - Sharded Ingestion Benchmark
+Movement throughput of one store against sharding.ShardedIngest with a
+growing number of worker processes.
+
+    python -m benchmarks.sharding --products 100000 --movements 1000000 --shards 1 2 4 8
+"""
+
+import argparse
+import os
+
+from benchmarks.harness import ops_per_sec, print_table, run_batches, timed
+from benchmarks.workload import catalogue, movement_stream
+from sharding import ShardedIngest
+from storage import InMemoryStore
+
+
+def bench_single(products, movements, batch_size):
+    store = InMemoryStore()
+    store.add_products(products)
+    return ops_per_sec(len(movements), run_batches(store.apply_movements, movements, batch_size))
+
+
+def bench_sharded(shards, products, movements, chunk_size):
+    with ShardedIngest(shards, chunk_size=chunk_size) as engine:
+        engine.add_products(products)
+        _, seconds = timed(engine.ingest, movements)
+    return ops_per_sec(len(movements), seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sharded movement ingestion")
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--movements", type=int, default=1000000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    products = list(catalogue(args.products))
+    movements = list(movement_stream(args.products, args.movements))
+
+    print("Running single store...")
+    single = bench_single(products, movements, args.chunk_size)
+    rows = [["single store", f"{single:,.0f}", "1.00x"]]
+    for shards in args.shards:
+        print(f"Running {shards} shard(s)...")
+        rate = bench_sharded(shards, products, movements, args.chunk_size)
+        rows.append([f"{shards} shard(s)", f"{rate:,.0f}", f"{rate / single:.2f}x"])
+    print_table(f"Movements/sec - {args.products:,} products, {args.movements:,} movements, "
+                f"{os.cpu_count()} CPUs", ["engine", "movements/sec", "speed-up"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Plumberry Inventory Management System - Core Operation Benchmarks
+Throughput and p50/p99 latency of the inventory operations on synthetic
+catalogues, for one storage backend and catalogue size at a time.
+"""
+
+import csv
+import io
+import itertools
+
+from benchmarks.harness import measure
+from benchmarks.workload import catalogue, lookup_stream, movement_stream, order_stream, search_terms
+from orders import OrderBook
+from storage import LOW_STOCK_THRESHOLD, get_store
+
+
+def dashboard_totals(store):
+    """The Dashboard metrics, computed the way the front ends do"""
+    with store.snapshot() as snap:
+        products = snap.products()
+        return (len(products),
+                sum(p['price'] * p['quantity'] for p in products),
+                sum(1 for p in products if p['quantity'] < LOW_STOCK_THRESHOLD),
+                snap.transaction_count())
+
+
+def export_inventory_csv(store):
+    """Inventory report as CSV text, like the Reports download button"""
+    with store.snapshot() as snap:
+        products = snap.products()
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['SKU', 'Product Name', 'Category', 'Price', 'Stock', 'Value'])
+    writer.writerows((p['sku'], p['name'], p['category'], p['price'], p['quantity'],
+                      round(p['price'] * p['quantity'], 2)) for p in products)
+    return out.getvalue()
+
+
+def bench_add_product(store, ctx):
+    return measure(store.add_product, catalogue(ctx['skus'], start=ctx['preloaded']))
+
+
+def bench_add_stock(store, ctx):
+    return measure(store.add_stock, ((s, q, n) for s, t, q, n in ctx['movements'] if t == 'IN'))
+
+
+def bench_remove_stock(store, ctx):
+    return measure(store.remove_stock, ((s, q, n) for s, t, q, n in ctx['movements'] if t == 'OUT'))
+
+
+def bench_lookup(store, ctx):
+    return measure(store.get_product, ((sku,) for sku in lookup_stream(ctx['skus'], ctx['ops'])))
+
+
+def bench_search(store, ctx):
+    return measure(store.search_products, ((t,) for t in search_terms(ctx['skus'], ctx['scan_ops'])))
+
+
+def bench_history(store, ctx):
+    return measure(store.recent_transactions, itertools.repeat((50,), ctx['ops']))
+
+
+def place_order(book, kind, party, lines):
+    """Create an order and commit all of its lines in one write transaction"""
+    return book.place(kind, party, lines)
+
+
+def bench_orders(store, ctx):
+    book = OrderBook(store)
+    return measure(place_order, ((book, *order) for order in ctx['orders']))
+
+
+def bench_dashboard(store, ctx):
+    return measure(dashboard_totals, itertools.repeat((store,), ctx['scan_ops']))
+
+
+def bench_export(store, ctx):
+    return measure(export_inventory_csv, itertools.repeat((store,), ctx['scan_ops']))
+
+
+# Run in this order: later operations see the data written by earlier ones
+OPERATIONS = {
+    'add_product': bench_add_product,
+    'add_stock': bench_add_stock,
+    'remove_stock': bench_remove_stock,
+    'lookup': bench_lookup,
+    'search': bench_search,
+    'history': bench_history,
+    'orders': bench_orders,
+    'dashboard': bench_dashboard,
+    'export': bench_export,
+}
+
+
+def run_suite(backend, num_skus, ops, scan_ops, path=None, operations=None, zipf_s=1.1,
+              order_lines=40):
+    """Benchmark each operation on a fresh store; return a list of result dicts
+
+    The first num_skus - ops products are bulk-loaded untimed, and the
+    add_product benchmark times the remaining ones. Full-catalogue
+    operations (search, dashboard, export) run scan_ops times; the orders
+    benchmark places ops / 10 orders of order_lines lines each.
+    """
+    store = get_store(backend, path)
+    preloaded = max(0, num_skus - ops)
+    ctx = {
+        'skus': num_skus,
+        'ops': ops,
+        'scan_ops': scan_ops,
+        'preloaded': preloaded,
+        'movements': list(movement_stream(num_skus, ops, s=zipf_s)),
+        # Orders only reference the bulk-loaded products, so they exist in any run
+        'orders': list(order_stream(max(1, preloaded), max(1, ops // 10), order_lines, s=zipf_s)),
+    }
+    results = []
+    try:
+        store.add_products(catalogue(preloaded))
+        for name in operations or OPERATIONS:
+            stats = OPERATIONS[name](store, ctx)
+            results.append({'backend': backend, 'skus': num_skus, 'operation': name, **stats})
+    finally:
+        store.close()
+    return results
@@ -0,0 +1,114 @@
+"""
+Plumberry Inventory Management System - Synthetic Workloads
+Deterministic catalogues and movement streams for the benchmarks.
+
+Catalogues scale from a thousand to ten million SKUs and are generated
+lazily, so nothing is held in memory that the store does not keep itself.
+Movement streams pick SKUs from a Zipf distribution: a few best sellers
+get most of the traffic, like a real shop.
+"""
+
+import math
+import random
+
+FLAVOURS = ["Plumberry", "Wild Plumberry", "Golden Plumberry", "Smoked Plumberry",
+            "Spiced Plumberry", "Honey Plumberry", "Black Plumberry", "Tart Plumberry"]
+FORMS = ["Jam", "Juice", "Tea", "Extract", "Syrup", "Chutney", "Dried Bites", "Cordial",
+         "Sorbet", "Vinegar"]
+CATEGORIES = ["Preserves", "Beverages", "Dried Fruits", "Extracts", "Frozen", "Condiments",
+              "Gift Sets", "Bakery"]
+
+SIZES = [1000, 10000, 100000, 1000000, 10000000]
+
+
+def sku_for(index):
+    """SKU of the index-th synthetic product"""
+    return f"SKU{index:08d}"
+
+
+def catalogue(num_skus, start=0, seed=42):
+    """Yield (name, sku, category, price, quantity) for products start..num_skus-1"""
+    rng = random.Random(seed * 1000003 + start)
+    for i in range(start, num_skus):
+        yield (f"{FLAVOURS[i % len(FLAVOURS)]} {FORMS[i // len(FLAVOURS) % len(FORMS)]} {i}",
+               sku_for(i),
+               CATEGORIES[i % len(CATEGORIES)],
+               round(rng.uniform(0.5, 60.0), 2),
+               rng.randint(0, 500))
+
+
+class ZipfSampler:
+    """Zipf-distributed indexes in [0, n) using O(1) memory
+
+    Ranks come from the inverse CDF of the continuous approximation of
+    Zipf's law, then a fixed multiplicative permutation scatters the hot
+    ranks across the catalogue so they are not all neighbouring SKUs.
+    """
+
+    def __init__(self, n, s=1.1, seed=7):
+        self.n = n
+        self.s = s
+        self.rng = random.Random(seed)
+        self.multiplier = self._coprime_multiplier(n)
+        if s != 1.0:
+            self.top = n ** (1.0 - s) - 1.0
+
+    @staticmethod
+    def _coprime_multiplier(n):
+        multiplier = 2654435761 % n if n > 1 else 1
+        while n > 1 and math.gcd(multiplier, n) != 1:
+            multiplier += 1
+        return multiplier or 1
+
+    def rank(self):
+        """Zipf rank in [0, n), 0 being the most popular"""
+        u = self.rng.random()
+        if self.s == 1.0:
+            rank = int(self.n ** u) - 1
+        else:
+            rank = int((self.top * u + 1.0) ** (1.0 / (1.0 - self.s))) - 1
+        return min(max(rank, 0), self.n - 1)
+
+    def sample(self):
+        return self.rank() * self.multiplier % self.n
+
+
+def movement_stream(num_skus, count, s=1.1, in_ratio=0.4, seed=7):
+    """Yield (sku, type, quantity, notes) movements over a synthetic catalogue"""
+    sampler = ZipfSampler(num_skus, s, seed)
+    rng = random.Random(seed + 1)
+    for i in range(count):
+        if rng.random() < in_ratio:
+            yield (sku_for(sampler.sample()), 'IN', rng.randint(10, 200), f"PO-{i}")
+        else:
+            yield (sku_for(sampler.sample()), 'OUT', rng.randint(1, 5), f"Order #{i}")
+
+
+def order_stream(num_skus, count, lines=40, s=1.1, purchase_ratio=0.5, seed=17):
+    """Yield (kind, party, lines) orders with Zipf-distributed SKUs per line"""
+    sampler = ZipfSampler(num_skus, s, seed)
+    rng = random.Random(seed + 1)
+    for _ in range(count):
+        if rng.random() < purchase_ratio:
+            yield ('PO', f"Supplier {rng.randrange(50)}",
+                   [(sku_for(sampler.sample()), rng.randint(10, 200)) for _ in range(lines)])
+        else:
+            yield ('SO', f"Customer {rng.randrange(5000)}",
+                   [(sku_for(sampler.sample()), rng.randint(1, 5)) for _ in range(lines)])
+
+
+def lookup_stream(num_skus, count, s=1.1, seed=11):
+    """Yield SKUs to look up, with the same skew as the movements"""
+    sampler = ZipfSampler(num_skus, s, seed)
+    for _ in range(count):
+        yield sku_for(sampler.sample())
+
+
+def search_terms(num_skus, count, seed=13):
+    """Search strings in the shapes people type: SKU fragments and words"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        if rng.random() < 0.5:
+            yield sku_for(rng.randrange(num_skus))[-5:]
+        else:
+            yield rng.choice(FORMS).lower()
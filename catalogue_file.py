@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Catalogue Files
+Compact binary snapshot of the product catalogue for fast startup.
+
+Instead of rebuilding the catalogue in Python on every launch, the CLI
+can load a pre-built file in a background thread while the menu is
+already on screen:
+
+    python catalogue_file.py build catalogue.plc --synthetic 1000000
+    PLUMBERRY_CATALOGUE=catalogue.plc python plumberry.py
+
+The file is a short header followed by one pickle of columns: names and
+SKUs as lists, categories dictionary-encoded, prices and quantities as
+typed arrays.
+"""
+
+import pickle
+import threading
+from array import array
+
+MAGIC = b"PLMCAT"
+VERSION = 1
+
+
+def products_to_columns(products):
+    """Split (name, sku, category, price, quantity) rows into columns"""
+    names, skus, codes = [], [], array('I')
+    prices, quantities = array('d'), array('q')
+    categories = {}
+    for name, sku, category, price, quantity in products:
+        names.append(name)
+        skus.append(sku)
+        codes.append(categories.setdefault(category, len(categories)))
+        prices.append(price)
+        quantities.append(quantity)
+    return {
+        'count': len(names),
+        'name': names,
+        'sku': skus,
+        'categories': list(categories),
+        'category': codes,
+        'price': prices,
+        'quantity': quantities,
+    }
+
+
+def columns_to_products(columns):
+    """Rows back from columns, in catalogue order"""
+    categories = columns['categories']
+    return zip(columns['name'], columns['sku'],
+               [categories[code] for code in columns['category']],
+               columns['price'], columns['quantity'])
+
+
+def save_catalogue(store, path):
+    """Write the store's products to a catalogue file; returns the count"""
+    with store.snapshot() as snap:
+        rows = [(p['name'], p['sku'], p['category'], p['price'], p['quantity'])
+                for p in snap.products()]
+    return write_catalogue(rows, path)
+
+
+def write_catalogue(products, path):
+    """Write (name, sku, category, price, quantity) rows; returns the count"""
+    columns = products_to_columns(products)
+    with open(path, "wb") as f:
+        f.write(MAGIC + bytes([VERSION]))
+        pickle.dump(columns, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return columns['count']
+
+
+def read_catalogue(path):
+    """Columns from a catalogue file"""
+    with open(path, "rb") as f:
+        header = f.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a Plumberry catalogue file")
+        if header[len(MAGIC)] != VERSION:
+            raise ValueError(f"Unsupported catalogue version {header[len(MAGIC)]} in {path}")
+        return pickle.load(f)
+
+
+def load_catalogue(store, path):
+    """Bulk-load a catalogue file into the store; returns products added"""
+    return store.add_products(columns_to_products(read_catalogue(path)))
+
+
+def load_in_background(store, path):
+    """Start loading a catalogue file; returns the (daemon) loader thread
+
+    Callers must join() the thread before using the store. The thread's
+    `error` attribute holds the exception if loading failed.
+    """
+    def run():
+        try:
+            loader.added = load_catalogue(store, path)
+        except Exception as e:
+            loader.error = e
+
+    loader = threading.Thread(target=run, name="catalogue-loader", daemon=True)
+    loader.added = 0
+    loader.error = None
+    loader.start()
+    return loader
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or inspect Plumberry catalogue files")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="write a catalogue file")
+    build.add_argument("output")
+    build.add_argument("--synthetic", type=int, metavar="N",
+                       help="N synthetic products instead of the configured store")
+    info = sub.add_parser("info", help="describe a catalogue file")
+    info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if args.synthetic:
+            from benchmarks.workload import catalogue
+            count = write_catalogue(catalogue(args.synthetic), args.output)
+        else:
+            from storage import get_store, load_sample_products
+            store = get_store()
+            load_sample_products(store)
+            count = save_catalogue(store, args.output)
+        print(f"✅ Wrote {count:,} products to {args.output}")
+    else:
+        columns = read_catalogue(args.path)
+        print(f"📦 {columns['count']:,} products, {len(columns['categories'])} categories")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Category Tree
+Hierarchical categories with roll-up totals kept current per node.
+
+A product's category is a path: "Beverages > Juice > Cold-pressed". The
+tree has a node per distinct path prefix, each holding the totals of its
+whole subtree: number of products, units on hand and stock value (in
+cents, at the product's price). Adding a product or replaying a movement
+updates only the nodes on its ancestor path, so it costs O(depth), and a
+drill-down report of any node reads just its children.
+
+Node ids are assigned in order of first appearance in the catalogue
+(products are read in id order), so the same store always gives the same
+ids; the root is 0.
+
+Like valuation.CostLedger, a tree follows a store with sync(store).
+Price changes made by the store's pricing engine (pricing.py) are
+picked up from its change log and adjust the values on each product's
+path, like movements; without an engine, a product change re-reads the
+prices.
+"""
+
+from storage import PRODUCTS
+from valuation import from_cents, to_cents
+
+SEPARATOR = ">"
+ROOT = 0
+
+
+def split_path(category):
+    """Path components of a category string ("A > B" -> ["A", "B"])"""
+    parts = [part.strip() for part in (category or "").split(SEPARATOR)]
+    return [part for part in parts if part] or ["Uncategorized"]
+
+
+class CategoryNode:
+    """One category with the totals of its subtree"""
+
+    __slots__ = ('id', 'name', 'parent', 'depth', 'children', 'products', 'units', 'value')
+
+    def __init__(self, node_id, name, parent, depth):
+        self.id = node_id
+        self.name = name
+        self.parent = parent
+        self.depth = depth
+        self.children = {}
+        self.products = 0
+        self.units = 0
+        self.value = 0
+
+    @property
+    def amount(self):
+        """Stock value as a Decimal"""
+        return from_cents(self.value)
+
+
+class CategoryTree:
+    """Category nodes by id, with per-SKU leaf and price for movements
+
+    Not thread-safe; keep one tree per thread (or per Streamlit session).
+    """
+
+    def __init__(self):
+        self.nodes = [CategoryNode(ROOT, "All", None, 0)]
+        # sku -> [leaf id, price in cents, units]
+        self._skus = {}
+        self.last_id = 0
+        self._price_cursor = None
+        self._products_version = None
+
+    # Building
+
+    def _leaf(self, category):
+        node = self.nodes[ROOT]
+        for name in split_path(category):
+            child_id = node.children.get(name)
+            if child_id is None:
+                child_id = node.children[name] = len(self.nodes)
+                self.nodes.append(CategoryNode(child_id, name, node.id, node.depth + 1))
+            node = self.nodes[child_id]
+        return node.id
+
+    def _roll_up(self, node_id, products, units, value):
+        nodes = self.nodes
+        while node_id is not None:
+            node = nodes[node_id]
+            node.products += products
+            node.units += units
+            node.value += value
+            node_id = node.parent
+
+    def add_product(self, sku, category, price, quantity):
+        """Count a product under its category (O(depth))"""
+        if sku in self._skus:
+            return
+        leaf = self._leaf(category)
+        cents = to_cents(price)
+        self._skus[sku] = [leaf, cents, quantity]
+        self._roll_up(leaf, 1, quantity, quantity * cents)
+
+    def move(self, sku, quantity):
+        """Apply a stock change of `quantity` units (negative for OUT)"""
+        entry = self._skus.get(sku)
+        if entry is not None:
+            entry[2] += quantity
+            self._roll_up(entry[0], 0, quantity, quantity * entry[1])
+
+    def reprice(self, sku, price):
+        """Value a product's units at a new price (O(depth))"""
+        entry = self._skus.get(sku)
+        if entry is not None:
+            cents = to_cents(price)
+            self._roll_up(entry[0], 0, 0, (cents - entry[1]) * entry[2])
+            entry[1] = cents
+
+    def apply(self, record):
+        """Replay one transaction record"""
+        self.move(record['sku'], record['quantity'] if record['type'] == 'IN' else -record['quantity'])
+        self.last_id = record['id']
+
+    def sync(self, store):
+        """Catch up with the products and transactions added since the last sync
+
+        Reads from one snapshot. Products new to the tree are counted with
+        their stock before the new movements, which are then replayed.
+        Returns the number of transactions applied.
+        """
+        pricing = store.pricing
+        # Read before the snapshot: changes after it are applied again (harmless)
+        cursor = pricing.cursor() if pricing is not None else None
+        version = store.changes(PRODUCTS)
+        reread = False
+        with store.snapshot() as snap:
+            count = snap.transaction_count()
+            new = snap.recent_transactions(count - self.last_id)[::-1] if count > self.last_id else []
+            if pricing is not None and self._price_cursor is not None:
+                changes, cursor = pricing.changes_since(self._price_cursor)
+                reread = changes is None
+            else:
+                changes = ()
+                reread = (pricing is None and self._products_version is not None
+                          and version != self._products_version)
+            products = (snap.products() if reread or snap.product_count() != len(self._skus)
+                        else ())
+        self._price_cursor = cursor
+        self._products_version = version
+
+        if products:
+            net = {}
+            for record in new:
+                sign = 1 if record['type'] == 'IN' else -1
+                net[record['sku']] = net.get(record['sku'], 0) + sign * record['quantity']
+            for product in products:
+                if product['sku'] not in self._skus:
+                    self.add_product(product['sku'], product['category'], product['price'],
+                                     product['quantity'] - net.get(product['sku'], 0))
+            if reread:
+                # Prices changed in ways the tree did not see
+                for product in products:
+                    self.reprice(product['sku'], product['price'])
+        for sku, _, price in changes or ():
+            self.reprice(sku, price)
+        for record in new:
+            self.apply(record)
+        return len(new)
+
+    # Queries
+
+    def find(self, path):
+        """Node for a category path string or list, or None"""
+        node = self.nodes[ROOT]
+        for name in (split_path(path) if isinstance(path, str) else path):
+            child_id = node.children.get(name)
+            if child_id is None:
+                return None
+            node = self.nodes[child_id]
+        return node
+
+    def path(self, node_id):
+        """Full path string of a node ("Beverages > Juice")"""
+        names = []
+        node = self.nodes[node_id]
+        while node.parent is not None:
+            names.append(node.name)
+            node = self.nodes[node.parent]
+        return f" {SEPARATOR} ".join(reversed(names))
+
+    def children(self, node_id=ROOT):
+        """Child nodes of a node, by name (O(children))"""
+        node = self.nodes[node_id]
+        return [self.nodes[child_id] for _, child_id in sorted(node.children.items())]
+
+    def category_of(self, sku):
+        """Leaf node id of a product, or None"""
+        entry = self._skus.get(sku)
+        return entry[0] if entry is not None else None
+
+    def __len__(self):
+        return len(self.nodes) - 1
@@ -0,0 +1,606 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Scripted Commands
+Non-interactive subcommands and batch command files for plumberry.py
+
+    python plumberry.py add-product "Plumberry Syrup" PLM005 Syrups 6.50 40
+    python plumberry.py add-stock PLM001 25 --cost 9.40 --notes "Delivery 118"
+    python plumberry.py remove-stock PLM002 3
+    python plumberry.py purchase-order "Acme Farms" PLM001:100@4.10 PLM002:40
+    python plumberry.py sales-order "Corner Cafe" PLM001:12 PLM003:6
+    python plumberry.py search juice
+    python plumberry.py set-attributes PLM003 supplier=Acme pack_size=12
+    python plumberry.py find category=Beverages "price<6" "quantity<50" --explain
+    python plumberry.py report --as-of 2026-09-30
+    python plumberry.py replenish --suppliers suppliers.json --create
+    python plumberry.py reconcile counts.csv --apply
+    python plumberry.py reprice prices.csv --at 2026-11-01   # with PLUMBERRY_PRICES=prices.jsonl
+    python plumberry.py promote "Winter sale" --percent 20 --start 2026-12-01 --end 2027-01-01 --category Preserves
+    python plumberry.py price PLM001 --at "2026-12-15 10:00:00"
+    python plumberry.py batch feed.txt          # or: ... | python plumberry.py batch
+    python plumberry.py audit verify --from 120 # with PLUMBERRY_AUDIT=journal.log
+    python plumberry.py compact --hot-days 30   # with PLUMBERRY_RETENTION=history/
+
+A command file holds one operation per line, written like the
+subcommands; an add-stock unit cost is written as @COST, and the notes
+of add-stock / remove-stock are the rest of the line:
+
+    add-product "Plumberry Syrup" PLM005 Syrups 6.50 40
+    add-stock PLM005 25 @4.10 Delivery 118
+    remove-stock PLM002 3
+    sales-order "Corner Cafe" PLM001:12 PLM003:6
+    report 2026-09-30
+
+Blank lines and lines starting with '#' are skipped. Products and stock
+movements are gathered into batches and each batch is written with a
+single store commit; search and report first write what is pending.
+Orders (lines SKU:QUANTITY[@COST]) are created and committed on their
+own, all lines or none.
+"""
+
+import argparse
+import json
+import shlex
+import sys
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from orders import PURCHASE, SALE, OrderBook
+from storage import LOW_STOCK_THRESHOLD, PRODUCT_FIELDS
+from valuation import value_inventory
+
+DEFAULT_BATCH_SIZE = 10000
+
+COMMANDS = ("add-product", "add-stock", "remove-stock", "purchase-order", "sales-order",
+            "search", "report")
+
+ORDER_KINDS = {"purchase-order": PURCHASE, "sales-order": SALE}
+
+
+def parse_order_line(spec):
+    """'SKU:QUANTITY[@COST]' -> (sku, quantity, unit_cost)"""
+    sku, _, rest = spec.partition(':')
+    quantity, _, cost = rest.partition('@')
+    return sku, int(quantity), Decimal(cost) if cost else None
+
+
+class BatchRunner:
+    """Apply operations to a store, one commit per batch
+
+    Failures are reported on `err` as "line N: message" and counted;
+    they never stop the run. With verbose=True successes are reported on
+    `out` as well.
+    """
+
+    def __init__(self, store, batch_size=DEFAULT_BATCH_SIZE, atomic=False, verbose=False,
+                 out=sys.stdout, err=sys.stderr):
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.atomic = atomic
+        self.verbose = verbose
+        self.out = out
+        self.err = err
+        self.applied = 0
+        self.failed = 0
+        self.batches = 0
+        self._products = []
+        self._product_lines = []
+        self._movements = []
+        self._movement_lines = []
+        self._book = None
+
+    def fail(self, line, message):
+        self.failed += 1
+        if line:
+            print(f"line {line}: {message}", file=self.err)
+        else:
+            print(message, file=self.err)
+
+    # Operations
+
+    def add_product(self, name, sku, category, price, quantity, line=0):
+        if price < 0 or quantity < 0:
+            self.fail(line, "Price and quantity must be positive!")
+            return
+        if self._movements:
+            self.flush()
+        self._products.append((name, sku.upper(), category, price, quantity))
+        self._product_lines.append(line)
+        if len(self._products) >= self.batch_size:
+            self.flush()
+
+    def move(self, trans_type, sku, quantity, notes="", line=0, unit_cost=None):
+        if self._products:
+            self.flush()
+        self._movements.append((sku.upper(), trans_type, quantity, notes, unit_cost))
+        self._movement_lines.append(line)
+        if len(self._movements) >= self.batch_size:
+            self.flush()
+
+    def order(self, kind, party, lines, line=0):
+        """Create and commit an order as its own all-or-nothing batch"""
+        self.flush()
+        if self._book is None:
+            self._book = OrderBook(self.store)
+        success, results, order = self._book.place(kind, party, lines)
+        if order is None:
+            self.fail(line, results[0][1])
+            return
+        if not success:
+            # Name the lines that failed, not the ones rolled back with them
+            errors = "; ".join(f"{sku}: {msg}" for (ok, msg), (sku, *_) in zip(results, lines)
+                               if not ok and msg != "Batch rejected, movement not applied")
+            self.fail(line, f"{order['number']} rejected ({errors or results[0][1]})")
+            return
+        self.applied += len(lines)
+        self.batches += 1
+        if self.verbose:
+            print(f"{order['number']} committed ({len(lines)} lines)", file=self.out)
+
+    def search(self, term):
+        self.flush()
+        for p in self.store.search_products(term):
+            print(f"{p['sku']}\t{p['name']}\t{p['category']}\t{p['price']:.2f}\t{p['quantity']}",
+                  file=self.out)
+
+    def report(self, as_of=None):
+        self.flush()
+        with self.store.snapshot() as snap:
+            products = snap.products()
+            transactions = snap.transaction_count()
+        low = [p for p in products if p['quantity'] < LOW_STOCK_THRESHOLD]
+        total_value = sum(p['price'] * p['quantity'] for p in products)
+        valuation = value_inventory(self.store, as_of)
+        print(f"Products:\t{len(products)}", file=self.out)
+        print(f"Total value:\t{total_value:.2f}", file=self.out)
+        if as_of:
+            print(f"Valued as of:\t{as_of}", file=self.out)
+        print(f"FIFO cost:\t{valuation.fifo}", file=self.out)
+        print(f"Average cost:\t{valuation.average}", file=self.out)
+        print(f"Low stock:\t{len(low)}", file=self.out)
+        print(f"Transactions:\t{transactions}", file=self.out)
+        for p in low:
+            print(f"LOW\t{p['sku']}\t{p['name']}\t{p['quantity']}", file=self.out)
+
+    # Batching
+
+    def flush(self):
+        """Write pending products or movements in one commit"""
+        if self._products:
+            self._flush_products()
+        elif self._movements:
+            self._flush_movements()
+
+    def _flush_products(self):
+        rows, lines = self._products, self._product_lines
+        self._products, self._product_lines = [], []
+        accepted = []
+        seen = set()
+        for row, line in zip(rows, lines):
+            sku = row[1]
+            if sku in seen or self.store.get_product(sku) is not None:
+                self.fail(line, f"SKU {sku} already exists!")
+            else:
+                seen.add(sku)
+                accepted.append(row)
+        if accepted:
+            self.applied += self.store.add_products(accepted)
+            self.batches += 1
+            if self.verbose:
+                for name, *_ in accepted:
+                    print(f"Product '{name}' added successfully!", file=self.out)
+
+    def _flush_movements(self):
+        movements, lines = self._movements, self._movement_lines
+        self._movements, self._movement_lines = [], []
+        results = self.store.apply_movements(movements, atomic=self.atomic)
+        committed = False
+        for (ok, message), line in zip(results, lines):
+            if ok:
+                self.applied += 1
+                committed = True
+                if self.verbose:
+                    print(message, file=self.out)
+            else:
+                self.fail(line, message)
+        self.batches += committed
+
+    # Command files
+
+    def run_line(self, text, line=0):
+        """Parse and apply one command line"""
+        text = text.strip()
+        if not text or text.startswith('#'):
+            return
+        try:
+            words = shlex.split(text) if ('"' in text or "'" in text) else text.split()
+        except ValueError as e:
+            self.fail(line, f"Invalid line: {e}")
+            return
+
+        command, args = words[0], words[1:]
+        try:
+            if command in ("add-stock", "remove-stock") and len(args) >= 2:
+                unit_cost = None
+                if command == "add-stock" and len(args) > 2 and args[2].startswith('@'):
+                    unit_cost = Decimal(args.pop(2)[1:])
+                self.move('IN' if command == "add-stock" else 'OUT',
+                          args[0], int(args[1]), " ".join(args[2:]), line, unit_cost)
+            elif command in ORDER_KINDS and len(args) >= 2:
+                self.order(ORDER_KINDS[command], args[0],
+                           [parse_order_line(spec) for spec in args[1:]], line)
+            elif command == "add-product" and len(args) == 5:
+                name, sku, category, price, quantity = args
+                self.add_product(name, sku, category, float(price), int(quantity), line)
+            elif command == "search" and args:
+                self.search(" ".join(args))
+            elif command == "report" and len(args) <= 1:
+                try:
+                    as_of = date.fromisoformat(args[0]) if args else None
+                except ValueError:
+                    self.fail(line, f"Invalid date: {args[0]}")
+                else:
+                    self.report(as_of)
+            elif command in COMMANDS:
+                self.fail(line, f"Wrong number of arguments for {command}")
+            else:
+                self.fail(line, f"Unknown command: {command}")
+        except (ValueError, InvalidOperation):
+            self.fail(line, "Invalid number!")
+
+    def run_file(self, f):
+        for line, text in enumerate(f, 1):
+            self.run_line(text, line)
+        self.flush()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="plumberry.py",
+        description="Plumberry inventory commands (run without arguments for the interactive menu)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    add = sub.add_parser("add-product", help="add a new product")
+    add.add_argument("name")
+    add.add_argument("sku")
+    add.add_argument("category")
+    add.add_argument("price", type=float)
+    add.add_argument("quantity", type=int)
+
+    for command, help_text in (("add-stock", "record incoming stock"),
+                               ("remove-stock", "record outgoing stock / sales")):
+        move = sub.add_parser(command, help=help_text)
+        move.add_argument("sku")
+        move.add_argument("quantity", type=int)
+        move.add_argument("--notes", default="")
+        if command == "add-stock":
+            move.add_argument("--cost", type=Decimal, help="unit cost (default: the product's price)")
+
+    for command, party in (("purchase-order", "supplier"), ("sales-order", "customer")):
+        order = sub.add_parser(command, help=f"create and commit a {command.replace('-', ' ')}")
+        order.add_argument(party)
+        order.add_argument("lines", nargs="+", type=parse_order_line, metavar="SKU:QTY[@COST]")
+
+    search = sub.add_parser("search", help="search products by name or SKU")
+    search.add_argument("term")
+
+    attributes = sub.add_parser("set-attributes", help="set product attributes (NAME= removes one)")
+    attributes.add_argument("sku")
+    attributes.add_argument("attributes", nargs="+", metavar="NAME=VALUE")
+
+    find = sub.add_parser("find", help="products matching field / attribute conditions")
+    find.add_argument("conditions", nargs="+", metavar="CONDITION",
+                      help="e.g. category=Beverages, price<6, quantity>=10, supplier=Acme")
+    find.add_argument("--explain", action="store_true", help="print the query plan first")
+
+    report = sub.add_parser("report", help="inventory totals, cost valuation and low-stock products")
+    report.add_argument("--as-of", type=date.fromisoformat, help="value the inventory as of a date (YYYY-MM-DD)")
+
+    replenish = sub.add_parser("replenish", help="propose purchase orders for SKUs below their reorder point")
+    replenish.add_argument("--suppliers", help="JSON rules per supplier: lead_days, review_days, "
+                                               "min_order_value, min_units")
+    replenish.add_argument("--window", type=int, default=28, help="days of demand history (default %(default)s)")
+    replenish.add_argument("--create", action="store_true", help="create open purchase orders for ready proposals")
+
+    reconcile = sub.add_parser("reconcile", help="compare a physical count file with stock levels")
+    reconcile.add_argument("file", help="CSV lines SKU,COUNTED[,COUNTED_AT] ('-' reads stdin)")
+    reconcile.add_argument("--apply", action="store_true", help="book the adjustments as one batch")
+    reconcile.add_argument("--show", type=int, default=20, help="variances to list (default %(default)s)")
+
+    reprice = sub.add_parser("reprice", help="change list prices now or from a time")
+    reprice.add_argument("file", help="CSV lines SKU,PRICE ('-' reads stdin)")
+    reprice.add_argument("--at", help="when the prices take effect (default now)")
+    reprice.add_argument("--reason", default="", help="noted in the price journal")
+
+    promote = sub.add_parser("promote", help="schedule a promotion on SKUs or a category")
+    promote.add_argument("name")
+    promote.add_argument("skus", nargs="*")
+    promote.add_argument("--category", help="every product in this category (and below)")
+    cut = promote.add_mutually_exclusive_group(required=True)
+    cut.add_argument("--percent", type=float, help="percentage off the list price")
+    cut.add_argument("--price", type=float, help="promotional price")
+    promote.add_argument("--start", required=True)
+    promote.add_argument("--end", required=True)
+
+    price = sub.add_parser("price", help="effective price of a SKU at a time")
+    price.add_argument("sku")
+    price.add_argument("--at", help="time (default now)")
+
+    audit = sub.add_parser("audit", help="check the audit journal (PLUMBERRY_AUDIT)")
+    audit.add_argument("action", choices=["verify", "prove", "root"])
+    audit.add_argument("id", nargs="?", type=int, help="transaction id to prove")
+    audit.add_argument("--from", dest="start", type=int, default=0,
+                       help="first checkpoint to rehash; earlier ones are trusted")
+
+    compact = sub.add_parser("compact", help="move old transactions to the retention tiers (PLUMBERRY_RETENTION)")
+    compact.add_argument("--hot-days", type=int, help="days of raw movements to keep in the store")
+
+    batch = sub.add_parser("batch", help="run a command file ('-' or no file reads stdin)")
+    batch.add_argument("files", nargs="*", default=["-"])
+    batch.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                       help="operations per commit (default %(default)s)")
+    batch.add_argument("--atomic", action="store_true",
+                       help="reject a whole batch if any movement in it fails")
+    batch.add_argument("--quiet", action="store_true", help="no summary line")
+    return parser
+
+
+def run_find(store, args):
+    from indexes import ProductIndex, parse_condition
+    try:
+        conditions = dict(parse_condition(text) for text in args.conditions)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    index = ProductIndex(store)
+    if args.explain:
+        print(f"Plan: {index.explain(**conditions)}", file=sys.stderr)
+    for p in index.query(**conditions):
+        extra = "\t".join(f"{name}={value}" for name, value in p.items()
+                          if name not in PRODUCT_FIELDS)
+        print(f"{p['sku']}\t{p['name']}\t{p['category']}\t{p['price']:.2f}\t{p['quantity']}"
+              + (f"\t{extra}" if extra else ""))
+    return 0
+
+
+def run_set_attributes(store, args):
+    attributes = {}
+    for text in args.attributes:
+        name, found, value = text.partition("=")
+        if not found or not name:
+            print(f"Expected NAME=VALUE, got '{text}'", file=sys.stderr)
+            return 2
+        attributes[name] = value or None
+    success, message = store.set_attributes(args.sku, attributes)
+    print(message, file=sys.stdout if success else sys.stderr)
+    return 0 if success else 1
+
+
+def run_replenish(store, args):
+    from replenishment import Planner, load_suppliers
+    suppliers = load_suppliers(args.suppliers) if args.suppliers else None
+    plan = Planner(store, suppliers, window_days=args.window).build()
+    if not plan:
+        print("Nothing to reorder")
+        return 0
+    for proposal in plan:
+        print(proposal)
+        for sku, quantity, unit_cost in proposal.lines:
+            print(f"  {sku}\t{quantity}\t@{unit_cost}")
+    if args.create:
+        failed = 0
+        for success, message, _ in plan.create_orders(OrderBook(store)):
+            print(message, file=sys.stdout if success else sys.stderr)
+            failed += not success
+        return 1 if failed else 0
+    return 0
+
+
+def run_reconcile(store, args):
+    from reconciliation import read_counts, reconcile
+    start = time.perf_counter()
+    try:
+        if args.file == "-":
+            sheet = read_counts(sys.stdin)
+        else:
+            with open(args.file, newline="", encoding="utf-8") as f:
+                sheet = read_counts(f)
+    except OSError as e:
+        print(f"Could not read {args.file}: {e.strerror}", file=sys.stderr)
+        return 1
+    except ValueError as e:
+        print(f"{args.file}: {e}", file=sys.stderr)
+        return 1
+    result = reconcile(store, sheet)
+    for number, message in sheet.errors:
+        print(f"line {number}: {message}", file=sys.stderr)
+    if result.unknown:
+        print(f"Unknown SKUs: {', '.join(result.unknown)}", file=sys.stderr)
+    for sku, expected, counted, variance in result.lines()[:args.show]:
+        print(f"{sku}\texpected {expected}\tcounted {counted}\t{variance:+d}")
+    summary = result.summary()
+    value = summary['value']
+    print(f"{summary['counted']} SKUs counted, {summary['adjustments']} with a variance: "
+          f"+{summary['units_in']} / -{summary['units_out']} units, "
+          f"{'-' if value < 0 else '+'}${abs(value):,.2f} "
+          f"({time.perf_counter() - start:.2f} s)")
+    if not args.apply:
+        return 0
+    results = result.apply(store)
+    failed = [message for success, message in results if not success]
+    for message in failed:
+        print(message, file=sys.stderr)
+    print(f"{len(results) - len(failed)} adjustments booked")
+    return 1 if failed else 0
+
+
+def _pricing(store):
+    from pricing import PricingEngine
+    # Without PLUMBERRY_PRICES, schedules last only for this command
+    return store.pricing or PricingEngine(store).attach()
+
+
+def _read_prices(lines):
+    """{sku: price} from SKU,PRICE rows; raises ValueError on a bad row"""
+    import csv
+    prices = {}
+    for number, row in enumerate(csv.reader(lines), 1):
+        if not row or row[0].startswith("#") or row[0].strip().lower() == "sku":
+            continue
+        try:
+            prices[row[0].strip()] = float(row[1])
+        except (IndexError, ValueError):
+            raise ValueError(f"line {number}: expected SKU,PRICE, got {','.join(row)!r}") from None
+    return prices
+
+
+def run_reprice(store, args):
+    try:
+        if args.file == "-":
+            prices = _read_prices(sys.stdin)
+        else:
+            with open(args.file, newline="", encoding="utf-8") as f:
+                prices = _read_prices(f)
+    except OSError as e:
+        print(f"Could not read {args.file}: {e.strerror}", file=sys.stderr)
+        return 1
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    engine = _pricing(store)
+    start = time.perf_counter()
+    success, message = engine.schedule(prices, args.at, args.reason)
+    print(message, file=sys.stdout if success else sys.stderr)
+    if not success:
+        return 1
+    changed = engine.run_due()
+    if changed:
+        print(f"{changed} prices changed in {time.perf_counter() - start:.2f} s")
+    return 0
+
+
+def run_promote(store, args):
+    skus = list(args.skus)
+    if args.category:
+        from categories import split_path
+        path = split_path(args.category)
+        skus += [product['sku'] for product in store.products()
+                 if split_path(product['category'])[:len(path)] == path]
+    if not skus:
+        print("promote needs SKUs or --category", file=sys.stderr)
+        return 2
+    engine = _pricing(store)
+    success, message = engine.promotion(args.name, skus, args.start, args.end,
+                                        args.percent, args.price)
+    print(message, file=sys.stdout if success else sys.stderr)
+    if success:
+        engine.run_due()
+    return 0 if success else 1
+
+
+def run_price(store, args):
+    engine = _pricing(store)
+    try:
+        price = engine.price_at(args.sku, args.at)
+    except ValueError:
+        print(f"Invalid time '{args.at}' (use YYYY-MM-DD HH:MM:SS)", file=sys.stderr)
+        return 2
+    if price is None:
+        print(f"Product with SKU {args.sku} not found!", file=sys.stderr)
+        return 1
+    print(f"{args.sku}\t{price:.2f}\tlist {engine.list_price_at(args.sku, args.at):.2f}")
+    return 0
+
+
+def run_audit(store, args):
+    if store.journal is None:
+        print("Auditing is off: set PLUMBERRY_AUDIT to the journal path", file=sys.stderr)
+        return 1
+    if args.action == "root":
+        print(store.journal.root())
+        return 0
+    if args.action == "verify":
+        success, message = store.journal.verify(store, args.start)
+        print(message, file=sys.stdout if success else sys.stderr)
+        return 0 if success else 1
+    if args.id is None:
+        print("audit prove needs a transaction id", file=sys.stderr)
+        return 2
+    proof = store.journal.prove(store, args.id)
+    if proof is None:
+        print(f"Transaction {args.id} is not in a sealed checkpoint yet", file=sys.stderr)
+        return 1
+    print(json.dumps(proof, indent=2))
+    return 0
+
+
+def run_compact(store, args):
+    if store.retention is None:
+        print("Retention is off: set PLUMBERRY_RETENTION to the history directory", file=sys.stderr)
+        return 1
+    if args.hot_days is not None:
+        store.retention.hot_days = args.hot_days
+    start = time.perf_counter()
+    moved = store.retention.compact()
+    stats = store.retention.stats()
+    print(f"{moved} transactions compacted in {time.perf_counter() - start:.2f} s; "
+          f"{stats['hot']} hot, {stats['warm_days']} days warm, "
+          f"{stats['cold']} cold in {stats['cold_segments']} segments ({stats['cold_bytes']} bytes)")
+    return 0
+
+
+def main(store, argv):
+    """Run one subcommand against the store; returns the exit status"""
+    args = build_parser().parse_args(argv)
+    if args.command == "audit":
+        return run_audit(store, args)
+    if args.command == "compact":
+        return run_compact(store, args)
+    if args.command == "replenish":
+        return run_replenish(store, args)
+    if args.command == "reconcile":
+        return run_reconcile(store, args)
+    if args.command == "find":
+        return run_find(store, args)
+    if args.command == "reprice":
+        return run_reprice(store, args)
+    if args.command == "promote":
+        return run_promote(store, args)
+    if args.command == "price":
+        return run_price(store, args)
+    if args.command == "set-attributes":
+        return run_set_attributes(store, args)
+
+    if args.command != "batch":
+        runner = BatchRunner(store, verbose=True)
+        if args.command == "add-product":
+            runner.add_product(args.name, args.sku, args.category, args.price, args.quantity)
+        elif args.command in ("add-stock", "remove-stock"):
+            runner.move('IN' if args.command == "add-stock" else 'OUT',
+                        args.sku, args.quantity, args.notes, unit_cost=getattr(args, "cost", None))
+        elif args.command in ORDER_KINDS:
+            party = args.supplier if args.command == "purchase-order" else args.customer
+            runner.order(ORDER_KINDS[args.command], party, args.lines)
+        elif args.command == "search":
+            runner.search(args.term)
+        else:
+            runner.report(args.as_of)
+        runner.flush()
+        return 1 if runner.failed else 0
+
+    runner = BatchRunner(store, args.batch_size, args.atomic)
+    start = time.perf_counter()
+    for path in args.files:
+        if path == "-":
+            runner.run_file(sys.stdin)
+        else:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    runner.run_file(f)
+            except OSError as e:
+                runner.fail(0, f"Could not read {path}: {e.strerror}")
+    if not args.quiet:
+        print(f"{runner.applied} applied, {runner.failed} failed, {runner.batches} commits "
+              f"in {time.perf_counter() - start:.2f} s", file=sys.stderr)
+    return 1 if runner.failed else 0
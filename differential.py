@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Differential Correctness Harness
+Checks the storage engines against the original dict-and-list model.
+
+demo.py keeps the first implementation of the inventory: a dict of
+products scanned on every call and a list of transactions. It is slow
+but obviously right, so it is the reference model. The harness
+generates random operation sequences (add_product, add_stock,
+remove_stock, including duplicate SKUs, unknown SKUs, over-removals and
+zero or negative quantities), runs each one against the reference and an
+engine, and compares:
+
+  - every return value (success flag and message)
+  - the products with their stock levels, after the sequence
+  - the transaction log (ids, SKUs, names, types, quantities, notes)
+
+and checks properties of the engine alone: stock is never negative and
+every level equals the product's initial quantity plus its INs minus its
+OUTs in the log.
+
+    python differential.py --ops 1000000 --backends memory sqlite kv
+    python differential.py --ops 200000 --batch 64     # movements through apply_movements
+
+Sequences are short (a few hundred operations over a few dozen SKUs),
+so the reference's scans stay cheap and a million operations take
+seconds per engine. A sequence's operations only depend on the seed and
+its number; a divergence is shrunk to a minimal failing sequence and
+printed as calls to replay. The exit status is 1 on any divergence.
+
+Other engines plug in through ENGINES: any factory of an object with
+the Store methods add_product, add_stock, remove_stock,
+apply_movements, products, transaction_count, get_transactions and
+close. The sharded ingestion engine (sharding.py) is one: its ids count
+per shard, so it is compared without ids, SKU by SKU (global_order =
+False on the engine).
+
+demo.py takes any quantity; the stores reject quantities below 1 with
+"Quantity must be positive!". That is the one deliberate difference, and
+the reference applies the same rule before calling demo.py.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import demo
+from storage import BACKENDS
+
+CATEGORIES = ["Preserves", "Beverages", "Dried Fruits", "Extracts"]
+NOTES = ["", "", "Restock", "Customer order #1001", "Store sale - weekend", "Échantillon ✓"]
+LOG_FIELDS = ('id', 'sku', 'product_name', 'type', 'quantity', 'notes')
+
+
+def engine_factory(backend):
+    """Factory of empty stores of one backend, each in its own directory"""
+    def create(directory):
+        return BACKENDS[backend](os.path.join(directory, f"differential.{backend}"))
+    return create
+
+
+class ShardedEngine:
+    """sharding.ShardedIngest behind the Store methods the harness calls"""
+
+    # Ids count per shard and the shard logs merge only in uid order
+    global_order = False
+
+    def __init__(self, shards=2):
+        from sharding import ShardedIngest
+        self.engine = ShardedIngest(shards)
+
+    def add_product(self, name, sku, category, price, quantity):
+        if self.engine.add_products([(name, sku, category, price, quantity)]):
+            return True, "Product added successfully!"
+        return False, "SKU already exists!"
+
+    def add_stock(self, sku, quantity, notes=""):
+        return self.engine.apply_movements([(sku, 'IN', quantity, notes)])[0]
+
+    def remove_stock(self, sku, quantity, notes=""):
+        return self.engine.apply_movements([(sku, 'OUT', quantity, notes)])[0]
+
+    def apply_movements(self, movements, atomic=False):
+        return self.engine.apply_movements(movements, atomic)
+
+    def products(self):
+        return self.engine.products()
+
+    def transaction_count(self):
+        return self.engine.transaction_count()
+
+    def get_transactions(self, first_id, last_id):
+        return self.engine.transactions()
+
+    def close(self):
+        self.engine.close()
+
+
+ENGINES = {name: engine_factory(name) for name in BACKENDS}
+ENGINES['sharded'] = lambda directory: ShardedEngine()
+
+
+class Reference:
+    """demo.py's module-level dicts and lists, emptied, behind Store method names
+
+    demo.py keeps its state in globals, so only one Reference is in use
+    at a time.
+    """
+
+    def __init__(self):
+        demo.products.clear()
+        demo.transactions.clear()
+        demo.product_id = 1
+        demo.transaction_id = 1
+
+    add_product = staticmethod(demo.add_product)
+
+    @staticmethod
+    def known(sku):
+        return any(product['sku'] == sku for product in demo.products.values())
+
+    @staticmethod
+    def add_stock(sku, quantity, notes=""):
+        if quantity <= 0 and Reference.known(sku):
+            return False, "Quantity must be positive!"
+        return demo.add_stock(sku, quantity, notes)
+
+    @staticmethod
+    def remove_stock(sku, quantity, notes=""):
+        if quantity <= 0 and Reference.known(sku):
+            return False, "Quantity must be positive!"
+        return demo.remove_stock(sku, quantity, notes)
+
+    def products(self):
+        return list(demo.products.values())
+
+    def log(self):
+        return demo.transactions
+
+
+def canonical(message):
+    """A return message without the wording differences between implementations
+
+    demo.py marks successes with a check mark and names the product it
+    added; the store says "Product added successfully!".
+    """
+    message = message.removeprefix("✓ ")
+    if message.startswith("Added: ") and message.endswith(")"):
+        return "Product added successfully!"
+    return message
+
+
+def generate(rng, length, max_skus=40):
+    """A random operation sequence
+
+    Operations are ('product', name, sku, category, price, quantity) or
+    (type, sku, quantity, notes) with type 'IN' or 'OUT'. SKUs come from
+    a small pool, so products get added twice and movements name SKUs
+    that do not exist yet; removals often ask for more than is there,
+    and some movements have a zero or negative quantity.
+    """
+    pool = [f"SKU{number:03d}" for number in range(rng.randint(1, max_skus))]
+    operations = []
+    for _ in range(length):
+        sku = rng.choice(pool)
+        roll = rng.random()
+        if roll < 0.1:
+            operations.append(('product', f"Plumberry {rng.choice(('Jam', 'Tea', 'Juice'))}",
+                               sku, rng.choice(CATEGORIES), round(rng.uniform(0.5, 60.0), 2),
+                               rng.randint(0, 100)))
+        elif roll < 0.13:
+            operations.append((rng.choice(('IN', 'OUT')), sku, rng.randint(-5, 0),
+                               rng.choice(NOTES)))
+        elif roll < 0.5:
+            operations.append(('IN', sku, rng.randint(1, 60), rng.choice(NOTES)))
+        else:
+            # Up to a large removal, which often exceeds the stock
+            operations.append(('OUT', sku, rng.choice((rng.randint(1, 20), rng.randint(1, 200))),
+                               rng.choice(NOTES)))
+    return operations
+
+
+def _movement_args(operations):
+    return [(sku, kind, quantity, notes) for kind, sku, quantity, notes in operations]
+
+
+class Divergence(Exception):
+    """An engine disagreed with the reference (or broke a property)"""
+
+    def __init__(self, message, operations):
+        super().__init__(message)
+        self.operations = operations
+        # Number of the generated sequence, set by check()
+        self.sequence = None
+
+
+def run_sequence(factory, operations, batch=0):
+    """Run operations on the reference and a fresh engine; raise Divergence on a difference"""
+    reference = Reference()
+    expected = [(ok, canonical(message))
+                for ok, message in _call_each(reference, operations)]
+    directory = tempfile.mkdtemp(prefix="plumberry-differential-")
+    try:
+        engine = factory(directory)
+        try:
+            actual = [(ok, canonical(message))
+                      for ok, message in _engine_results(engine, operations, batch)]
+            for position, (want, got) in enumerate(zip(expected, actual)):
+                if want != got:
+                    raise Divergence(f"operation {position} {operations[position]!r}: "
+                                     f"expected {want!r}, got {got!r}", operations)
+            if len(expected) != len(actual):
+                raise Divergence(f"{len(actual)} results for {len(expected)} operations",
+                                 operations)
+            _compare_state(reference, engine, operations)
+        finally:
+            engine.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _call_each(reference, operations):
+    results = []
+    for operation in operations:
+        if operation[0] == 'product':
+            results.append(reference.add_product(*operation[1:]))
+        elif operation[0] == 'IN':
+            results.append(reference.add_stock(*operation[1:]))
+        else:
+            results.append(reference.remove_stock(*operation[1:]))
+    return results
+
+
+def _engine_results(engine, operations, batch):
+    if not batch:
+        return _call_each(engine, operations)
+    results = []
+    start = 0
+    for position, operation in enumerate(operations + [None]):
+        # Movements between two product additions go through apply_movements
+        if operation is None or operation[0] == 'product':
+            movements = _movement_args(operations[start:position])
+            for first in range(0, len(movements), batch):
+                results.extend(engine.apply_movements(movements[first:first + batch]))
+            if operation is not None:
+                results.append(engine.add_product(*operation[1:]))
+            start = position + 1
+    return results
+
+
+def _compare_state(reference, engine, operations):
+    if not getattr(engine, 'global_order', True):
+        return _compare_by_sku(reference, engine, operations)
+    fields = ('id', 'sku', 'name', 'category', 'price', 'quantity')
+    want = [tuple(product[field] for field in fields) for product in reference.products()]
+    got = [tuple(product[field] for field in fields) for product in engine.products()]
+    if want != got:
+        difference = next((pair for pair in zip(want, got) if pair[0] != pair[1]), (want, got))
+        raise Divergence(f"products differ: expected {difference[0]!r}, got {difference[1]!r}",
+                         operations)
+
+    want = [tuple(record[field] for field in LOG_FIELDS) for record in reference.log()]
+    count = engine.transaction_count()
+    got = [tuple(record[field] for field in LOG_FIELDS)
+           for record in engine.get_transactions(1, count)] if count else []
+    if want != got:
+        position = next((i for i, pair in enumerate(zip(want, got)) if pair[0] != pair[1]),
+                        min(len(want), len(got)))
+        raise Divergence(f"transaction log differs at entry {position}: expected "
+                         f"{want[position:position + 1]!r}, got {got[position:position + 1]!r}",
+                         operations)
+
+    _check_levels(engine, operations, got)
+
+
+def _compare_by_sku(reference, engine, operations):
+    """_compare_state for engines without global ids: products by SKU, logs per SKU"""
+    fields = ('sku', 'name', 'category', 'price', 'quantity')
+    want = sorted(tuple(product[field] for field in fields) for product in reference.products())
+    got = sorted(tuple(product[field] for field in fields) for product in engine.products())
+    if want != got:
+        difference = next((pair for pair in zip(want, got) if pair[0] != pair[1]), (want, got))
+        raise Divergence(f"products differ: expected {difference[0]!r}, got {difference[1]!r}",
+                         operations)
+
+    def by_sku(records):
+        logs = {}
+        for record in records:
+            logs.setdefault(record['sku'], []).append(
+                tuple(record[field] for field in LOG_FIELDS[1:]))
+        return logs
+
+    records = engine.get_transactions(1, engine.transaction_count())
+    want, got = by_sku(reference.log()), by_sku(records)
+    for sku in sorted(set(want) | set(got)):
+        if want.get(sku) != got.get(sku):
+            raise Divergence(f"transaction log of {sku} differs: expected {want.get(sku)!r}, "
+                             f"got {got.get(sku)!r}", operations)
+    _check_levels(engine, operations, [(None, *record) for records in got.values()
+                                       for record in records])
+
+
+def _check_levels(engine, operations, log):
+    """Properties of the engine on its own: no negative stock, levels match the log"""
+    levels = {}
+    for operation in operations:
+        if operation[0] == 'product':
+            levels.setdefault(operation[2], operation[5])
+    for _, sku, _, kind, quantity, _ in log:
+        levels[sku] = levels.get(sku, 0) + (quantity if kind == 'IN' else -quantity)
+    for product in engine.products():
+        if product['quantity'] < 0:
+            raise Divergence(f"negative stock for {product['sku']}: {product['quantity']}",
+                             operations)
+        if levels.get(product['sku']) != product['quantity']:
+            raise Divergence(f"{product['sku']} holds {product['quantity']} units but its log "
+                             f"adds up to {levels.get(product['sku'])}", operations)
+
+
+def shrink(factory, operations, batch=0):
+    """A sub-sequence that still diverges, from which no single operation can be dropped
+
+    Delta debugging: drop ever smaller chunks while the divergence stays.
+    """
+    def fails(candidate):
+        try:
+            run_sequence(factory, candidate, batch)
+        except Divergence:
+            return True
+        return False
+
+    chunk = len(operations) // 2
+    while chunk >= 1:
+        start = 0
+        while start < len(operations):
+            candidate = operations[:start] + operations[start + chunk:]
+            if candidate and fails(candidate):
+                operations = candidate
+            else:
+                start += chunk
+        chunk //= 2
+    return operations
+
+
+def check(factory, total_ops, seed=1, length=500, batch=0):
+    """Run random sequences until total_ops operations; None or the first Divergence (shrunk)"""
+    done = 0
+    number = 0
+    while done < total_ops:
+        rng = random.Random(seed * 1000003 + number)
+        operations = generate(rng, min(length, total_ops - done))
+        try:
+            run_sequence(factory, operations, batch)
+        except Divergence as divergence:
+            minimal = shrink(factory, operations, batch)
+            try:
+                run_sequence(factory, minimal, batch)
+            except Divergence as shrunk:
+                shrunk.sequence = number
+                return shrunk
+            divergence.sequence = number
+            return divergence
+        done += len(operations)
+        number += 1
+    return None
+
+
+def replay_script(operations):
+    """The operations as store calls, for a bug report"""
+    lines = []
+    for operation in operations:
+        if operation[0] == 'product':
+            lines.append(f"store.add_product{operation[1:]!r}")
+        elif operation[0] == 'IN':
+            lines.append(f"store.add_stock{operation[1:]!r}")
+        else:
+            lines.append(f"store.remove_stock{operation[1:]!r}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare storage engines against demo.py")
+    parser.add_argument("--ops", type=int, default=1000000, help="operations per engine")
+    parser.add_argument("--backends", nargs="+", default=["memory"], choices=list(ENGINES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--length", type=int, default=500, help="operations per sequence")
+    parser.add_argument("--batch", type=int, default=0,
+                        help="send movements through apply_movements in batches of this size")
+    args = parser.parse_args(argv)
+
+    status = 0
+    for backend in args.backends:
+        started = time.perf_counter()
+        divergence = check(ENGINES[backend], args.ops, args.seed, args.length, args.batch)
+        seconds = time.perf_counter() - started
+        if divergence is None:
+            print(f"{backend}: {args.ops:,} operations match the reference "
+                  f"({args.ops / seconds:,.0f} ops/sec)")
+            continue
+        status = 1
+        print(f"{backend}: DIVERGES in sequence {divergence.sequence} (seed {args.seed}): "
+              f"{divergence}")
+        print(f"Minimal sequence ({len(divergence.operations)} operations):")
+        print(replay_script(divergence.operations))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
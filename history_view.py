@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Transaction History Window
+A virtualized, append-only transaction list for the Tkinter front end.
+
+The history pane used to be a Text widget refilled with the last 20
+transactions after every click. HistoryList shows the whole log, newest
+first, at the cost of the rows on screen:
+
+  - only `rows` Treeview items exist; scrolling re-fills their values
+    from a HistoryModel, which reads the log a page at a time (an id
+    range, or a keyset page of a filtered query) and keeps the last
+    `max_pages` pages
+  - committed movements arrive through Store.subscribe on a queue that
+    the widget polls with `after`; they are added on top of the rows
+    already loaded (a delta), which never move or reload. If the view is
+    scrolled down it stays on the same rows. Transactions another
+    process writes to a SQLite file are caught up through the change feed.
+  - the filter box takes SKUs, IN / OUT and free text, e.g.
+    "PLM001 OUT weekend". SKU and type go to the store's transaction
+    indexes (query_transactions / count_transactions), so a filtered
+    view of a busy SKU opens as fast as the unfiltered one; free text is
+    matched within notes and its count grows as pages load.
+
+    history = HistoryList(frame, store, rows=12)
+    history.pack(fill='both', expand=True)
+"""
+
+import queue
+import tkinter as tk
+from bisect import bisect_left
+from collections import OrderedDict
+from operator import itemgetter
+from tkinter import ttk
+
+from storage import TRANSACTIONS, TransactionFilter
+
+PAGE_SIZE = 200
+MAX_PAGES = 50
+POLL_MS = 100
+# Commits waiting for the window; beyond this it catches up by reading the log
+MAX_QUEUED = 10000
+
+COLUMNS = (("id", "ID", 70), ("type", "Type", 50), ("product", "Product", 180),
+           ("sku", "SKU", 80), ("quantity", "Qty", 60), ("timestamp", "Time", 140),
+           ("notes", "Notes", 200))
+
+_id = itemgetter('id')
+
+
+def parse_filter(text, store):
+    """TransactionFilter of a filter box: SKUs, IN / OUT and words of the notes"""
+    trans_type = sku = None
+    words = []
+    for token in text.split():
+        if token.upper() in ("IN", "OUT") and trans_type is None:
+            trans_type = token.upper()
+        elif sku is None and store.get_product(token) is not None:
+            sku = token
+        elif sku is None and store.get_product(token.upper()) is not None:
+            sku = token.upper()
+        else:
+            words.append(token)
+    return TransactionFilter(trans_type, sku, text=" ".join(words) or None)
+
+
+class HistoryModel:
+    """Transactions by position, newest first, read lazily a page at a time
+
+    Rows below the newest transaction at the last set_filter() (the base)
+    are read from the store; later ones are kept in memory as they arrive
+    (the head). Positions count head rows first.
+    """
+
+    def __init__(self, store, page_size=PAGE_SIZE, max_pages=MAX_PAGES):
+        self.store = store
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.text = ""
+        self._inbox = queue.Queue(MAX_QUEUED)
+        self._overflow = False
+        self._closed = False
+        store.subscribe(self._on_commit)
+        self.set_filter("")
+
+    def _on_commit(self, records):
+        # Writer thread: hand the records over, never block
+        if self._closed:
+            return
+        try:
+            self._inbox.put_nowait(records)
+        except queue.Full:
+            self._overflow = True
+
+    def close(self):
+        """Stop receiving commits"""
+        self._closed = True
+        self.store.unsubscribe(self._on_commit)
+
+    def set_filter(self, text):
+        """Show the transactions matching a filter box text; positions restart at 0"""
+        store = self.store
+        self.text = text
+        self.where = parse_filter(text, store)
+        self._filtered = any((self.where.trans_type, self.where.sku, self.where.text))
+        self._version = store.changes(TRANSACTIONS)
+        # Newest id of the base, and the newest id seen since
+        self._top = self._latest = store.transaction_count()
+        self._head = []
+        self._pages = OrderedDict()
+        # Filtered views: before_id of each page reached, in order
+        self._cursors = [self._top + 1]
+        self._ended = False
+        if not self._filtered:
+            lowest = 1 if store.retention is not None else store.first_transaction_id()
+            self._total = max(0, self._top - lowest + 1)
+        elif self.where.text is None:
+            # Answered by the SKU / type index
+            self._total = self._count()
+        else:
+            self._total = None
+
+    def _count(self):
+        where = self.where
+        # Rows committed after _top are counted in the head
+        count = self.store.count_transactions(where.trans_type, where.sku)
+        newer = self.store.transaction_count() - self._top
+        if newer > 0:
+            count -= sum(1 for record in self.store.get_transactions(self._top + 1,
+                                                                     self._top + newer)
+                         if where.matches(record))
+        return count
+
+    def __len__(self):
+        """Rows known so far (for a free-text filter, one page past those loaded)"""
+        if self._total is not None:
+            return len(self._head) + self._total
+        loaded = (len(self._cursors) - 1) * self.page_size
+        return len(self._head) + loaded + self.page_size
+
+    @property
+    def exact(self):
+        """Whether len() is the number of matching rows, not an estimate"""
+        return self._total is not None
+
+    def row(self, position):
+        """Transaction at a position (0 = newest), or None past the end"""
+        head = self._head
+        if position < len(head):
+            return head[-1 - position]
+        page, offset = divmod(position - len(head), self.page_size)
+        rows = self._page(page)
+        return rows[offset] if rows is not None and offset < len(rows) else None
+
+    def _page(self, page):
+        rows = self._pages.get(page)
+        if rows is not None:
+            self._pages.move_to_end(page)
+            return rows
+        if not self._filtered:
+            last = self._top - page * self.page_size
+            first = max(last - self.page_size + 1, self._top - self._total + 1)
+            if last < first:
+                return None
+            rows = self.store.get_transactions(first, last)[::-1]
+        else:
+            # Keyset pages are reached in order from the last cursor known
+            while len(self._cursors) <= page:
+                if self._ended:
+                    return None
+                self._load(len(self._cursors) - 1)
+            rows = self._pages.get(page)
+            if rows is None:
+                rows = self._load(page)
+            return rows
+        self._keep(page, rows)
+        return rows
+
+    def _load(self, page):
+        """Read one filtered page, noting where the next one starts"""
+        where = self.where
+        rows = self.store.query_transactions(where.trans_type, where.sku, text=where.text,
+                                             before_id=self._cursors[page], limit=self.page_size)
+        if page == len(self._cursors) - 1:
+            if len(rows) == self.page_size:
+                self._cursors.append(rows[-1]['id'])
+            else:
+                self._ended = True
+                if self._total is None:
+                    # The end of a free-text match: its count is now known
+                    self._total = page * self.page_size + len(rows)
+        self._keep(page, rows)
+        return rows
+
+    def _keep(self, page, rows):
+        self._pages[page] = rows
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+
+    def poll(self):
+        """Take in the commits since the last poll; returns how many rows were added"""
+        records = []
+        while True:
+            try:
+                records.extend(self._inbox.get_nowait())
+            except queue.Empty:
+                break
+        store = self.store
+        version = store.changes(TRANSACTIONS)
+        if self._overflow or version != self._version:
+            self._version = version
+            self._overflow = False
+            last = store.transaction_count()
+            # Commits not (yet) received: another process, or a full queue
+            if last > max([self._latest] + list(map(_id, records))):
+                records.extend(store.get_transactions(self._latest + 1, last))
+        added = 0
+        head = self._head
+        for record in records:
+            if record['id'] <= self._top:
+                continue
+            self._latest = max(self._latest, record['id'])
+            if self._filtered and not self.where.matches(record):
+                continue
+            # Writers may deliver out of id order, and a caught-up record twice
+            index = bisect_left(head, record['id'], key=_id)
+            if index < len(head) and head[index]['id'] == record['id']:
+                continue
+            head.insert(index, record)
+            added += 1
+        return added
+
+
+class HistoryList(ttk.Frame):
+    """Virtualized transaction history with a filter box"""
+
+    def __init__(self, master, store, rows=12, poll_ms=POLL_MS, **kwargs):
+        super().__init__(master, **kwargs)
+        self.model = HistoryModel(store)
+        self.rows = rows
+        self.poll_ms = poll_ms
+        self.first = 0
+        self._filter_job = None
+
+        bar = ttk.Frame(self)
+        bar.pack(side='top', fill='x', pady=(0, 5))
+        ttk.Label(bar, text="Filter (SKU, IN/OUT, notes):").pack(side='left')
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", self._filter_changed)
+        ttk.Entry(bar, textvariable=self.filter_var, width=30).pack(side='left', padx=5)
+        self.count_label = ttk.Label(bar, text="")
+        self.count_label.pack(side='right')
+
+        body = ttk.Frame(self)
+        body.pack(side='top', fill='both', expand=True)
+        self.tree = ttk.Treeview(body, columns=[name for name, _, _ in COLUMNS],
+                                 show='headings', height=rows, selectmode='browse')
+        for name, heading, width in COLUMNS:
+            self.tree.heading(name, text=heading)
+            self.tree.column(name, width=width, stretch=name in ("product", "notes"))
+        self._items = [self.tree.insert("", "end") for _ in range(rows)]
+        self.scrollbar = ttk.Scrollbar(body, orient='vertical', command=self._scroll)
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.scrollbar.pack(side='right', fill='y')
+
+        self.tree.bind("<MouseWheel>", self._wheel)
+        self.tree.bind("<Button-4>", lambda event: self._scroll("scroll", -3, "units"))
+        self.tree.bind("<Button-5>", lambda event: self._scroll("scroll", 3, "units"))
+        for key, args in (("<Up>", (-1, "units")), ("<Down>", (1, "units")),
+                          ("<Prior>", (-1, "pages")), ("<Next>", (1, "pages"))):
+            self.tree.bind(key, lambda event, args=args: self._scroll("scroll", *args) or "break")
+        self.tree.bind("<Home>", lambda event: self.scroll_to_top() or "break")
+
+        self.render()
+        self._poll_job = self.after(self.poll_ms, self._poll)
+
+    # Scrolling
+
+    def _scroll(self, action, amount, unit=None):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'/'pages')"""
+        if action == "moveto":
+            self.first = int(float(amount) * len(self.model))
+        else:
+            step = self.rows if unit == "pages" else 1
+            self.first += int(amount) * step
+        self.render()
+
+    def _wheel(self, event):
+        self._scroll("scroll", -3 if event.delta > 0 else 3, "units")
+        return "break"
+
+    def scroll_to_top(self):
+        """Show the newest transactions"""
+        self.first = 0
+        self.render()
+
+    def render(self):
+        """Fill the visible rows from the model"""
+        model = self.model
+        self.first = max(0, min(self.first, len(model) - self.rows))
+        for offset, item in enumerate(self._items):
+            record = model.row(self.first + offset)
+            if record is None:
+                self.tree.item(item, values=())
+                continue
+            symbol = "➕" if record['type'] == 'IN' else "➖"
+            self.tree.item(item, values=(record['id'], f"{symbol} {record['type']}",
+                                         record['product_name'], record['sku'],
+                                         record['quantity'], record['timestamp'],
+                                         record['notes']))
+        # A free-text estimate may have shrunk once its last page loaded
+        self.first = max(0, min(self.first, len(model) - self.rows))
+        total = len(model)
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + self.rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self.count_label.configure(
+            text=f"{total:,} transactions" if model.exact else f"{total - model.page_size:,}+ matches")
+
+    # Deltas and filtering
+
+    def _poll(self):
+        added = self.model.poll()
+        if added:
+            # Scrolled down: keep the same rows in view
+            if self.first:
+                self.first += added
+            self.render()
+        self._poll_job = self.after(self.poll_ms, self._poll)
+
+    def _filter_changed(self, *args):
+        # Wait for a pause in typing
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(250, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_job = None
+        self.model.set_filter(self.filter_var.get())
+        self.first = 0
+        self.render()
+
+    def destroy(self):
+        self.after_cancel(self._poll_job)
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+        self.model.close()
+        super().destroy()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Unique IDs
+Time-ordered 64-bit IDs that stay unique across processes.
+
+Store ids number the transactions of one database from 1. When the CLI,
+Tkinter and Streamlit run against separate stores their logs reuse the
+same ids, so every transaction also gets a `uid` laid out like a
+Snowflake ID:
+
+    | 41 bits: milliseconds since 2024-01-01 | 10 bits: node | 12 bits: sequence |
+
+IDs sort by creation time, so logs from several processes (each sorted
+by uid) combine with a k-way merge (merge_logs) instead of a re-sort.
+
+A process is one node; its threads share the node's clock and
+sequence under a lock. Without PLUMBERRY_NODE a process claims a free
+node on its host by locking a file in NODE_DIR (released when the
+process exits), so processes on one host never share a node. Processes
+on several hosts writing to one store must each be given a distinct
+PLUMBERRY_NODE: claims are per host, and without fcntl (Windows) the
+node falls back to a hash of host and pid, which collides with
+probability about n^2/2048 for n processes. Within a node IDs strictly increase;
+when the clock stalls or steps back, or 4096 IDs are used up within one
+millisecond, the node runs its clock on ahead until the real one catches
+up. A block of IDs takes the lock once, so a batch of movements costs
+one acquisition.
+"""
+
+import heapq
+import os
+import socket
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+TIME_SHIFT = NODE_BITS + SEQUENCE_BITS
+
+# Crockford base32: sortable, no ambiguous letters
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+# Lock files of the nodes claimed on this host
+NODE_DIR = os.path.join(tempfile.gettempdir(), "plumberry-nodes")
+
+# Open lock files of this process's claims
+_claims = []
+
+
+def default_node():
+    """Node from PLUMBERRY_NODE, else one claimed on this host"""
+    configured = os.environ.get("PLUMBERRY_NODE")
+    if configured:
+        node = int(configured)
+        if not 0 <= node <= MAX_NODE:
+            raise ValueError(f"PLUMBERRY_NODE must be between 0 and {MAX_NODE}")
+        return node
+    return claim_node()
+
+
+def claim_node(directory=NODE_DIR):
+    """Lock a node no other process on this host holds, starting from a hash of host and pid
+
+    The lock is held until the process exits (the file stays open).
+    """
+    start = zlib.crc32(f"{socket.gethostname()}:{os.getpid()}".encode()) & MAX_NODE
+    if fcntl is None:
+        return start
+    os.makedirs(directory, exist_ok=True)
+    for offset in range(MAX_NODE + 1):
+        node = (start + offset) & MAX_NODE
+        f = open(os.path.join(directory, f"{node:04d}.lock"), "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        _claims.append(f)
+        return node
+    raise RuntimeError(f"All {MAX_NODE + 1} nodes are claimed on this host")
+
+
+class IdGenerator:
+    """Monotonic, time-ordered unique IDs of one node, shared by its threads"""
+
+    def __init__(self, node=None):
+        self.node = default_node() if node is None else node
+        self._prefix = self.node << SEQUENCE_BITS
+        self._last_ms = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        return self.block(1)[0]
+
+    __call__ = next_id
+
+    def block(self, count):
+        """`count` consecutive IDs (cheaper than count calls to next_id)"""
+        prefix = self._prefix
+        ids = []
+        with self._lock:
+            last_ms, sequence = self._last_ms, self._sequence
+            now = time.time_ns() // 1000000 - EPOCH_MS
+            if now > last_ms:
+                last_ms, sequence = now, 0
+            while count:
+                if sequence > MAX_SEQUENCE:
+                    last_ms, sequence = last_ms + 1, 0
+                take = min(count, MAX_SEQUENCE + 1 - sequence)
+                base = (last_ms << TIME_SHIFT) | prefix
+                ids.extend(range(base + sequence, base + sequence + take))
+                sequence += take
+                count -= take
+            self._last_ms, self._sequence = last_ms, sequence
+        return ids
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def generator():
+    """The process-wide generator (created on first use)"""
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = IdGenerator()
+    return _generator
+
+
+def _forget_generator():
+    # A forked child is a new process: it claims a node of its own
+    global _generator, _generator_lock
+    _generator = None
+    _generator_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_generator)
+
+
+def decode(uid):
+    """(UTC datetime, node, sequence) of an ID"""
+    ms = (uid >> TIME_SHIFT) + EPOCH_MS
+    return (datetime.fromtimestamp(ms / 1000, timezone.utc),
+            (uid >> SEQUENCE_BITS) & MAX_NODE, uid & MAX_SEQUENCE)
+
+
+def to_string(uid):
+    """13-character Crockford base32 form; sorts like the number"""
+    chars = []
+    for _ in range(13):
+        chars.append(ALPHABET[uid & 31])
+        uid >>= 5
+    return "".join(reversed(chars))
+
+
+def from_string(text):
+    uid = 0
+    for char in text.strip().upper():
+        uid = uid * 32 + ALPHABET.index(char)
+    return uid
+
+
+def merge_logs(*logs):
+    """Transaction records of several logs, each sorted by uid, in uid order"""
+    return heapq.merge(*logs, key=lambda record: record['uid'])
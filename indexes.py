@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Product Indexes
+Secondary indexes over product fields and attributes, with a small planner.
+
+Products have fixed fields (name, sku, category, price, quantity) and
+user-defined attributes (Store.set_attributes: supplier, flavor, pack
+size, shelf zone, ...). A ProductIndex declares which of them to index:
+
+  - hash indexes answer equality (and `in`) lookups
+  - sorted indexes answer ranges on numeric values (price, quantity)
+
+    index = ProductIndex(store, hashed=("category", "supplier"),
+                         ordered=("price", "quantity"))
+    index.query(category="Beverages", price__lt=6, quantity__lt=50)
+
+Conditions are field=value or field__op=value with op one of eq, lt, le,
+gt, ge, in. The planner estimates how many products each indexed
+condition matches (a set size, or a count between two bisections) and
+reads candidates from the most selective index only; the other
+conditions are checked on those candidates. A query then costs about
+O(smallest match) rather than O(catalogue). With no usable index it
+falls back to a scan; explain() shows the plan.
+
+The index follows its store: product or attribute changes (the PRODUCTS
+section of the change feed) rebuild it, and stock movements, received
+through Store.subscribe, re-read just the products they touched.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter
+
+from storage import PRODUCTS
+
+HASHED = ("category", "supplier", "flavor", "shelf_zone")
+ORDERED = ("price", "quantity", "pack_size")
+
+OPERATORS = ("eq", "lt", "le", "gt", "ge", "in")
+
+_key = itemgetter(0)
+
+
+def normalize(value):
+    """Comparable form of a field value: numbers (and numeric strings) as float"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+def parse_condition(text):
+    """('price__lt', '6') from "price<6"; also =, <=, >, >= (for the CLI and UI)"""
+    for symbol, op in (("<=", "le"), (">=", "ge"), ("<", "lt"), (">", "gt"), ("=", "eq")):
+        field, found, value = text.partition(symbol)
+        if found and field.strip():
+            return f"{field.strip()}__{op}", value.strip()
+    raise ValueError(f"Cannot parse condition '{text}' (expected e.g. price<6 or supplier=Acme)")
+
+
+class HashIndex:
+    """Normalized value -> set of SKUs"""
+
+    kind = "hash"
+
+    def __init__(self, field):
+        self.field = field
+        self.entries = {}
+
+    def add(self, value, sku):
+        self.entries.setdefault(normalize(value), set()).add(sku)
+
+    def remove(self, value, sku):
+        key = normalize(value)
+        skus = self.entries.get(key)
+        if skus is not None:
+            skus.discard(sku)
+            if not skus:
+                del self.entries[key]
+
+    def estimate(self, op, value):
+        if op == "eq":
+            return len(self.entries.get(normalize(value), ()))
+        if op == "in":
+            return sum(len(self.entries.get(normalize(item), ())) for item in value)
+        return None
+
+    def lookup(self, op, value):
+        if op == "eq":
+            return self.entries.get(normalize(value), ())
+        return set().union(*(self.entries.get(normalize(item), ()) for item in value))
+
+
+class SortedIndex:
+    """(number, sku) pairs in blocks of sorted lists
+
+    Splitting the order into blocks of up to 2 * LOAD pairs keeps an
+    insert or remove to a bisection plus a short list shift, however big
+    the catalogue; a range is found with two bisections and read in
+    order.
+    """
+
+    kind = "sorted"
+    LOAD = 500
+
+    def __init__(self, field):
+        self.field = field
+        self._blocks = []
+        self._maxes = []
+
+    def build(self, pairs):
+        pairs = sorted(pairs)
+        self._blocks = [pairs[i:i + self.LOAD] for i in range(0, len(pairs), self.LOAD)]
+        self._maxes = [block[-1] for block in self._blocks]
+
+    def add(self, value, sku):
+        key = _number(value)
+        if key is None:
+            return
+        pair = (key, sku)
+        if not self._blocks:
+            self._blocks.append([pair])
+            self._maxes.append(pair)
+            return
+        index = min(bisect_left(self._maxes, pair), len(self._blocks) - 1)
+        block = self._blocks[index]
+        insort(block, pair)
+        self._maxes[index] = block[-1]
+        if len(block) > 2 * self.LOAD:
+            self._blocks[index:index + 1] = [block[:self.LOAD], block[self.LOAD:]]
+            self._maxes[index:index + 1] = [block[self.LOAD - 1], block[-1]]
+
+    def remove(self, value, sku):
+        key = _number(value)
+        if key is None:
+            return
+        pair = (key, sku)
+        index = bisect_left(self._maxes, pair)
+        if index == len(self._blocks):
+            return
+        block = self._blocks[index]
+        position = bisect_left(block, pair)
+        if position < len(block) and block[position] == pair:
+            del block[position]
+            if block:
+                self._maxes[index] = block[-1]
+            else:
+                del self._blocks[index]
+                del self._maxes[index]
+
+    def _bound(self, value, right):
+        """(block, position) of the first pair with key > value (right) or >= value"""
+        search = bisect_right if right else bisect_left
+        index = search(self._maxes, value, key=_key)
+        if index == len(self._blocks):
+            return index, 0
+        return index, search(self._blocks[index], value, key=_key)
+
+    def _span(self, op, value):
+        key = _number(value)
+        if key is None:
+            return None
+        start, stop = (0, 0), (len(self._blocks), 0)
+        if op in ("eq", "gt", "ge"):
+            start = self._bound(key, op == "gt")
+        if op in ("eq", "lt", "le"):
+            stop = self._bound(key, op != "lt")
+        return start, stop
+
+    def estimate(self, op, value):
+        span = self._span(op, value) if op != "in" else None
+        if span is None:
+            return None
+        (first, offset), (last, end) = span
+        if first > last or first == last and offset >= end:
+            return 0
+        if first == last:
+            return end - offset
+        return (len(self._blocks[first]) - offset + sum(map(len, self._blocks[first + 1:last]))
+                + end)
+
+    def lookup(self, op, value):
+        (first, offset), (last, end) = self._span(op, value)
+        blocks = self._blocks
+        for index in range(first, min(last, len(blocks) - 1) + 1):
+            block = blocks[index]
+            for _, sku in block[offset if index == first else 0:end if index == last else None]:
+                yield sku
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _matches(row, field, op, value):
+    current = row.get(field)
+    if current is None:
+        return False
+    if op == "eq":
+        return normalize(current) == normalize(value)
+    if op == "in":
+        return normalize(current) in {normalize(item) for item in value}
+    current, value = _number(current), _number(value)
+    if current is None or value is None:
+        return False
+    if op == "lt":
+        return current < value
+    if op == "le":
+        return current <= value
+    if op == "gt":
+        return current > value
+    return current >= value
+
+
+class ProductIndex:
+    """Declared hash and sorted indexes over one store's products
+
+    Not thread-safe; keep one index per thread (or per Streamlit session).
+    """
+
+    def __init__(self, store, hashed=HASHED, ordered=ORDERED):
+        self.store = store
+        self.indexes = {}
+        for field in hashed:
+            self.indexes[field] = HashIndex(field)
+        for field in ordered:
+            self.indexes[field] = SortedIndex(field)
+        # Product fields and attributes by SKU
+        self.rows = {}
+        self._version = None
+        self._touched = set()
+        self._lock = threading.Lock()
+        store.subscribe(self._on_commit)
+
+    def _on_commit(self, records):
+        # Writer thread: only note the SKUs; sync() re-reads them
+        with self._lock:
+            self._touched.update(record['sku'] for record in records)
+
+    def close(self):
+        """Stop following the store's commits"""
+        self.store.unsubscribe(self._on_commit)
+
+    # Maintenance
+
+    def rebuild(self):
+        """Re-read every product and its attributes and rebuild all indexes"""
+        with self._lock:
+            self._touched = set()
+        store = self.store
+        self._version = store.changes(PRODUCTS)
+        attributes = store.all_attributes()
+        self.rows = {product['sku']: {**attributes.get(product['sku'], {}), **product}
+                     for product in store.products()}
+        for field, index in self.indexes.items():
+            if index.kind == "sorted":
+                index.build((key, sku) for sku, row in self.rows.items()
+                            if (key := _number(row.get(field))) is not None)
+            else:
+                index.entries = {}
+                for sku, row in self.rows.items():
+                    if row.get(field) is not None:
+                        index.add(row[field], sku)
+
+    def sync(self):
+        """Catch up with the store (done before every query)"""
+        if self.store.changes(PRODUCTS) != self._version:
+            self.rebuild()
+            return
+        with self._lock:
+            touched, self._touched = self._touched, set()
+        for sku in touched:
+            product = self.store.get_product(sku)
+            row = self.rows.get(sku)
+            if product is None or row is None:
+                continue
+            for field, value in product.items():
+                if row.get(field) != value:
+                    index = self.indexes.get(field)
+                    if index is not None:
+                        index.remove(row[field], sku)
+                        index.add(value, sku)
+                    row[field] = value
+
+    # Queries
+
+    @staticmethod
+    def _conditions(conditions):
+        parsed = []
+        for name, value in conditions.items():
+            field, _, op = name.partition("__")
+            op = op or "eq"
+            if op not in OPERATORS:
+                raise ValueError(f"Unknown operator '{op}' (use one of {', '.join(OPERATORS)})")
+            parsed.append((field, op, value))
+        return parsed
+
+    def plan(self, **conditions):
+        """(field, op, value, estimate) of the chosen index, or None for a scan"""
+        self.sync()
+        best = None
+        for field, op, value in self._conditions(conditions):
+            index = self.indexes.get(field)
+            estimate = index.estimate(op, value) if index is not None else None
+            if estimate is not None and (best is None or estimate < best[3]):
+                best = (field, op, value, estimate)
+        return best
+
+    def explain(self, **conditions):
+        """The plan of a query as text"""
+        best = self.plan(**conditions)
+        if best is None:
+            return f"scan {len(self.rows)} products"
+        field, op, value, estimate = best
+        rest = len(conditions) - 1
+        return (f"{self.indexes[field].kind} index on {field} ({op} {value!r}): ~{estimate} "
+                f"candidates" + (f", then {rest} filter(s)" if rest else ""))
+
+    def query(self, **conditions):
+        """Products (with their attributes) matching every condition, by id"""
+        parsed = self._conditions(conditions)
+        best = self.plan(**conditions)
+        if best is None:
+            candidates = self.rows
+        else:
+            field, op, value, _ = best
+            candidates = self.indexes[field].lookup(op, value)
+        rows = self.rows
+        result = []
+        for sku in candidates:
+            row = rows[sku]
+            if all(_matches(row, field, op, value) for field, op, value in parsed):
+                result.append(dict(row))
+        result.sort(key=lambda row: row['id'])
+        return result
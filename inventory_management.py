@@ -1,45 +1,34 @@
 import tkinter as tk
 from tkinter import messagebox, ttk
 
-# In-memory storage for products
-products = {}
-product_id_counter = 1
+from querycache import QueryCache
+from storage import PRODUCTS, STOCK, get_store, load_sample_products
+
+# Storage backend shared with the other front ends (see storage.py)
+store = get_store()
+# "View All" re-reads only after products or stock change
+query_cache = QueryCache(store)
 
 def add_product(name, sku, category, price, quantity):
     """Add a new product to inventory"""
-    global product_id_counter
-    
-    if sku in [p['sku'] for p in products.values()]:
-        return False, "SKU already exists!"
-    
-    products[product_id_counter] = {
-        'id': product_id_counter,
-        'name': name,
-        'sku': sku,
-        'category': category,
-        'price': price,
-        'quantity': quantity
-    }
-    product_id_counter += 1
-    return True, "Product added successfully!"
+    return store.add_product(name, sku, category, price, quantity)
 
+@query_cache.memoize(depends=(PRODUCTS, STOCK))
 def get_all_products():
     """Get all products in inventory"""
     result = ""
+    products = store.products()
     if not products:
         return "No products in inventory."
     
-    for product in products.values():
+    for product in products:
         result += f"SKU: {product['sku']}, Name: {product['name']}, Category: {product['category']}, "
         result += f"Price: ${product['price']:.2f}, Stock: {product['quantity']}\n"
     return result
 
 def search_product_by_sku(sku):
     """Search for a product by SKU"""
-    for product in products.values():
-        if product['sku'] == sku:
-            return product
-    return None
+    return store.get_product(sku)
 
 def add_product_button_click():
     """Handle add product button click"""
@@ -178,10 +167,7 @@ if __name__ == "__main__":
     scrollbar.pack(side='right', fill='y')
     
     # Add some sample data
-    add_product("Plumberry Jam", "PLM001", "Preserves", 12.99, 50)
-    add_product("Dried Plumberries", "PLM002", "Dried Fruits", 8.50, 100)
-    add_product("Plumberry Juice", "PLM003", "Beverages", 5.99, 75)
-    add_product("Plumberry Tea", "PLM004", "Beverages", 7.25, 60)
+    load_sample_products(store)
     
     # Display initial inventory
     result_text.insert(1.0, get_all_products())
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Instrumentation
+Counters, latency histograms, profiling hooks and exporters.
+
+Instrumentation is off by default and can be switched on at runtime:
+
+    metrics.enable()                       # or PLUMBERRY_METRICS=1
+    metrics.serve_prometheus(9464)         # or PLUMBERRY_METRICS=prometheus:9464
+    metrics.start_json_dump("m.json", 10)  # or PLUMBERRY_METRICS=json:m.json
+
+Methods marked with @timed run untouched while metrics are off. Once
+enabled, every call is counted exactly (one increment) and one call in
+SAMPLE_EVERY (5% by default) is also timed into the latency histogram,
+so call counts are true monotonic counters while the clock reads stay
+rare. Event counters (failed removals, low-stock crossings) are exact:
+they are only touched on those rare paths.
+
+enable(duty=1.0), or installing a trace hook, times every call.
+"""
+
+import functools
+import os
+import threading
+import time
+
+# cProfile, pstats, json and http.server are imported on first use: the
+# store imports this module, and the CLI should start in milliseconds
+
+ENABLED = False
+# One call in SAMPLE_EVERY is timed
+SAMPLE_EVERY = 20
+
+# 16 sub-buckets per power of two: about 6% relative precision
+SUB_BITS = 4
+SUB_COUNT = 1 << SUB_BITS
+
+# Prometheus bucket bounds in seconds
+PROMETHEUS_BOUNDS = [1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0]
+
+
+class Histogram:
+    """HDR-style log-linear histogram of nanosecond values
+
+    Values below 2**SUB_BITS get their own bucket; above that each power
+    of two is split into SUB_COUNT linear sub-buckets, so recording is a
+    bit_length and a shift regardless of the value.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (64 * SUB_COUNT)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def _index(value):
+        exponent = value.bit_length()
+        if exponent <= SUB_BITS:
+            return value
+        shift = exponent - SUB_BITS - 1
+        return ((shift + 1) << SUB_BITS) + ((value >> shift) & (SUB_COUNT - 1))
+
+    @staticmethod
+    def _upper(index):
+        """Largest value that falls into bucket index"""
+        if index < SUB_COUNT:
+            return index
+        shift = (index >> SUB_BITS) - 1
+        return (((SUB_COUNT + (index & (SUB_COUNT - 1))) + 1) << shift) - 1
+
+    def record(self, value):
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        """Value at the given percentile (upper bound of its bucket)"""
+        if not self.count:
+            return 0
+        target = max(1, int(round(pct / 100.0 * self.count)))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(self._upper(index), self.max)
+        return self.max
+
+    def cumulative(self, bounds_ns):
+        """Counts of values <= each bound, for Prometheus buckets"""
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds_ns:
+            while index < len(self.counts) and self._upper(index) <= bound:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+    def summary(self):
+        return {
+            'samples': self.count,
+            'mean_us': round(self.total / self.count / 1000.0, 3) if self.count else 0,
+            'p50_us': round(self.percentile(50) / 1000.0, 3),
+            'p99_us': round(self.percentile(99) / 1000.0, 3),
+            'max_us': round(self.max / 1000.0, 3),
+        }
+
+
+class OperationStats:
+    """Calls of one operation and the latency of the sampled ones"""
+
+    __slots__ = ('calls', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.histogram = Histogram()
+
+
+operations = {}
+counters = {}
+_instrumented_classes = []
+_trace_hooks = []
+_profiler = None
+_exporters_started = set()
+_state = {'installed': False, 'every': SAMPLE_EVERY, 'sample_every': SAMPLE_EVERY}
+
+
+def operation(name):
+    """Stats for an operation, created on first use"""
+    stats = operations.get(name)
+    if stats is None:
+        stats = operations[name] = OperationStats()
+    return stats
+
+
+def incr(name, amount=1):
+    """Increase a named event counter (no-op while disabled)"""
+    if ENABLED:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def timed(name):
+    """Mark a method to be counted and timed as operation `name`
+
+    The method itself is left unchanged; classes using it must be
+    registered with @instrumented.
+    """
+    def decorate(fn):
+        fn.metric_name = name
+        return fn
+    return decorate
+
+
+def instrumented(cls):
+    """Class decorator registering the @timed methods of cls"""
+    cls._timed_methods = {attr: fn for attr, fn in vars(cls).items()
+                          if getattr(fn, 'metric_name', None)}
+    _instrumented_classes.append(cls)
+    if _state['installed']:
+        _install(cls)
+    return cls
+
+
+def _wrap(fn, stats):
+    name = fn.metric_name
+    state = _state
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        stats.calls += 1
+        if stats.calls % state['every']:
+            return fn(*args, **kwargs)
+        start = time.perf_counter_ns()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter_ns() - start
+        stats.histogram.record(elapsed)
+        for hook in _trace_hooks:
+            hook(name, elapsed, args, kwargs)
+        return result
+    return wrapper
+
+
+def _install(cls):
+    for attr, fn in cls._timed_methods.items():
+        setattr(cls, attr, _wrap(fn, operation(fn.metric_name)))
+
+
+def _uninstall(cls):
+    for attr, fn in cls._timed_methods.items():
+        setattr(cls, attr, fn)
+
+
+def _set_installed(installed):
+    if installed != _state['installed']:
+        _state['installed'] = installed
+        for cls in _instrumented_classes:
+            _install(cls) if installed else _uninstall(cls)
+
+
+def _apply_mode():
+    """Install or remove the wrappers and set how often they time a call"""
+    _state['every'] = 1 if _trace_hooks else _state['sample_every']
+    _set_installed(ENABLED)
+
+
+def enable(duty=None):
+    """Start collecting metrics
+
+    Every call is counted; duty is the fraction of calls timed (default
+    1 / SAMPLE_EVERY); 1.0 times every call.
+    """
+    global ENABLED
+    ENABLED = True
+    every = SAMPLE_EVERY if duty is None else round(1 / min(1.0, max(1e-6, duty)))
+    _state['sample_every'] = every
+    _apply_mode()
+
+
+def disable():
+    """Stop collecting metrics (collected values are kept)"""
+    global ENABLED
+    ENABLED = False
+    _apply_mode()
+
+
+def reset():
+    """Clear all collected values"""
+    for stats in operations.values():
+        stats.calls = 0
+        stats.histogram = Histogram()
+    counters.clear()
+
+
+def duty_cycle():
+    """Fraction of calls timed by the wrappers"""
+    return 1.0 / _state['every']
+
+
+def add_trace_hook(hook):
+    """Call hook(operation, elapsed_ns, args, kwargs) after every instrumented call
+
+    While any hook is installed every call is timed, not just the sampled
+    ones.
+    """
+    _trace_hooks.append(hook)
+    _apply_mode()
+
+
+def remove_trace_hook(hook):
+    _trace_hooks.remove(hook)
+    _apply_mode()
+
+
+def start_profiling():
+    """Start cProfile for the whole process"""
+    global _profiler
+    import cProfile
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def stop_profiling(path=None, limit=30):
+    """Stop cProfile; save raw stats to path and return the top entries as text"""
+    global _profiler
+    import io
+    import pstats
+    if _profiler is None:
+        return ""
+    _profiler.disable()
+    if path:
+        _profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(_profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+    _profiler = None
+    return out.getvalue()
+
+
+def profiling():
+    return _profiler is not None
+
+
+def snapshot():
+    """All metrics as a JSON-serialisable dict"""
+    return {
+        'timestamp': time.time(),
+        'enabled': ENABLED,
+        'duty_cycle': duty_cycle(),
+        'counters': dict(counters),
+        'operations': {name: {'calls': stats.calls, **stats.histogram.summary()}
+                       for name, stats in operations.items() if stats.calls},
+    }
+
+
+def prometheus_text():
+    """All metrics in the Prometheus text exposition format"""
+    lines = [
+        "# HELP plumberry_sampling_duty_cycle Fraction of store calls timed.",
+        "# TYPE plumberry_sampling_duty_cycle gauge",
+        f"plumberry_sampling_duty_cycle {duty_cycle()}",
+        "# HELP plumberry_operation_calls_total Calls of each store operation.",
+        "# TYPE plumberry_operation_calls_total counter",
+    ]
+    for name, stats in operations.items():
+        lines.append(f'plumberry_operation_calls_total{{operation="{name}"}} {stats.calls}')
+
+    lines.append("# HELP plumberry_operation_seconds Latency of each store operation (sampled).")
+    lines.append("# TYPE plumberry_operation_seconds histogram")
+    bounds_ns = [int(b * 1e9) for b in PROMETHEUS_BOUNDS]
+    for name, stats in operations.items():
+        histogram = stats.histogram
+        for bound, count in zip(PROMETHEUS_BOUNDS, histogram.cumulative(bounds_ns)):
+            lines.append(f'plumberry_operation_seconds_bucket{{operation="{name}",le="{bound}"}} {count}')
+        lines.append(f'plumberry_operation_seconds_bucket{{operation="{name}",le="+Inf"}} {histogram.count}')
+        lines.append(f'plumberry_operation_seconds_sum{{operation="{name}"}} {histogram.total / 1e9}')
+        lines.append(f'plumberry_operation_seconds_count{{operation="{name}"}} {histogram.count}')
+
+    for name, value in counters.items():
+        lines.append(f"# TYPE plumberry_{name}_total counter")
+        lines.append(f"plumberry_{name}_total {value}")
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(port=9464, host="127.0.0.1"):
+    """Serve /metrics on a local port from a daemon thread; returns the server"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class PrometheusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    if not ENABLED:
+        enable()
+    server = ThreadingHTTPServer((host, port), PrometheusHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_json_dump(path, interval=10.0):
+    """Write snapshot() to path every `interval` seconds from a daemon thread
+
+    Returns an Event; set it to stop dumping.
+    """
+    if not ENABLED:
+        enable()
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            write_json(path)
+        write_json(path)
+
+    threading.Thread(target=loop, name="metrics-json", daemon=True).start()
+    return stop
+
+
+def write_json(path):
+    """Write snapshot() to path atomically"""
+    import json
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot(), f, indent=2)
+    os.replace(tmp, path)
+
+
+def install_signal_handlers():
+    """SIGUSR1 toggles metrics, SIGUSR2 toggles cProfile (POSIX only)
+
+    When profiling stops, stats are written to plumberry-<pid>.prof.
+    """
+    import signal
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+
+    def toggle_metrics(signum, frame):
+        disable() if ENABLED else enable()
+
+    def toggle_profiler(signum, frame):
+        if profiling():
+            stop_profiling(f"plumberry-{os.getpid()}.prof")
+        else:
+            start_profiling()
+
+    try:
+        signal.signal(signal.SIGUSR1, toggle_metrics)
+        signal.signal(signal.SIGUSR2, toggle_profiler)
+    except ValueError:
+        # Only the main thread may install handlers (not the case under Streamlit)
+        return False
+    return True
+
+
+def configure_from_env():
+    """Apply PLUMBERRY_METRICS once per process
+
+    Accepted values (comma-separated): 1, full, prometheus[:port],
+    json[:path], signals.
+    """
+    setting = os.environ.get("PLUMBERRY_METRICS", "")
+    for item in filter(None, (part.strip() for part in setting.split(","))):
+        if item in _exporters_started:
+            continue
+        _exporters_started.add(item)
+        kind, _, value = item.partition(":")
+        if kind in ("1", "on", "true"):
+            enable()
+        elif kind == "full":
+            enable(duty=1.0)
+        elif kind == "prometheus":
+            serve_prometheus(int(value or 9464))
+        elif kind == "json":
+            start_json_dump(value or "plumberry-metrics.json")
+        elif kind == "signals":
+            install_signal_handlers()
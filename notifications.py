@@ -0,0 +1,675 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Outbound Notifications
+Delivers stock events to webhooks, files and local queues.
+
+Events are JSON objects with an `id` (stable, for receivers to drop
+duplicates), a `kind` and its details:
+
+    low_stock / out_of_stock   a SKU fell below the threshold / to zero
+    restocked                  a low SKU is back at or above the threshold
+    large_movement             one movement of at least `large_movement` units
+    reconciliation             a cycle count was booked (reconciliation.py)
+
+A Notifier subscribes to a store. The write path only puts the
+committed batch on a bounded queue (dropping and counting it if the
+queue is full), so a slow or dead receiver never adds latency to
+add_stock / remove_stock. Everything else runs on a background thread
+with an asyncio loop:
+
+  - the batch becomes events; a SKU's level is read once, off the
+    write path, and then followed movement by movement, so a dip
+    below the threshold is reported even if it is over by then
+  - each destination has its own outbox, which sends events in batches
+    of up to `batch_size`, waiting at most `linger` seconds to fill one
+  - sends run on daemon threads; webhooks reuse pooled keep-alive
+    connections
+  - a failed batch is written to the destination's spool directory and
+    retried with exponential backoff (and jitter). While the spool is
+    not empty, new batches queue behind it on disk, so the order holds
+    and memory stays bounded during an outage. The spool survives
+    restarts and is sent first by the next Notifier.
+
+Destinations are given as specs:
+
+    http://host:8080/hooks/stock     JSON POST of {"events": [...]}
+    file:/var/log/plumberry.jsonl    one event per line
+    queue                            notifier.queue (a queue.Queue), in process
+
+Enable for the default store with PLUMBERRY_NOTIFY=<spec>[,<spec>...]
+(and PLUMBERRY_NOTIFY_SPOOL, default .plumberry-spool). A stub receiver
+stands in for a real one in tests and demos:
+
+    python notifications.py serve --port 8765 --fail 3 --delay 0.5
+    PLUMBERRY_NOTIFY=http://127.0.0.1:8765/ python plumberry.py remove-stock PLM001 60
+"""
+
+import argparse
+import asyncio
+import atexit
+import http.client
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import ids
+import metrics
+from storage import LOW_STOCK_THRESHOLD
+
+SPOOL_DIR = ".plumberry-spool"
+LARGE_MOVEMENT = 100
+PAGE_SIZE = 500
+KINDS = ("low_stock", "out_of_stock", "restocked", "large_movement", "reconciliation")
+
+
+class DeliveryError(Exception):
+    """A destination did not accept a batch"""
+
+
+# Destinations
+
+class WebhookDestination:
+    """JSON POSTs to an HTTP(S) URL over pooled keep-alive connections"""
+
+    def __init__(self, url, headers=None, timeout=5.0, pool_size=2, kinds=None):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Not an http(s) URL: '{url}'")
+        self.name = url
+        self.kinds = kinds
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._connection_class = (http.client.HTTPSConnection if parts.scheme == "https"
+                                  else http.client.HTTPConnection)
+        self._host, self._port = parts.hostname, parts.port
+        self._path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self._headers = {"Content-Type": "application/json", **(headers or {})}
+        self._idle = []
+        self._lock = threading.Lock()
+        self.connections = 0
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        self.connections += 1
+        return self._connection_class(self._host, self._port, timeout=self.timeout), False
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def send(self, events):
+        body = json.dumps({'events': events}, default=str).encode()
+        while True:
+            connection, reused = self._acquire()
+            try:
+                connection.request("POST", self._path, body, self._headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                # The receiver may have closed an idle connection; retry on a new one
+                if reused:
+                    continue
+                raise DeliveryError(f"{self.name}: {e}") from e
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+            if not 200 <= response.status < 300:
+                raise DeliveryError(f"{self.name}: HTTP {response.status} {response.reason}")
+            return
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class FileDestination:
+    """Appends events to a file as JSON lines"""
+
+    def __init__(self, path, kinds=None, fsync=False):
+        self.name = f"file:{path}"
+        self.path = path
+        self.kinds = kinds
+        self.fsync = fsync
+
+    def send(self, events):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(event, default=str) + "\n" for event in events)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def close(self):
+        pass
+
+
+class QueueDestination:
+    """Puts events on a local queue (queue.Queue or multiprocessing.Queue)"""
+
+    def __init__(self, target=None, kinds=None, name="queue"):
+        self.name = name
+        self.queue = target if target is not None else queue.Queue()
+        self.kinds = kinds
+
+    def send(self, events):
+        for position, event in enumerate(events):
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                raise DeliveryError(f"{self.name} is full after {position} of {len(events)} events")
+
+    def close(self):
+        pass
+
+
+def destination(spec):
+    """Destination for a spec: an http(s) URL, file:PATH or queue"""
+    if spec.startswith(("http://", "https://")):
+        return WebhookDestination(spec)
+    if spec.startswith("file:"):
+        return FileDestination(spec[5:])
+    if spec == "queue":
+        return QueueDestination()
+    raise ValueError(f"Unknown notification destination '{spec}' (use a URL, file:PATH or queue)")
+
+
+# Durable retry spool
+
+class Spool:
+    """Batches waiting for one destination, one JSON file each, oldest first"""
+
+    def __init__(self, directory, name):
+        self.directory = os.path.join(directory, re.sub(r"[^A-Za-z0-9._-]+", "_", name))
+        os.makedirs(self.directory, exist_ok=True)
+        self.files = sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+        self._next = int(self.files[-1][:-5]) + 1 if self.files else 1
+
+    def __len__(self):
+        return len(self.files)
+
+    def write(self, events):
+        name = f"{self._next:012d}.json"
+        self._next += 1
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(events, f, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self.files.append(name)
+        metrics.incr("notifications_spooled", len(events))
+
+    def oldest(self):
+        with open(os.path.join(self.directory, self.files[0]), encoding="utf-8") as f:
+            return json.load(f)
+
+    def remove_oldest(self):
+        os.remove(os.path.join(self.directory, self.files.pop(0)))
+
+
+class Outbox:
+    """Batching, sending and retrying for one destination (runs on the notifier's loop)"""
+
+    def __init__(self, notifier, target):
+        self.notifier = notifier
+        self.destination = target
+        self.spool = Spool(notifier.spool_dir, target.name)
+        self.queue = asyncio.Queue()
+        self.sent = 0
+        self.failures = 0
+        self.batches = 0
+        self.last_error = None
+        self._closing = False
+
+    def accepts(self, event):
+        return self.destination.kinds is None or event['kind'] in self.destination.kinds
+
+    async def run(self):
+        await self._drain_spool()
+        while not self._closing:
+            if time.monotonic() > self.notifier.deadline:
+                # Closing and out of time: keep the rest for the next run
+                self._spool_backlog()
+                return
+            batch = await self._collect()
+            if batch and (len(self.spool) or not await self._send(batch)):
+                # Behind or failing: keep the order by queueing on disk
+                self.spool.write(batch)
+                await self._drain_spool()
+
+    async def _collect(self):
+        notifier = self.notifier
+        event = await self.queue.get()
+        if event is None:
+            self._closing = True
+            return []
+        batch = [event]
+        deadline = asyncio.get_running_loop().time() + notifier.linger
+        while len(batch) < notifier.batch_size:
+            if self.queue.empty():
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                event = self.queue.get_nowait()
+            if event is None:
+                self._closing = True
+                break
+            batch.append(event)
+        return batch
+
+    async def _send(self, batch):
+        try:
+            await _in_thread(self.destination.send, batch)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            metrics.incr("notification_failures")
+            return False
+        self.sent += len(batch)
+        self.batches += 1
+        metrics.incr("notifications_sent", len(batch))
+        return True
+
+    def _spool_backlog(self):
+        """Move queued events to the spool (during an outage)"""
+        batch = []
+        while not self.queue.empty():
+            event = self.queue.get_nowait()
+            if event is None:
+                self._closing = True
+                continue
+            batch.append(event)
+            if len(batch) == self.notifier.batch_size:
+                self.spool.write(batch)
+                batch = []
+        if batch:
+            self.spool.write(batch)
+
+    async def _drain_spool(self):
+        """Send spooled batches oldest first, backing off exponentially on failure"""
+        notifier = self.notifier
+        attempt = 0
+        while len(self.spool):
+            if await self._send(self.spool.oldest()):
+                self.spool.remove_oldest()
+                attempt = 0
+                continue
+            self._spool_backlog()
+            if self._closing:
+                return
+            delay = min(notifier.max_backoff, notifier.backoff * 2 ** attempt)
+            attempt += 1
+            try:
+                await asyncio.wait_for(notifier.stopping.wait(), delay * random.uniform(0.5, 1.0))
+            except asyncio.TimeoutError:
+                continue
+            # Closing: keep what is left on disk for the next run
+            self._spool_backlog()
+            return
+
+
+# Notifier
+
+class Notifier:
+    """Turns a store's committed movements into events and delivers them"""
+
+    def __init__(self, destinations, spool_dir=SPOOL_DIR, threshold=LOW_STOCK_THRESHOLD,
+                 large_movement=LARGE_MOVEMENT, batch_size=100, linger=0.5, backoff=0.5,
+                 max_backoff=60.0, queue_size=10000):
+        self.destinations = list(destinations)
+        self.spool_dir = spool_dir
+        self.threshold = threshold
+        self.large_movement = large_movement
+        self.batch_size = batch_size
+        self.linger = linger
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.store = None
+        self.dropped = 0
+        # Set by close(): after it, outboxes spool instead of sending
+        self.deadline = float('inf')
+        self.outboxes = []
+        # sku -> level after the last record seen, and its state: 'low',
+        # 'out' or None (at or above the threshold)
+        self._tracked = {}
+        self._states = {}
+        self._lost = False
+        self._inbox = queue.Queue(queue_size)
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    @property
+    def queue(self):
+        """The local queue of the first queue destination, if any"""
+        for target in self.destinations:
+            if isinstance(target, QueueDestination):
+                return target.queue
+        return None
+
+    def attach(self, store):
+        """Subscribe to a store's committed movements; returns self
+
+        Pending events are delivered (or spooled) at interpreter exit.
+        """
+        self.store = store
+        store.notifier = self
+        store.subscribe(self.submit)
+        atexit.register(self.close)
+        return self
+
+    def submit(self, records):
+        """Queue a committed batch (never blocks; drops it if the queue is full)"""
+        try:
+            self._inbox.put_nowait(records)
+        except queue.Full:
+            self.dropped += 1
+            self._lost = True
+            metrics.incr("notification_batches_dropped")
+
+    def publish(self, event):
+        """Queue one event (a dict with at least 'kind') for delivery"""
+        # A dict, where submit() queues lists of records
+        self.submit({'id': f"{event['kind']}:{ids.to_string(ids.generator().next_id())}",
+                     'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"), **event})
+
+    def reconciliation(self, result, results):
+        """Publish a booked cycle count (a reconciliation.Reconciliation)"""
+        summary = result.summary()
+        self.publish({'kind': 'reconciliation', **summary, 'value': str(summary['value']),
+                      'booked': sum(1 for success, _ in results if success),
+                      'failed': sum(1 for success, _ in results if not success)})
+
+    # Event loop thread
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        self._loop = loop
+        try:
+            loop.run_until_complete(self._main())
+        finally:
+            loop.close()
+
+    async def _main(self):
+        self.stopping = asyncio.Event()
+        self.outboxes = [Outbox(self, target) for target in self.destinations]
+        tasks = [asyncio.create_task(outbox.run()) for outbox in self.outboxes]
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=self._read, args=(loop,), name="notifier-reader",
+                         daemon=True).start()
+        self._ready.set()
+        await asyncio.gather(*tasks)
+
+    def _read(self, loop):
+        """Turn queued batches into events and hand them to the loop (a thread)"""
+        while True:
+            item = self._inbox.get()
+            if item is None:
+                loop.call_soon_threadsafe(self._stop)
+                return
+            if isinstance(item, dict):
+                events = [item]
+            else:
+                try:
+                    events = self.events(item)
+                except Exception as e:
+                    print(f"Notifier error: {e}", file=sys.stderr)
+                    continue
+            if events:
+                loop.call_soon_threadsafe(self._dispatch, events)
+
+    def _dispatch(self, events):
+        for event in events:
+            for outbox in self.outboxes:
+                if outbox.accepts(event):
+                    outbox.queue.put_nowait(event)
+
+    def _stop(self):
+        self.stopping.set()
+        for outbox in self.outboxes:
+            outbox.queue.put_nowait(None)
+
+    def events(self, records):
+        """Events of one committed batch of records"""
+        events = []
+        if self._lost:
+            # Batches were dropped: the tracked levels may have missed movements
+            self._lost = False
+            self._tracked = {}
+        for record in records:
+            if record['quantity'] >= self.large_movement:
+                events.append(_event('large_movement', record, type=record['type'],
+                                     quantity=record['quantity'], notes=record['notes']))
+            sku = record['sku']
+            delta = record['quantity'] if record['type'] == 'IN' else -record['quantity']
+            level = self._tracked.get(sku)
+            if level is None:
+                level = self._level_after(record)
+                if level is None:
+                    continue
+                self._states[sku] = self._state(level - delta)
+            else:
+                level += delta
+            self._tracked[sku] = level
+            state = self._state(level)
+            if state == self._states.get(sku):
+                continue
+            self._states[sku] = state
+            kind = ('restocked' if state is None else
+                    'out_of_stock' if state == 'out' else 'low_stock')
+            events.append(_event(kind, record, name=record.get('product_name'), level=level,
+                                 threshold=self.threshold))
+        return events
+
+    def _state(self, level):
+        return 'out' if level <= 0 else 'low' if level < self.threshold else None
+
+    def _level_after(self, record):
+        """A SKU's level right after one of its movements
+
+        The current level less the SKU's movements since, read again if
+        a commit lands in between. Later levels follow from the records.
+        """
+        store = self.store
+        if store is None:
+            return None
+        for _ in range(5):
+            version = store.version
+            product = store.get_product(record['sku'])
+            if product is None:
+                return None
+            level = product['quantity']
+            before_id = None
+            while True:
+                page = store.query_transactions(sku=record['sku'], before_id=before_id,
+                                                limit=PAGE_SIZE)
+                later = [other for other in page if other['id'] > record['id']]
+                level -= sum(other['quantity'] if other['type'] == 'IN' else -other['quantity']
+                             for other in later)
+                if len(later) < PAGE_SIZE:
+                    break
+                before_id = page[-1]['id']
+            if store.version == version:
+                break
+        return level
+
+    # Shutdown and statistics
+
+    def close(self, timeout=10.0):
+        """Deliver what is queued (spooling what cannot be sent), then stop
+
+        Sending goes on for half the timeout; what is left then goes to the
+        spool.
+        """
+        if not self._thread.is_alive():
+            return
+        self.deadline = time.monotonic() + timeout / 2
+        try:
+            self._inbox.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        for target in self.destinations:
+            target.close()
+
+    def stats(self):
+        """Per destination: events sent, batches, failures and spooled batches"""
+        return {outbox.destination.name: {'sent': outbox.sent, 'batches': outbox.batches,
+                                          'failures': outbox.failures,
+                                          'spooled': len(outbox.spool),
+                                          'last_error': outbox.last_error}
+                for outbox in self.outboxes}
+
+
+def _in_thread(fn, *args):
+    """Await fn(*args) run on a daemon thread
+
+    Not an executor: those stop taking work before atexit handlers run,
+    and close() still has events to send then.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def run():
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            loop.call_soon_threadsafe(_settle, future, None, e)
+        else:
+            loop.call_soon_threadsafe(_settle, future, result, None)
+
+    threading.Thread(target=run, name="notifier-send", daemon=True).start()
+    return future
+
+
+def _settle(future, result, error):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def _event(kind, record, **details):
+    uid = record.get('uid')
+    return {'id': f"{kind}:{ids.to_string(uid) if uid is not None else record.get('id')}",
+            'kind': kind, 'sku': record['sku'], 'timestamp': record['timestamp'],
+            'transaction_id': record.get('id'), **details}
+
+
+# Stub receiver
+
+class StubReceiver:
+    """Local webhook receiver for tests and demos
+
+    Records every batch it accepts. It can answer the next `fail` requests
+    with 503 and wait `delay` seconds before answering, to stand in for a
+    broken or slow receiver.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, fail=0, delay=0.0, echo=False):
+        self.fail = fail
+        self.delay = delay
+        self.echo = echo
+        self.batches = []
+        self.requests = 0
+        self.clients = set()
+        self._lock = threading.Lock()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status = receiver._receive(self.client_address, body)
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}/"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-receiver",
+                                        daemon=True)
+        self._thread.start()
+
+    def _receive(self, client, body):
+        with self._lock:
+            self.requests += 1
+            self.clients.add(client)
+            if self.fail > 0:
+                self.fail -= 1
+                return 503
+        if self.delay:
+            time.sleep(self.delay)
+        events = json.loads(body)['events']
+        with self._lock:
+            self.batches.append(events)
+        if self.echo:
+            for event in events:
+                print(json.dumps(event), flush=True)
+        return 204
+
+    @property
+    def events(self):
+        with self._lock:
+            return [event for batch in self.batches for event in batch]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plumberry notification stub receiver")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="print the events POSTed to a local webhook")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--fail", type=int, default=0, help="answer the first N requests with 503")
+    serve.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    args = parser.parse_args(argv)
+    receiver = StubReceiver(args.host, args.port, args.fail, args.delay, echo=True)
+    print(f"Listening on {receiver.url}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        receiver.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Purchase and Sales Orders
+Order documents with line items, committed as one atomic batch.
+
+A purchase order (PO) brings stock in from a supplier, a sales order (SO)
+ships it to a customer. Orders are stored by the storage backend
+(Store.save_order / commit_order); committing applies every line through
+Store.apply_movements in all-or-nothing mode, so an order either moves
+all of its SKUs or none, and each movement records the order id.
+OrderBook.place creates and commits an order in one write transaction
+(Store.place_order) instead of two.
+
+OrderBook keeps lookup indexes over the orders of one store: by number,
+SKU, party and status.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+PURCHASE = 'PO'
+SALE = 'SO'
+KINDS = {PURCHASE: "Purchase order", SALE: "Sales order"}
+STATUSES = ('open', 'committed', 'cancelled')
+
+
+def parse_lines(lines):
+    """Normalise (sku, quantity[, unit_cost]) tuples or dicts to line dicts
+
+    Returns (lines, error); unit costs are kept as decimal strings.
+    """
+    parsed = []
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, dict):
+            sku, quantity, unit_cost = line.get('sku'), line.get('quantity'), line.get('unit_cost')
+        elif len(line) == 2:
+            (sku, quantity), unit_cost = line, None
+        else:
+            sku, quantity, unit_cost = (tuple(line) + (None,))[:3]
+        if not sku:
+            return None, f"Line {number}: SKU cannot be empty!"
+        try:
+            if type(quantity) is not int:
+                quantity = int(quantity)
+            if unit_cost is not None:
+                unit_cost = Decimal(str(unit_cost))
+        except (TypeError, ValueError, InvalidOperation):
+            return None, f"Line {number}: invalid quantity or cost!"
+        if quantity <= 0:
+            return None, f"Line {number}: quantity must be positive!"
+        if unit_cost is None:
+            parsed.append({'sku': str(sku).strip().upper(), 'quantity': quantity, 'unit_cost': None})
+            continue
+        if unit_cost < 0:
+            return None, f"Line {number}: unit cost must be positive!"
+        parsed.append({'sku': str(sku).strip().upper(), 'quantity': quantity,
+                       'unit_cost': str(unit_cost)})
+    if not parsed:
+        return None, "An order needs at least one line!"
+    return parsed, None
+
+
+class OrderBook:
+    """Orders of one store with lookup indexes
+
+    Orders created, committed or cancelled through the book update the
+    indexes directly; refresh() picks up orders created elsewhere (e.g.
+    another process sharing a SQLite database).
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._orders = {}
+        self._by_number = {}
+        self._by_sku = {}
+        self._by_party = {}
+        self._by_status = {status: set() for status in STATUSES}
+        self._last_id = 0
+        self.refresh()
+
+    def _index(self, order):
+        previous = self._orders.get(order['id'])
+        if previous is not None:
+            self._by_status[previous['status']].discard(order['id'])
+        else:
+            self._by_number[order['number']] = order['id']
+            self._by_party.setdefault(order['party'], []).append(order['id'])
+            for sku in {line['sku'] for line in order['lines']}:
+                self._by_sku.setdefault(sku, []).append(order['id'])
+            self._last_id = max(self._last_id, order['id'])
+        self._orders[order['id']] = order
+        self._by_status[order['status']].add(order['id'])
+
+    def refresh(self):
+        """Index orders added to the store since the last refresh"""
+        for order in self.store.orders(self._last_id):
+            self._index(order)
+
+    # Changes
+
+    def create(self, kind, party, lines, notes=""):
+        """Create an open order; returns (success, message, order)"""
+        if kind not in KINDS:
+            return False, f"Unknown order type: {kind}", None
+        lines, error = parse_lines(lines)
+        if error:
+            return False, error, None
+        for sku in dict.fromkeys(line['sku'] for line in lines):
+            if self.store.get_product(sku) is None:
+                return False, f"Product with SKU {sku} not found!", None
+        order = self.store.save_order({'kind': kind, 'party': party, 'lines': lines, 'notes': notes})
+        self._index(order)
+        return True, f"{KINDS[kind]} {order['number']} created", order
+
+    def place(self, kind, party, lines, notes=""):
+        """Create an order and commit it in one write transaction
+
+        Returns (success, results, order): one (success, message) per line,
+        or a single one with the reason when the order is refused (order
+        None). A rejected order stays open, as after create().
+        """
+        if kind not in KINDS:
+            return False, [(False, f"Unknown order type: {kind}")], None
+        lines, error = parse_lines(lines)
+        if error:
+            return False, [(False, error)], None
+        order, results = self.store.place_order({'kind': kind, 'party': party, 'lines': lines,
+                                                 'notes': notes})
+        if order is not None:
+            self._index(order)
+        return order is not None and all(ok for ok, _ in results), results, order
+
+    def purchase(self, supplier, lines, notes=""):
+        return self.create(PURCHASE, supplier, lines, notes)
+
+    def sale(self, customer, lines, notes=""):
+        return self.create(SALE, customer, lines, notes)
+
+    def commit(self, order_id):
+        """Apply all lines of an open order atomically
+
+        Returns (success, results) with one (success, message) per line.
+        """
+        results = self.store.commit_order(order_id)
+        order = self.store.get_order(order_id)
+        if order is not None:
+            self._index(order)
+        return all(ok for ok, _ in results), results
+
+    def cancel(self, order_id):
+        success, message = self.store.cancel_order(order_id)
+        if success:
+            self._index(self.store.get_order(order_id))
+        return success, message
+
+    # Lookups
+
+    def get(self, order_id):
+        return self._orders.get(order_id)
+
+    def find(self, number):
+        """Order by number, e.g. 'SO-000042'"""
+        order_id = self._by_number.get(number.strip().upper())
+        return self._orders[order_id] if order_id is not None else None
+
+    def for_sku(self, sku):
+        """Orders with a line for this SKU, oldest first"""
+        return [self._orders[i] for i in self._by_sku.get(sku, ())]
+
+    def for_party(self, party):
+        """Orders for a supplier or customer, oldest first"""
+        return [self._orders[i] for i in self._by_party.get(party, ())]
+
+    def with_status(self, status):
+        return [self._orders[i] for i in sorted(self._by_status.get(status, ()))]
+
+    def __len__(self):
+        return len(self._orders)
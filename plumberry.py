@@ -4,18 +4,22 @@ Plumberry Inventory Management System - Terminal Interface
 Interactive command-line application for managing plumberry inventory
 """
 
-from datetime import datetime
 import os
+import sys
+from decimal import Decimal, InvalidOperation
 
-# In-memory storage
-products = {}
-transactions = []
-product_id = 1
-transaction_id = 1
+from storage import LOW_STOCK_THRESHOLD, get_store, load_sample_products
+
+# Storage backend (see storage.py for configuration)
+store = get_store()
+
+# Background loader for a pre-built catalogue file (PLUMBERRY_CATALOGUE)
+catalogue_loader = None
 
 def clear_screen():
-    """Clear terminal screen"""
-    os.system('clear' if os.name != 'nt' else 'cls')
+    """Clear terminal screen (ANSI escape, no subprocess)"""
+    if sys.stdout.isatty():
+        print("\033[2J\033[H", end="", flush=True)
 
 def print_header():
     """Print application header"""
@@ -25,8 +29,6 @@ def print_header():
 
 def add_product():
     """Add a new product"""
-    global product_id
-    
     print("\n📦 ADD NEW PRODUCT")
     print("-" * 70)
     
@@ -40,7 +42,7 @@ def add_product():
         print("❌ SKU cannot be empty!")
         return
     
-    if sku in [p['sku'] for p in products.values()]:
+    if store.get_product(sku) is not None:
         print(f"❌ SKU {sku} already exists!")
         return
     
@@ -54,16 +56,11 @@ def add_product():
             print("❌ Price and quantity must be positive!")
             return
         
-        products[product_id] = {
-            'id': product_id,
-            'name': name,
-            'sku': sku,
-            'category': category,
-            'price': price,
-            'quantity': quantity
-        }
-        product_id += 1
-        print(f"\n✅ Product '{name}' added successfully!")
+        success, message = store.add_product(name, sku, category, price, quantity)
+        if success:
+            print(f"\n✅ Product '{name}' added successfully!")
+        else:
+            print(f"❌ {message}")
         
     except ValueError:
         print("❌ Invalid input! Please enter valid numbers.")
@@ -73,13 +70,15 @@ def view_inventory():
     print("\n📋 CURRENT INVENTORY")
     print("="*70)
     
+    with store.snapshot() as snap:
+        products = snap.products()
     if not products:
         print("No products in inventory.")
         return
     
     total_value = 0
-    for product in products.values():
-        status = "🔴 LOW" if product['quantity'] < 30 else "🟢 OK "
+    for product in products:
+        status = "🔴 LOW" if product['quantity'] < LOW_STOCK_THRESHOLD else "🟢 OK "
         value = product['price'] * product['quantity']
         total_value += value
         
@@ -92,19 +91,12 @@ def view_inventory():
 
 def add_stock():
     """Add stock to existing product"""
-    global transaction_id
-    
     print("\n➕ ADD STOCK (Incoming)")
     print("-" * 70)
     
     sku = input("Product SKU: ").strip().upper()
     
-    found = None
-    for product in products.values():
-        if product['sku'] == sku:
-            found = product
-            break
-    
+    found = store.get_product(sku)
     if not found:
         print(f"❌ Product with SKU {sku} not found!")
         return
@@ -115,42 +107,33 @@ def add_stock():
             print("❌ Quantity must be positive!")
             return
         
-        notes = input("Notes (optional): ").strip()
+        unit_cost = input(f"Unit cost ($, blank = {found['price']:.2f}): ").strip()
+        unit_cost = Decimal(unit_cost) if unit_cost else None
+        if unit_cost is not None and unit_cost < 0:
+            print("❌ Unit cost must be positive!")
+            return
         
-        found['quantity'] += quantity
+        notes = input("Notes (optional): ").strip()
         
-        transactions.append({
-            'id': transaction_id,
-            'sku': sku,
-            'product_name': found['name'],
-            'type': 'IN',
-            'quantity': quantity,
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'notes': notes
-        })
-        transaction_id += 1
+        success, message = store.add_stock(sku, quantity, notes, unit_cost)
+        if not success:
+            print(f"❌ {message}")
+            return
         
         print(f"\n✅ Added {quantity} units to {found['name']}")
-        print(f"   New stock level: {found['quantity']}")
+        print(f"   New stock level: {store.get_stock_level(sku)}")
         
-    except ValueError:
-        print("❌ Invalid quantity!")
+    except (ValueError, InvalidOperation):
+        print("❌ Invalid quantity or cost!")
 
 def remove_stock():
     """Remove stock from product"""
-    global transaction_id
-    
     print("\n➖ REMOVE STOCK (Outgoing/Sales)")
     print("-" * 70)
     
     sku = input("Product SKU: ").strip().upper()
     
-    found = None
-    for product in products.values():
-        if product['sku'] == sku:
-            found = product
-            break
-    
+    found = store.get_product(sku)
     if not found:
         print(f"❌ Product with SKU {sku} not found!")
         return
@@ -169,21 +152,13 @@ def remove_stock():
         
         notes = input("Notes (optional): ").strip()
         
-        found['quantity'] -= quantity
-        
-        transactions.append({
-            'id': transaction_id,
-            'sku': sku,
-            'product_name': found['name'],
-            'type': 'OUT',
-            'quantity': quantity,
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'notes': notes
-        })
-        transaction_id += 1
+        success, message = store.remove_stock(sku, quantity, notes)
+        if not success:
+            print(f"❌ {message}")
+            return
         
         print(f"\n✅ Removed {quantity} units from {found['name']}")
-        print(f"   Remaining stock: {found['quantity']}")
+        print(f"   Remaining stock: {store.get_stock_level(sku)}")
         
     except ValueError:
         print("❌ Invalid quantity!")
@@ -193,14 +168,14 @@ def view_transactions():
     print("\n📊 TRANSACTION HISTORY")
     print("="*70)
     
-    if not transactions:
+    recent = store.recent_transactions(20)
+    if not recent:
         print("No transactions recorded.")
         return
     
-    count = min(20, len(transactions))
-    print(f"Showing last {count} transactions:\n")
+    print(f"Showing last {len(recent)} transactions:\n")
     
-    for trans in reversed(transactions[-20:]):
+    for trans in recent:
         symbol = "➕ IN " if trans['type'] == 'IN' else "➖ OUT"
         print(f"{symbol} | ID: {trans['id']:3} | {trans['product_name']:20} ({trans['sku']})")
         print(f"       Qty: {trans['quantity']:3} | Time: {trans['timestamp']}")
@@ -215,11 +190,7 @@ def search_product():
     
     sku = input("Enter SKU: ").strip().upper()
     
-    found = None
-    for product in products.values():
-        if product['sku'] == sku:
-            found = product
-            break
+    found = store.get_product(sku)
     
     if found:
         print("\n✅ Product Found!")
@@ -231,49 +202,55 @@ def search_product():
         print(f"Stock:    {found['quantity']} units")
         print(f"Value:    ${found['price'] * found['quantity']:.2f}")
         
-        status = "🔴 LOW STOCK - Reorder needed!" if found['quantity'] < 30 else "🟢 Stock level OK"
+        status = "🔴 LOW STOCK - Reorder needed!" if found['quantity'] < LOW_STOCK_THRESHOLD else "🟢 Stock level OK"
         print(f"Status:   {status}")
     else:
         print(f"\n❌ No product found with SKU: {sku}")
 
 def load_sample_data():
     """Load sample products and transactions"""
-    global product_id, transaction_id
-    
-    # Add sample products
-    sample_products = [
-        ("Plumberry Jam", "PLM001", "Preserves", 12.99, 50),
-        ("Dried Plumberries", "PLM002", "Dried Fruits", 8.50, 100),
-        ("Plumberry Juice", "PLM003", "Beverages", 5.99, 75),
-        ("Plumberry Tea", "PLM004", "Beverages", 7.25, 60),
-    ]
-    
-    for name, sku, category, price, quantity in sample_products:
-        products[product_id] = {
-            'id': product_id,
-            'name': name,
-            'sku': sku,
-            'category': category,
-            'price': price,
-            'quantity': quantity
-        }
-        product_id += 1
-    
-    # Add sample transactions
-    transactions.append({
-        'id': transaction_id,
-        'sku': 'PLM001',
-        'product_name': 'Plumberry Jam',
-        'type': 'IN',
-        'quantity': 30,
-        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'notes': 'Initial stock from supplier'
-    })
-    transaction_id += 1
+    if load_sample_products(store):
+        store.add_stock('PLM001', 30, 'Initial stock from supplier')
+
+def start_loading(path):
+    """Load a catalogue file in the background while the menu is shown"""
+    global catalogue_loader
+    import catalogue_file
+    catalogue_loader = catalogue_file.load_in_background(store, path)
+
+def wait_for_catalogue():
+    """Block until a background catalogue load has finished"""
+    global catalogue_loader
+    if catalogue_loader is None:
+        return
+    if catalogue_loader.is_alive():
+        print("\n⏳ Loading catalogue...")
+        catalogue_loader.join()
+    if catalogue_loader.error:
+        print(f"❌ Could not load catalogue: {catalogue_loader.error}")
+    catalogue_loader = None
+
+def run_commands(argv):
+    """Scripted mode: `python plumberry.py <command> ...` (see commands.py)"""
+    import commands
+    catalogue = os.environ.get("PLUMBERRY_CATALOGUE")
+    if catalogue and not store.product_count():
+        import catalogue_file
+        catalogue_file.load_catalogue(store, catalogue)
+    elif store.name == "memory":
+        # Persistent databases start empty: a script must not find samples in them
+        load_sample_data()
+    try:
+        return commands.main(store, argv)
+    finally:
+        store.close()
 
 def main():
     """Main application loop"""
-    load_sample_data()
+    catalogue = os.environ.get("PLUMBERRY_CATALOGUE")
+    if not catalogue or store.product_count():
+        catalogue = None
+        load_sample_data()
     
     while True:
         print_header()
@@ -288,7 +265,13 @@ def main():
         print("7. Exit")
         print("-" * 70)
         
+        if catalogue:
+            # The menu is on screen: load while the user reads it
+            start_loading(catalogue)
+            catalogue = None
+        
         choice = input("\nSelect option (1-7): ").strip()
+        wait_for_catalogue()
         
         if choice == '1':
             add_product()
@@ -313,6 +296,8 @@ def main():
         clear_screen()
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_commands(sys.argv[1:]))
     try:
         clear_screen()
         main()
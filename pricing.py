@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Pricing
+Scheduled price changes and promotions, applied in bulk.
+
+A product's price is its list price, or the lowest price of the
+promotions running for it. Both change on a schedule:
+
+    engine = PricingEngine(store, "prices.jsonl")
+    engine.schedule({"PLM001": 9.49, "PLM002": 6.25}, at="2026-11-01 00:00:00")
+    engine.promotion("Winter sale", skus, start="2026-12-01", end="2027-01-01",
+                     percent_off=20)
+    engine.run_due()               # apply what is due (or engine.start())
+    engine.price_at("PLM001", "2026-12-15 10:00:00")
+
+Changes and promotion starts and ends are events in a heap ordered by
+time. run_due() pops every event that is due, works out the price of
+each SKU they touch once, and writes the prices that differ with
+Store.set_prices in chunks of `chunk_size` SKUs. Each chunk is one
+short write, so stock movements go on between chunks: a promotion on a
+hundred thousand SKUs is applied in well under a second without holding
+them up.
+
+Every SKU keeps a timeline of its list prices (applied and scheduled)
+and the promotions that include it, so price_at() answers for any time,
+past or future, with a binary search. The journal (a JSON-lines file)
+records what was scheduled and every bulk change with the old and new
+prices; reopening the engine on the same journal restores the timelines
+and the events still pending. The engine also keeps the latest changes
+in memory for changes_since(), which category trees use to keep their
+stock values current without rescanning the catalogue.
+
+Times are 'YYYY-MM-DD HH:MM:SS' strings, dates (midnight) or datetimes.
+"""
+
+import heapq
+import json
+import os
+import sys
+import threading
+from bisect import bisect_right
+from collections import deque
+from datetime import date, datetime
+
+from storage import timestamp_now
+from valuation import to_cents
+
+CHUNK_SIZE = 2000
+# Chunks of applied changes kept for changes_since()
+LOG_CHUNKS = 1000
+# Scheduling this many new SKUs reads the whole catalogue once
+SCAN_THRESHOLD = 1000
+
+PRICE, START, END = "price", "start", "end"
+
+
+def timestamp(when=None):
+    """Store timestamp of a time: a string, date (midnight) or datetime; None is now"""
+    if when is None:
+        return timestamp_now()
+    if isinstance(when, datetime):
+        return when.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(when, date):
+        return when.strftime("%Y-%m-%d 00:00:00")
+    when = str(when).strip().replace("T", " ")
+    for layout in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            # Normalized, so times compare as strings
+            return datetime.strptime(when, layout).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid time '{when}'")
+
+
+class Promotion:
+    """A price cut on a set of SKUs between two times (end excluded)"""
+
+    def __init__(self, name, skus, start, end, percent_off=None, price=None):
+        self.name = name
+        self.skus = skus
+        self.start = start
+        self.end = end
+        self.percent_off = percent_off
+        self.price = price
+
+    def price_for(self, list_price):
+        """Promotional price of a product at a list price"""
+        if self.price is not None:
+            return min(self.price, list_price)
+        return round(to_cents(list_price) * (100 - self.percent_off) / 100) / 100
+
+    def to_json(self):
+        return {'name': self.name, 'skus': self.skus, 'start': self.start, 'end': self.end,
+                'percent_off': self.percent_off, 'price': self.price}
+
+
+class PricingEngine:
+    """Price schedule and promotions of one store"""
+
+    def __init__(self, store, journal=None, chunk_size=CHUNK_SIZE):
+        self.store = store
+        self.path = journal
+        self.chunk_size = chunk_size
+        self.promotions = {}
+        # Events: (time, seq, kind, data); seq keeps scheduling order
+        self._heap = []
+        self._seq = 0
+        # sku -> ([times], [list prices]) and the list price before them
+        self._timelines = {}
+        self._base = {}
+        self._promotions_by_sku = {}
+        # Applied [sku, old, new] changes, in chunks, and chunks ever logged
+        self._log = deque(maxlen=LOG_CHUNKS)
+        self._logged = 0
+        self._file = None
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        if journal and os.path.exists(journal):
+            self._load()
+
+    def attach(self):
+        """Make this the store's pricing engine (store.pricing); returns self"""
+        self.store.pricing = self
+        return self
+
+    # Scheduling
+
+    def schedule(self, prices, at=None, reason=""):
+        """Schedule list prices {sku: price} from a time (default now)
+
+        The changes are applied by the next run_due() at or after that time.
+        """
+        try:
+            when = timestamp(at)
+        except ValueError:
+            return False, f"Invalid time '{at}' (use YYYY-MM-DD HH:MM:SS)"
+        prices = dict(prices)
+        for sku, price in prices.items():
+            if not isinstance(price, (int, float)) or price < 0:
+                return False, f"Invalid price {price!r} for {sku}"
+        with self._lock:
+            known, unknown = self._known(prices)
+            if not known:
+                return False, "No known SKUs to reprice"
+            changes = {sku: prices[sku] for sku in known}
+            seq = self._push(when, PRICE, changes)
+            self._journal({'op': 'schedule', 'seq': seq, 'at': when, 'prices': changes,
+                           'reason': reason, 'base': self._take_base(known)})
+            self._add_list_prices(when, changes)
+        message = f"{len(changes):,} price changes scheduled for {when}"
+        if unknown:
+            message += f" ({len(unknown):,} unknown SKUs skipped: {', '.join(unknown[:5])}"
+            message += ", ...)" if len(unknown) > 5 else ")"
+        return True, message
+
+    def set_price(self, sku, price, reason=""):
+        """Change one list price now"""
+        success, message = self.schedule({sku: price}, None, reason)
+        if not success:
+            return success, message
+        self.run_due()
+        return True, f"Price of {sku} set to ${price:,.2f}"
+
+    def promotion(self, name, skus, start, end, percent_off=None, price=None):
+        """Schedule a promotion: percent_off the list price, or a fixed price"""
+        if name in self.promotions:
+            return False, f"Promotion '{name}' already exists!"
+        if (percent_off is None) == (price is None):
+            return False, "Give either a percentage off or a promotional price"
+        if percent_off is not None and not 0 < percent_off < 100:
+            return False, "Percentage off must be between 0 and 100"
+        if price is not None and price < 0:
+            return False, "Promotional price must not be negative"
+        try:
+            start, end = timestamp(start), timestamp(end)
+        except ValueError as e:
+            return False, f"Invalid promotion time: {e}"
+        if end <= start:
+            return False, "A promotion must end after it starts"
+        with self._lock:
+            known, unknown = self._known(dict.fromkeys(skus))
+            if not known:
+                return False, "No known SKUs in the promotion"
+            promotion = Promotion(name, known, start, end, percent_off, price)
+            seqs = (self._push(start, START, name), self._push(end, END, name))
+            self._journal({'op': 'promotion', 'seqs': seqs, **promotion.to_json(),
+                           'base': self._take_base(known)})
+            self._add_promotion(promotion)
+        message = f"Promotion '{name}' on {len(known):,} SKUs from {start} to {end}"
+        if unknown:
+            message += f" ({len(unknown):,} unknown SKUs skipped)"
+        return True, message
+
+    def end_promotion(self, name, at=None):
+        """End a promotion early (default now)"""
+        with self._lock:
+            promotion = self.promotions.get(name)
+            if promotion is None:
+                return False, f"Promotion '{name}' not found!"
+            when = max(timestamp(at), promotion.start)
+            if when >= promotion.end:
+                return False, f"Promotion '{name}' already ends at {promotion.end}"
+            promotion.end = when
+            seq = self._push(when, END, name)
+            self._journal({'op': 'end', 'seq': seq, 'name': name, 'at': when})
+        return True, f"Promotion '{name}' ends at {when}"
+
+    def _push(self, when, kind, data):
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, kind, data))
+        return self._seq
+
+    def _known(self, prices):
+        """(SKUs in the catalogue, unknown SKUs) of a {sku: ...} dict"""
+        store = self.store
+        if len(prices) > SCAN_THRESHOLD:
+            catalogue = {product['sku'] for product in store.products()}
+            known = [sku for sku in prices if sku in catalogue]
+        else:
+            known = [sku for sku in prices if store.get_product(sku) is not None]
+        if len(known) == len(prices):
+            return known, []
+        found = set(known)
+        return known, [sku for sku in prices if sku not in found]
+
+    def _take_base(self, skus):
+        """Record the current price of SKUs seen for the first time"""
+        new = [sku for sku in skus if sku not in self._base]
+        if not new:
+            return {}
+        store = self.store
+        if len(new) > SCAN_THRESHOLD:
+            wanted = set(new)
+            base = {product['sku']: product['price'] for product in store.products()
+                    if product['sku'] in wanted}
+        else:
+            base = {sku: store.get_product(sku)['price'] for sku in new}
+        self._base.update(base)
+        return base
+
+    def _add_list_prices(self, when, changes):
+        timelines = self._timelines
+        for sku, price in changes.items():
+            timeline = timelines.get(sku)
+            if timeline is None:
+                timelines[sku] = ([when], [price])
+                continue
+            times, prices = timeline
+            if not times or when >= times[-1]:
+                times.append(when)
+                prices.append(price)
+            else:
+                # After the changes at the same time: the later schedule wins
+                index = bisect_right(times, when)
+                times.insert(index, when)
+                prices.insert(index, price)
+
+    def _add_promotion(self, promotion):
+        self.promotions[promotion.name] = promotion
+        by_sku = self._promotions_by_sku
+        for sku in promotion.skus:
+            names = by_sku.get(sku)
+            if names is None:
+                by_sku[sku] = [promotion.name]
+            else:
+                names.append(promotion.name)
+
+    # Prices at a time
+
+    def list_price_at(self, sku, when=None):
+        """List price of a SKU at a time (None if the SKU is unknown)"""
+        return self._list_price(sku, timestamp(when))
+
+    def _list_price(self, sku, when):
+        timeline = self._timelines.get(sku)
+        if timeline is not None:
+            index = bisect_right(timeline[0], when)
+            if index:
+                return timeline[1][index - 1]
+        if sku in self._base:
+            return self._base[sku]
+        product = self.store.get_product(sku)
+        return product['price'] if product is not None else None
+
+    def price_at(self, sku, when=None):
+        """Effective price of a SKU at a time: list price or the best running promotion"""
+        with self._lock:
+            return self._price(sku, timestamp(when))
+
+    def _price(self, sku, when):
+        price = self._list_price(sku, when)
+        if price is None:
+            return None
+        best = price
+        for name in self._promotions_by_sku.get(sku, ()):
+            promotion = self.promotions[name]
+            if promotion.start <= when < promotion.end:
+                best = min(best, promotion.price_for(price))
+        return best
+
+    def next_due(self):
+        """Time of the next pending event, or None"""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    # Applying
+
+    def run_due(self, now=None):
+        """Apply the events due by now; returns the number of prices changed"""
+        with self._lock:
+            now = timestamp(now)
+            heap = self._heap
+            # A dict, not a set: SKUs stay in the order they were given
+            # (usually catalogue order), so each chunk writes nearby rows
+            touched = {}
+            seqs = []
+            while heap and heap[0][0] <= now:
+                when, seq, kind, data = heapq.heappop(heap)
+                seqs.append(seq)
+                if kind == PRICE:
+                    touched.update(dict.fromkeys(data))
+                else:
+                    touched.update(dict.fromkeys(self.promotions[data].skus))
+            if not seqs:
+                return 0
+            store = self.store
+            skus = list(touched)
+            changed = 0
+            for start in range(0, len(skus), self.chunk_size):
+                chunk = {sku: self._price(sku, now) for sku in skus[start:start + self.chunk_size]}
+                previous = store.set_prices(chunk)
+                changes = [[sku, old, chunk[sku]] for sku, old in previous.items()
+                           if old != chunk[sku]]
+                if changes:
+                    self._journal({'op': 'prices', 'at': now, 'changes': changes})
+                    self._log.append(changes)
+                    self._logged += 1
+                    changed += len(changes)
+            # Events are done once all their prices are written; a run cut
+            # short is redone from the journal
+            self._journal({'op': 'apply', 'at': now, 'seqs': seqs})
+            return changed
+
+    def start(self, interval=1.0):
+        """Apply due events from a background thread every `interval` seconds"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.run_due()
+                except Exception as e:
+                    print(f"Pricing error: {e}", file=sys.stderr)
+
+        self._thread = threading.Thread(target=loop, name="pricing", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def cursor(self):
+        """Position in the change log, for changes_since()"""
+        with self._lock:
+            return self._logged
+
+    def changes_since(self, cursor):
+        """([sku, old, new] changes applied after a cursor, new cursor)
+
+        The changes are None if the log no longer goes back that far.
+        """
+        with self._lock:
+            missing = self._logged - cursor
+            if missing > len(self._log):
+                return None, self._logged
+            chunks = list(self._log)[len(self._log) - missing:] if missing else []
+            return [change for chunk in chunks for change in chunk], self._logged
+
+    # Journal
+
+    def _journal(self, entry):
+        if not self.path:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def _load(self):
+        """Rebuild timelines, promotions and pending events from the journal"""
+        done = set()
+        events = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                op = entry['op']
+                self._base.update({sku: price for sku, price in entry.get('base', {}).items()
+                                   if sku not in self._base})
+                if op == 'schedule':
+                    events.append((entry['at'], entry['seq'], PRICE, entry['prices']))
+                    self._add_list_prices(entry['at'], entry['prices'])
+                elif op == 'promotion':
+                    promotion = Promotion(entry['name'], entry['skus'], entry['start'],
+                                          entry['end'], entry['percent_off'], entry['price'])
+                    start, end = entry['seqs']
+                    events.append((promotion.start, start, START, promotion.name))
+                    events.append((promotion.end, end, END, promotion.name))
+                    self._add_promotion(promotion)
+                elif op == 'end':
+                    self.promotions[entry['name']].end = entry['at']
+                    events.append((entry['at'], entry['seq'], END, entry['name']))
+                elif op == 'apply':
+                    done.update(entry['seqs'])
+                if events:
+                    self._seq = max(self._seq, events[-1][1])
+        self._heap = [event for event in events if event[1] not in done]
+        heapq.heapify(self._heap)
+
+    def history(self, sku):
+        """Applied price changes of a SKU from the journal: (time, old, new)"""
+        if not self.path or not os.path.exists(self.path):
+            return []
+        result = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry['op'] == 'prices':
+                    result.extend((entry['at'], old, new)
+                                  for changed, old, new in entry['changes'] if changed == sku)
+        return result
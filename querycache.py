@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Query Cache
+Memoized read results with LRU / TTL eviction and dependency tracking.
+
+The front ends recompute the same reads on every Streamlit rerun or
+Tkinter refresh: dashboard totals, stock listings, top products by
+value, category counts. A QueryCache keeps their results, keyed by
+query name and parameters, until the data they read changes:
+
+    cache = QueryCache(store)
+    totals = cache.get("totals", (), compute_totals, depends=(PRODUCTS, STOCK))
+    units = cache.get("category_units", ("Beverages",), compute_units,
+                      depends=(PRODUCTS, category("Beverages")))
+
+    @cache.memoize(depends=(PRODUCTS, STOCK))
+    def get_all_stock(): ...
+
+A result declares what it read (depends):
+
+  - a section (PRODUCTS, STOCK, TRANSACTIONS, ORDERS): any change to it
+  - sku(X): stock and transactions of SKU X only
+  - category(C): stock and transactions of the SKUs in category C
+    (and its subcategories)
+
+Movements arrive through Store.subscribe with their SKUs, so a movement
+on SKU X drops only the results that read all stock or transactions,
+SKU X, or X's category or one of its parents; results on other SKUs and
+categories stay. Changes the cache did not see as movements (products,
+attributes, orders, another process writing to the same SQLite file)
+show up in the store's change feed and drop every result that read the
+sections they touched, and, for products and stock, every per-SKU and
+per-category result too.
+
+Entries also expire after `ttl` seconds, which bounds staleness for
+changes no feed reports (another process writing a dbm file), and the
+least recently used are evicted beyond `max_entries` or `max_bytes`
+(sizes are estimated: DataFrames by memory_usage, containers
+recursively). stats() gives hits, misses and evictions.
+"""
+
+import functools
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from categories import split_path
+from storage import PRODUCTS, SECTIONS, STOCK, TRANSACTIONS
+
+MAX_ENTRIES = 256
+MAX_BYTES = 64 * 1024 * 1024
+TTL = 60.0
+# Commits noted before a read; beyond this the cache drops all per-SKU
+# results instead of remembering more SKUs
+MAX_PENDING = 1000
+
+
+def sku(value):
+    """Dependency on one SKU's stock and transactions"""
+    return ("sku", value)
+
+
+def category(value):
+    """Dependency on the stock and transactions of a category's products"""
+    return ("category", " > ".join(split_path(value)))
+
+
+def _categories(value):
+    """Tags of a category and all its parents"""
+    parts = split_path(value)
+    return [("category", " > ".join(parts[:depth])) for depth in range(1, len(parts) + 1)]
+
+
+def sizeof(value):
+    """Approximate memory footprint of a value, in bytes"""
+    memory_usage = getattr(value, "memory_usage", None)
+    if callable(memory_usage):
+        # pandas DataFrame (a Series of column sizes) or Series (an int)
+        usage = memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sizeof(key) + sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(map(sizeof, value))
+    return size
+
+
+def _freeze(value):
+    """Hashable form of query parameters"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(map(_freeze, value))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(map(_freeze, value))
+    return value
+
+
+class Entry:
+    """One cached result"""
+
+    __slots__ = ('value', 'size', 'expires', 'depends')
+
+    def __init__(self, value, size, expires, depends):
+        self.value = value
+        self.size = size
+        self.expires = expires
+        self.depends = depends
+
+
+class QueryCache:
+    """Results of read queries on one store, dropped when what they read changes"""
+
+    def __init__(self, store, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL):
+        self.store = store
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        # Dependency tag -> keys of the entries that declared it
+        self._tags = {}
+        self._categories = {}
+        self._seen = store.changes()
+        self._lock = threading.RLock()
+        # (store version, SKUs) of commits not yet applied, and whether
+        # there were too many to keep
+        self._pending = []
+        self._overflow = False
+        self._pending_lock = threading.Lock()
+        store.subscribe(self._on_commit)
+
+    def _on_commit(self, records):
+        # Writer thread: only note the SKUs; the next read invalidates
+        with self._pending_lock:
+            if len(self._pending) >= MAX_PENDING:
+                self._pending = []
+                self._overflow = True
+            elif not self._overflow:
+                self._pending.append((self.store.version, {record['sku'] for record in records}))
+
+    def close(self):
+        """Stop following the store's commits"""
+        self.store.unsubscribe(self._on_commit)
+
+    # Lookups
+
+    def get(self, name, params, compute, depends=(), ttl=None):
+        """Cached result of compute() for (name, params), computing it on a miss
+
+        depends lists what the result reads (sections, sku(), category()),
+        or is a function of the result returning that list.
+        """
+        key = (name, _freeze(params))
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires > time.monotonic():
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return entry.value
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            seen = self._seen
+        value = compute()
+        tags = depends(value) if callable(depends) else depends
+        with self._lock:
+            # A change caught up with while computing may predate the result
+            if self._seen == seen:
+                self._put(key, value, tags, self.ttl if ttl is None else ttl)
+        return value
+
+    def memoize(self, depends=(), ttl=None, name=None):
+        """Decorator caching a function's results by its arguments"""
+        def decorator(fn):
+            query = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                return self.get(query, (args, kwargs), lambda: fn(*args, **kwargs), depends, ttl)
+            return wrapper
+        return decorator
+
+    # Maintenance
+
+    def _put(self, key, value, depends, ttl):
+        size = sizeof(value)
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        tags = set()
+        for tag in depends:
+            if isinstance(tag, str) and tag not in SECTIONS:
+                raise ValueError(f"Unknown dependency '{tag}' (use a section, sku() or category())")
+            tags.add(tag)
+        self._entries[key] = Entry(value, size, time.monotonic() + ttl, tags)
+        self.bytes += size
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        for tag in entry.depends:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, *tags):
+        """Drop the entries depending on any of tags; returns how many"""
+        with self._lock:
+            return self._invalidate(tags)
+
+    def _invalidate(self, tags):
+        keys = set()
+        for tag in tags:
+            keys.update(self._tags.get(tag, ()))
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.bytes = 0
+
+    def _category_tags(self, value):
+        tags = self._categories.get(value)
+        if tags is None:
+            product = self.store.get_product(value)
+            tags = self._categories[value] = _categories(product['category']) if product else []
+        return tags
+
+    def _sync(self):
+        """Drop the entries that read anything changed since the last read"""
+        store = self.store
+        current = store.changes()
+        versions = store.section_versions
+        with self._pending_lock:
+            pending, overflow = self._pending, self._overflow
+            # Commits after `current` are applied on the next read
+            self._pending = [batch for batch in pending if batch[0] > current]
+            self._overflow = False
+        seen = self._seen
+        if current == seen and not overflow:
+            return
+        self._seen = current
+        moved = [section for section in SECTIONS if versions[section] > seen]
+        batches = [skus for version, skus in pending if seen < version <= current]
+        self._invalidate(moved)
+        # Every version step since the last read is a noted movement: drop
+        # just their SKUs and categories
+        if not overflow and len({version for version, _ in pending
+                                 if seen < version <= current}) == current - seen:
+            tags = set()
+            for skus in batches:
+                for value in skus:
+                    tags.add(sku(value))
+                    tags.update(self._category_tags(value))
+            self._invalidate(tags)
+            return
+        # Something else changed too: which SKUs it touched is unknown
+        if PRODUCTS in moved:
+            self._categories = {}
+        if PRODUCTS in moved or STOCK in moved or TRANSACTIONS in moved or overflow:
+            self._invalidate([tag for tag in self._tags if not isinstance(tag, str)])
+
+    # Statistics
+
+    def stats(self):
+        """Hit / miss and eviction counts, entries and estimated bytes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Cycle-Count Reconciliation
+Turns a physical count upload into one batch of adjustment movements.
+
+A count file has one line per counted SKU:
+
+    sku,counted,counted_at
+    PLM001,48,2026-10-19 07:30:00
+    PLM002,97,2026-10-19 07:42:10
+
+(the header is optional; counted_at may be left out for the time given
+to read_counts, by default now). Counting takes a while and the shop
+keeps selling, so each SKU is compared with its level *as of its count
+time*: the current level minus the movements recorded after that time.
+Movements stamped in the same second as the count are taken to have
+happened before it. The variance (counted - expected) is then booked
+as an IN or OUT adjustment; booked now, it brings the SKU to its counted
+level plus whatever moved since the count.
+
+The join is done in numpy rather than per row: count SKUs are matched
+to the catalogue with one sort and a binary search, and the movements
+since the earliest count time are grouped by (SKU, time) and summed
+with a cumulative sum, so each count row finds the units moved after it
+with two more binary searches. Half a million count lines take a few
+seconds, most of it reading the file.
+
+    sheet = read_counts(open("counts.csv"))
+    result = reconcile(store, sheet)
+    print(result.summary())
+    result.apply(store)          # one apply_movements batch
+"""
+
+import csv
+from datetime import datetime
+from operator import itemgetter
+
+import numpy as np
+
+from valuation import from_cents
+
+PAGE_SIZE = 10000
+
+# Accepted header names of the sku, counted and counted_at columns
+COLUMNS = (("sku",), ("counted", "quantity", "count"), ("counted_at", "timestamp", "time"))
+
+_sku = itemgetter('sku')
+_quantity = itemgetter('quantity')
+_timestamp = itemgetter('timestamp')
+
+
+class CountSheet:
+    """Counted quantities of one upload, as columns"""
+
+    def __init__(self, skus, counted, counted_at, errors=()):
+        self.skus = skus
+        self.counted = counted
+        # numpy datetime64[s]
+        self.counted_at = counted_at
+        # (line number, message) of rejected lines
+        self.errors = list(errors)
+
+    def __len__(self):
+        return len(self.skus)
+
+    @classmethod
+    def from_rows(cls, rows, counted_at=None):
+        """Sheet from (sku, counted[, counted_at]) tuples"""
+        return _parse(([str(value) for value in row] for row in rows), counted_at, header=False)
+
+
+def read_counts(lines, counted_at=None, header=None):
+    """CountSheet from the lines of a CSV count file
+
+    With header None, a first line naming an sku column is a header.
+    """
+    return _parse(csv.reader(lines), counted_at, header)
+
+
+def _column(names, aliases):
+    return next((names.index(name) for name in aliases if name in names), None)
+
+
+def _parse(rows, counted_at, header):
+    default = str(counted_at or datetime.now().replace(microsecond=0))
+    columns = (0, 1, 2)
+    skus, counted, times, numbers, errors = [], [], [], [], []
+    for number, row in enumerate(rows, 1):
+        if not row or not "".join(row).strip() or row[0].startswith("#"):
+            continue
+        if number == 1 and header is not False:
+            names = [name.strip().lower() for name in row]
+            if header or "sku" in names:
+                columns = tuple(_column(names, aliases) for aliases in COLUMNS)
+                if columns[0] is None or columns[1] is None:
+                    raise ValueError("Count file header needs sku and counted columns")
+                continue
+        try:
+            sku = row[columns[0]].strip()
+            quantity = int(row[columns[1]])
+        except (IndexError, ValueError):
+            errors.append((number, f"expected SKU,COUNTED[,COUNTED_AT], got {','.join(row)!r}"))
+            continue
+        if not sku or quantity < 0:
+            errors.append((number, f"invalid count {','.join(row)!r}"))
+            continue
+        when = row[columns[2]].strip() if columns[2] is not None and len(row) > columns[2] else ""
+        skus.append(sku)
+        counted.append(quantity)
+        times.append(when or default)
+        numbers.append(number)
+    try:
+        stamps = np.array(times, dtype='datetime64[s]')
+    except ValueError:
+        # Find the bad timestamps (rare) row by row
+        stamps, keep = [], []
+        for index, when in enumerate(times):
+            try:
+                stamps.append(np.datetime64(when, 's'))
+                keep.append(index)
+            except ValueError:
+                errors.append((numbers[index], f"invalid count time {when!r}"))
+        skus = [skus[index] for index in keep]
+        counted = [counted[index] for index in keep]
+        stamps = np.array(stamps, dtype='datetime64[s]')
+    return CountSheet(skus, np.array(counted, np.int64), stamps, errors)
+
+
+class Reconciliation:
+    """Expected and counted levels of the matched SKUs of one count sheet"""
+
+    def __init__(self, skus, expected, counted, counted_at, prices, unknown, errors):
+        self.skus = skus
+        self.expected = expected
+        self.counted = counted
+        self.counted_at = counted_at
+        self.prices = prices
+        self.unknown = unknown
+        self.errors = errors
+        self.variance = counted - expected
+
+    def __len__(self):
+        """Number of adjustments"""
+        return int(np.count_nonzero(self.variance))
+
+    def lines(self, all_lines=False):
+        """(sku, expected, counted, variance) of the SKUs with a variance (or all)"""
+        rows = np.arange(len(self.skus)) if all_lines else np.flatnonzero(self.variance)
+        skus = self.skus
+        return [(skus[row], expected, counted, variance)
+                for row, expected, counted, variance in zip(
+                    rows.tolist(), self.expected[rows].tolist(), self.counted[rows].tolist(),
+                    self.variance[rows].tolist())]
+
+    def movements(self, notes="Cycle count"):
+        """Adjustment movements (sku, type, quantity, notes) for apply_movements"""
+        rows = np.flatnonzero(self.variance)
+        times = np.datetime_as_string(self.counted_at[rows], unit='s')
+        return [(self.skus[row], 'IN' if variance > 0 else 'OUT', abs(variance),
+                 f"{notes} {when.replace('T', ' ')}: counted {counted}, expected {expected}")
+                for row, variance, counted, expected, when in zip(
+                    rows.tolist(), self.variance[rows].tolist(), self.counted[rows].tolist(),
+                    self.expected[rows].tolist(), times.tolist())]
+
+    def apply(self, store, notes="Cycle count", atomic=False):
+        """Book the adjustments as one batch; returns apply_movements' results
+
+        A store with a notifier (notifications.py) also publishes the count.
+        """
+        movements = self.movements(notes)
+        results = store.apply_movements(movements, atomic) if movements else []
+        if store.notifier is not None:
+            store.notifier.reconciliation(self, results)
+        return results
+
+    def summary(self):
+        """Totals of the reconciliation"""
+        variance = self.variance
+        cents = np.rint(self.prices * 100).astype(np.int64)
+        return {
+            'counted': len(self.skus),
+            'unknown': len(self.unknown),
+            'errors': len(self.errors),
+            'adjustments': len(self),
+            'units_in': int(variance[variance > 0].sum()),
+            'units_out': int(-variance[variance < 0].sum()),
+            'value': from_cents(int((variance * cents).sum())),
+        }
+
+
+def _join(order, ordered, values):
+    """Positions of values in the catalogue (-1 if absent), by binary search
+
+    order sorts the catalogue's SKUs and ordered is them sorted.
+    """
+    if not len(ordered):
+        return np.full(len(values), -1, np.int64)
+    found = np.searchsorted(ordered, values)
+    np.minimum(found, len(ordered) - 1, out=found)
+    positions = order[found]
+    positions[ordered[found] != values] = -1
+    return positions
+
+
+def _movements_since(store, start, last_id):
+    """SKUs, times and signed quantities of the movements at or after start,
+    up to transaction last_id"""
+    skus, times, quantities = [], [], []
+    before_id = last_id + 1
+    while True:
+        page = store.query_transactions(start=start, before_id=before_id, limit=PAGE_SIZE)
+        skus.extend(map(_sku, page))
+        times.extend(map(_timestamp, page))
+        quantities.extend(record['quantity'] if record['type'] == 'IN' else -record['quantity']
+                          for record in page)
+        if len(page) < PAGE_SIZE:
+            break
+        before_id = page[-1]['id']
+    return skus, np.array(times, dtype='datetime64[s]'), np.array(quantities, np.int64)
+
+
+def reconcile(store, sheet):
+    """Reconciliation of a CountSheet against the store's levels at the count times
+
+    A SKU counted more than once keeps its latest count. SKUs that are
+    not in the catalogue are listed in `unknown` and not adjusted.
+    """
+    # Levels and the last transaction id from one snapshot, so a movement
+    # committed meanwhile is in neither
+    with store.snapshot() as snapshot:
+        products = snapshot.products()
+        last_id = snapshot.transaction_count()
+    catalogue = np.array(list(map(_sku, products)))
+    on_hand = np.fromiter(map(_quantity, products), np.int64, len(products))
+    prices = np.fromiter(map(itemgetter('price'), products), np.float64, len(products))
+
+    counted_skus = np.array(sheet.skus) if len(sheet) else np.array([], catalogue.dtype)
+    order = np.argsort(catalogue, kind='stable')
+    ordered = catalogue[order]
+    positions = _join(order, ordered, counted_skus)
+    unknown = sorted(set(counted_skus[positions < 0].tolist()))
+
+    # Latest count per SKU: order by (position, time, line), keep each group's last
+    rows = np.flatnonzero(positions >= 0)
+    rows = rows[np.lexsort((rows, sheet.counted_at[rows], positions[rows]))]
+    if len(rows):
+        grouped = positions[rows]
+        rows = rows[np.append(grouped[1:] != grouped[:-1], True)]
+    positions = positions[rows]
+    counted_at = sheet.counted_at[rows]
+    counted = sheet.counted[rows]
+
+    expected = on_hand[positions]
+    if len(rows):
+        earliest = counted_at.min()
+        start = str(earliest).replace('T', ' ')
+        moved_skus, moved_at, moved = _movements_since(store, start, last_id)
+        if len(moved):
+            # Units moved after each count: sums over (position, time) keys
+            # past the count's own key, up to the end of its position
+            moved_positions = _join(order, ordered, np.array(moved_skus))
+            known = moved_positions >= 0
+            base = earliest.astype(np.int64)
+            span = int(max(moved_at.max(), counted_at.max()).astype(np.int64)) - base + 2
+            keys = moved_positions[known] * span + (moved_at[known].astype(np.int64) - base)
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            totals = np.concatenate(([0], np.cumsum(moved[known][order])))
+            count_keys = positions * span + (counted_at.astype(np.int64) - base)
+            after = (totals[np.searchsorted(keys, (positions + 1) * span, 'left')]
+                     - totals[np.searchsorted(keys, count_keys, 'right')])
+            expected = expected - after
+    skus = counted_skus[rows].tolist()
+    return Reconciliation(skus, expected, counted, counted_at, prices[positions], unknown,
+                          list(sheet.errors))
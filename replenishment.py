@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Replenishment Planner
+Proposes consolidated purchase orders for every SKU in one pass.
+
+For each SKU the planner combines, as numpy columns over the catalogue:
+
+    on hand      current stock
+    inbound      units on open purchase orders
+    demand       OUT units over the last `window_days`, as a daily rate
+    rules        supplier lead / review days and minimum order (Supplier),
+                 and per-product attributes: supplier, case_pack (or
+                 pack_size) and min_order_qty
+
+and reorders when the inventory position (on hand + inbound) falls below
+the reorder point: demand over lead time plus `safety_days`, and never
+below LOW_STOCK_THRESHOLD. The order brings the position up to the
+target level (reorder point plus demand over the review period), raised
+to the SKU's minimum and rounded up to whole cases.
+
+Lines are consolidated into one proposal per supplier. A proposal below
+the supplier's minimum order value or units is held back ("below
+minimum") unless one of its SKUs would run out within the lead time.
+
+The planner follows its store: after build(), replan() folds in only
+what changed. Committed movements (Store.subscribe) update on hand and
+demand of the SKUs they touched, which are re-planned alone; product,
+attribute or order changes reload those columns. The demand window only
+slides on build(), so rebuild once a day.
+
+    planner = Planner(store, {"Acme Farms": Supplier(lead_days=5, min_order_value=250)})
+    plan = planner.build()
+    for proposal in plan:
+        print(proposal)
+    plan.create_orders(OrderBook(store))
+"""
+
+import json
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import repeat
+from operator import itemgetter
+
+import numpy as np
+
+from orders import PURCHASE
+from storage import LOW_STOCK_THRESHOLD, ORDERS, PRODUCTS
+from valuation import from_cents
+
+UNASSIGNED = "Unassigned"
+PAGE_SIZE = 10000
+
+
+class Supplier:
+    """Ordering rules of one supplier"""
+
+    def __init__(self, lead_days=7, review_days=7, min_order_value=0, min_units=0):
+        self.lead_days = lead_days
+        self.review_days = review_days
+        self.min_order_value = Decimal(str(min_order_value))
+        self.min_units = min_units
+
+
+class Proposal:
+    """Suggested purchase order for one supplier"""
+
+    def __init__(self, supplier, lines, value, urgent, below_minimum):
+        self.supplier = supplier
+        # (sku, quantity, unit cost) tuples
+        self.lines = lines
+        self.value = value
+        self.urgent = urgent
+        self.below_minimum = below_minimum
+
+    @property
+    def units(self):
+        return sum(quantity for _, quantity, _ in self.lines)
+
+    @property
+    def status(self):
+        return "below minimum" if self.below_minimum else "ready"
+
+    def __str__(self):
+        flags = " URGENT" if self.urgent else ""
+        return (f"{self.supplier}: {len(self.lines)} lines, {self.units} units, "
+                f"${self.value:,.2f} ({self.status}){flags}")
+
+
+class Plan:
+    """Proposals of one planning run, by supplier"""
+
+    def __init__(self, proposals, planned_at):
+        self.proposals = proposals
+        self.planned_at = planned_at
+
+    def __iter__(self):
+        return iter(self.proposals)
+
+    def __len__(self):
+        return len(self.proposals)
+
+    def ready(self):
+        return [proposal for proposal in self.proposals if not proposal.below_minimum]
+
+    def create_orders(self, book, include_below_minimum=False):
+        """Create open purchase orders for the proposals through an OrderBook
+
+        Returns one (success, message, order) per proposal ordered.
+        """
+        results = []
+        for proposal in self.proposals:
+            if proposal.below_minimum and not include_below_minimum:
+                continue
+            results.append(book.purchase(
+                proposal.supplier,
+                [(sku, quantity, unit_cost) for sku, quantity, unit_cost in proposal.lines],
+                notes=f"Replenishment plan {self.planned_at:%Y-%m-%d %H:%M}"))
+        return results
+
+
+class Planner:
+    """Vectorized reorder computation over every SKU of a store
+
+    Not thread-safe; keep one planner per thread (or per Streamlit session).
+    """
+
+    def __init__(self, store, suppliers=None, window_days=28, safety_days=3,
+                 min_level=LOW_STOCK_THRESHOLD, default_supplier=None):
+        self.store = store
+        self.suppliers = dict(suppliers or {})
+        self.default_supplier = default_supplier or Supplier()
+        self.window_days = window_days
+        self.safety_days = safety_days
+        self.min_level = min_level
+        self.skus = []
+        self._index = {}
+        self._versions = (None, None)
+        self._last_id = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        store.subscribe(self._on_commit)
+
+    def _on_commit(self, records):
+        # Writer thread: only hand the records over; replan() applies them
+        with self._lock:
+            self._pending.append(records)
+
+    def close(self):
+        """Stop following the store's commits"""
+        self.store.unsubscribe(self._on_commit)
+
+    def _rules(self, name):
+        return self.suppliers.get(name, self.default_supplier)
+
+    # Loading columns
+
+    def _load_products(self):
+        store = self.store
+        products = store.products()
+        attributes = store.all_attributes()
+        n = len(products)
+        self.skus = list(map(itemgetter('sku'), products))
+        self._index = dict(zip(self.skus, range(n)))
+        self.on_hand = np.fromiter(map(itemgetter('quantity'), products), np.int64, n)
+        # Unit cost estimate: the price, in cents (like an IN without a cost)
+        prices = np.fromiter(map(itemgetter('price'), products), np.float64, n)
+        self.cost = np.rint(prices * 100).astype(np.int64)
+        self.names = [UNASSIGNED]
+        supplier_ids = {UNASSIGNED: 0}
+        supplier = np.zeros(n, np.int64)
+        case = np.ones(n, np.int64)
+        moq = np.zeros(n, np.int64)
+        for sku, values in attributes.items():
+            position = self._index.get(sku)
+            if position is None:
+                continue
+            name = values.get('supplier')
+            if name:
+                name = str(name)
+                if name not in supplier_ids:
+                    supplier_ids[name] = len(self.names)
+                    self.names.append(name)
+                supplier[position] = supplier_ids[name]
+            case[position] = max(1, _integer(values.get('case_pack', values.get('pack_size')), 1))
+            moq[position] = max(0, _integer(values.get('min_order_qty'), 0))
+        self.supplier = supplier
+        self.case = case
+        self.moq = moq
+        rules = [self._rules(name) for name in self.names]
+        self.lead_days = np.array([rule.lead_days for rule in rules], np.float64)
+        self.review_days = np.array([rule.review_days for rule in rules], np.float64)
+
+    def _load_inbound(self):
+        inbound = np.zeros(len(self.skus), np.int64)
+        skus, quantities = [], []
+        for order in self.store.orders():
+            if order['kind'] == PURCHASE and order['status'] == 'open':
+                for line in order['lines']:
+                    position = self._index.get(line['sku'])
+                    if position is not None:
+                        skus.append(position)
+                        quantities.append(line['quantity'])
+        if skus:
+            np.add.at(inbound, np.array(skus, np.int64), np.array(quantities, np.int64))
+        self.inbound = inbound
+
+    def _load_demand(self, now):
+        """OUT units per SKU since the start of the window, through the store's query index"""
+        store = self.store
+        start = f"{now - timedelta(days=self.window_days):%Y-%m-%d %H:%M:%S}"
+        skus, quantities = [], []
+        self._last_id = store.transaction_count()
+        before_id = self._last_id + 1
+        while True:
+            page = store.query_transactions('OUT', start=start, before_id=before_id, limit=PAGE_SIZE)
+            skus.extend(map(itemgetter('sku'), page))
+            quantities.extend(map(itemgetter('quantity'), page))
+            if len(page) < PAGE_SIZE:
+                break
+            before_id = page[-1]['id']
+        positions = np.fromiter(map(self._index.get, skus, repeat(-1)), np.int64, len(skus))
+        known = positions >= 0
+        self.demand = np.bincount(positions[known],
+                                  weights=np.array(quantities, np.float64)[known],
+                                  minlength=len(self.skus))
+
+    # Planning
+
+    def build(self, now=None):
+        """Load every column from the store and plan all SKUs"""
+        with self._lock:
+            self._pending = []
+        store = self.store
+        self._versions = (store.changes(PRODUCTS), store.changes(ORDERS))
+        self.now = now or datetime.now()
+        self._load_products()
+        self._load_inbound()
+        self._load_demand(self.now)
+        self.quantity = np.zeros(len(self.skus), np.int64)
+        self.urgent = np.zeros(len(self.skus), bool)
+        self._plan(slice(None))
+        return self.plan()
+
+    def _plan(self, rows):
+        """Order quantities of the given rows (a slice or index array)"""
+        supplier = self.supplier[rows]
+        lead = self.lead_days[supplier]
+        rate = self.demand[rows] / self.window_days
+        position = self.on_hand[rows] + self.inbound[rows]
+        reorder_point = np.maximum(self.min_level, np.ceil(rate * (lead + self.safety_days)))
+        target = reorder_point + np.ceil(rate * self.review_days[supplier])
+        need = position < reorder_point
+        quantity = np.where(need, np.maximum(target - position, self.moq[rows]), 0).astype(np.int64)
+        case = self.case[rows]
+        self.quantity[rows] = -(-quantity // case) * case
+        # Would run out before an order placed now arrives
+        self.urgent[rows] = need & (position <= np.ceil(rate * lead))
+
+    def replan(self, now=None):
+        """Fold in changes since the last plan and re-plan only what they touched"""
+        store = self.store
+        versions = (store.changes(PRODUCTS), store.changes(ORDERS))
+        if versions[0] != self._versions[0]:
+            return self.build(now)
+        touched = set()
+        if versions[1] != self._versions[1]:
+            old = self.inbound
+            self._load_inbound()
+            touched.update(np.flatnonzero(old != self.inbound).tolist())
+        self._versions = versions
+        with self._lock:
+            pending, self._pending = self._pending, []
+        index = self._index
+        for records in pending:
+            for record in records:
+                if record['id'] <= self._last_id:
+                    continue
+                position = index.get(record['sku'])
+                if position is None:
+                    continue
+                touched.add(position)
+                if record['type'] == 'OUT':
+                    self.demand[position] += record['quantity']
+            self._last_id = max(self._last_id, records[-1]['id'])
+        if touched:
+            rows = np.fromiter(touched, np.int64, len(touched))
+            for position in rows.tolist():
+                product = store.get_product(self.skus[position])
+                if product is not None:
+                    self.on_hand[position] = product['quantity']
+            self._plan(rows)
+        return self.plan()
+
+    def plan(self):
+        """Proposals from the current order quantities, consolidated by supplier"""
+        rows = np.flatnonzero(self.quantity)
+        if not len(rows):
+            return Plan([], self.now)
+        supplier = self.supplier[rows]
+        rows = rows[np.argsort(supplier, kind='stable')]
+        supplier = self.supplier[rows]
+        quantity = self.quantity[rows]
+        value = quantity * self.cost[rows]
+        urgent = self.urgent[rows]
+        bounds = np.flatnonzero(np.diff(supplier)) + 1
+        proposals = []
+        for group in np.split(np.arange(len(rows)), bounds):
+            name = self.names[supplier[group[0]]]
+            rule = self._rules(name)
+            total = from_cents(int(value[group].sum()))
+            units = int(quantity[group].sum())
+            below = total < rule.min_order_value or units < rule.min_units
+            lines = [(self.skus[row], int(units_), from_cents(int(cents)))
+                     for row, units_, cents in zip(rows[group].tolist(), quantity[group].tolist(),
+                                                   self.cost[rows[group]].tolist())]
+            proposals.append(Proposal(name, lines, total, bool(urgent[group].any()),
+                                      below and not urgent[group].any()))
+        return Plan(proposals, self.now)
+
+    def line(self, sku):
+        """Planning figures of one SKU, or None"""
+        position = self._index.get(sku)
+        if position is None:
+            return None
+        supplier = self.supplier[position]
+        return {
+            'sku': sku,
+            'supplier': self.names[supplier],
+            'on_hand': int(self.on_hand[position]),
+            'inbound': int(self.inbound[position]),
+            'daily_demand': float(self.demand[position] / self.window_days),
+            'lead_days': float(self.lead_days[supplier]),
+            'case_pack': int(self.case[position]),
+            'order_quantity': int(self.quantity[position]),
+            'urgent': bool(self.urgent[position]),
+        }
+
+
+def _integer(value, default):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def load_suppliers(path):
+    """{name: Supplier} from a JSON file of {name: {lead_days, review_days, ...}}"""
+    with open(path, encoding="utf-8") as f:
+        return {name: Supplier(**rules) for name, rules in json.load(f).items()}
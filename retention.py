@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Tiered Retention
+Compacts old transactions out of the store into warm and cold tiers.
+
+    hot   raw movements of the last `hot_days` days, in the store
+    warm  per-SKU daily summaries: IN/OUT counts, units and IN cost
+    cold  the raw movements themselves, in compressed segments of the
+          binary wire format (wire.py), for audits and drill-down
+
+compact() moves every transaction older than the hot window: it writes
+the cold segment and the warm summaries, records them in the manifest,
+and only then drops the transactions from the store. The manifest is
+replaced atomically, so an interrupted compaction is finished (or
+redone) by the next one, once the store's own compacted offset shows it
+is the store the tiers were cut from; each warm day notes the last id merged into it,
+so redoing one never counts a movement twice. Memory and disk use of the store then grow
+with SKUs x days instead of with the number of movements; the cold
+tier is compressed and only read on demand.
+
+Queries span all tiers, through the store itself once attached:
+Store.get_transactions / query_transactions / count_transactions
+continue from the store into the cold segments (counts use the warm
+summaries when no notes text or partial days are involved), and daily()
+merges warm summaries with the hot movements.
+
+Layout of the retention directory:
+
+    manifest.json                       compacted_upto and segment list
+    warm/YYYY-MM-DD.json                {upto: last id merged,
+                                         skus: {sku: [ins, in_units, outs, out_units, in_cost]}}
+    cold/<first id>-<last id>.plw.gz    wire stream of the raw records
+
+Attach to the default store with PLUMBERRY_RETENTION=<directory> (and
+PLUMBERRY_HOT_DAYS, default 30).
+"""
+
+import gzip
+import json
+import os
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+import wire
+
+HOT_DAYS = 30
+SEGMENT_SIZE = 100000
+
+# Warm summary slots
+INS, IN_UNITS, OUTS, OUT_UNITS, IN_COST = range(5)
+
+
+class Retention:
+    """Hot / warm / cold tiers of one store's transaction history"""
+
+    def __init__(self, store, directory, hot_days=HOT_DAYS, segment_size=SEGMENT_SIZE):
+        self.store = store
+        self.directory = directory
+        self.hot_days = hot_days
+        self.segment_size = segment_size
+        os.makedirs(os.path.join(directory, "warm"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "cold"), exist_ok=True)
+        self.manifest = {'compacted_upto': 0, 'segments': []}
+        path = os.path.join(directory, "manifest.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        self._segment_cache = (None, None)
+        self._unfinished()
+
+    @classmethod
+    def attach(cls, store, directory, hot_days=HOT_DAYS):
+        """Create the tiers and make the store's transaction queries read through them"""
+        retention = cls(store, directory, hot_days)
+        store.retention = retention
+        return retention
+
+    @property
+    def segments(self):
+        return self.manifest['segments']
+
+    # Compaction
+
+    def cutoff(self, now=None):
+        """Timestamp before which transactions leave the hot tier"""
+        today = (now or datetime.now()).date()
+        return f"{today - timedelta(days=self.hot_days)} 00:00:00"
+
+    def compact(self, now=None):
+        """Move transactions older than the hot window to the warm and cold tiers
+
+        Returns the number of transactions compacted.
+        """
+        store = self.store
+        # Finish a compaction that was archived but not yet dropped
+        if self._unfinished():
+            store.drop_transactions(self.manifest['compacted_upto'])
+
+        cutoff = self.cutoff(now)
+        moved = 0
+        while True:
+            first_id = store.first_transaction_id()
+            records = store.get_transactions(first_id, first_id + self.segment_size - 1)
+            # The log is in time order: stop at the first hot transaction
+            old = _prefix(records, cutoff)
+            if not old:
+                return moved
+            self._archive(old)
+            store.drop_transactions(old[-1]['id'])
+            moved += len(old)
+            if len(old) < len(records) or len(records) < self.segment_size:
+                return moved
+
+    def _unfinished(self):
+        """Whether the last archived segment is still to be dropped from the store
+
+        The store keeps its own compacted offset (first_transaction_id);
+        it must be where the manifest ends, or at the start of the last
+        segment if a compaction stopped between archiving and dropping.
+        Anything else is a store that does not belong to these tiers
+        (say a fresh in-memory store), which is refused with ValueError
+        rather than truncated.
+        """
+        store = self.store
+        upto = self.manifest['compacted_upto']
+        first_id = store.first_transaction_id()
+        if first_id == upto + 1:
+            return False
+        if (self.segments and first_id == self.segments[-1]['first_id']
+                and store.transaction_count() >= upto
+                and _same(self.archived(upto, upto), store._transaction_range(upto, upto))):
+            return True
+        raise ValueError(f"Retention {self.directory} holds transactions up to {upto} but the "
+                         f"store's oldest transaction is {first_id}: not the same history")
+
+    def _archive(self, records):
+        first_id, last_id = records[0]['id'], records[-1]['id']
+        name = f"{first_id:012d}-{last_id:012d}.plw.gz"
+        path = os.path.join(self.directory, "cold", name)
+        with gzip.open(path + ".tmp", "wb") as f:
+            with wire.WireWriter(f) as writer:
+                writer.write_movements(records)
+        os.replace(path + ".tmp", path)
+
+        days = {}
+        for record in records:
+            days.setdefault(record['timestamp'][:10], []).append(record)
+        for day, day_records in days.items():
+            # A day can span two segments: merge into what is there, skipping
+            # the ids it already holds if this compaction is being redone
+            warm = self._warm(day)
+            for record in day_records:
+                if record['id'] > warm['upto']:
+                    _summarize(warm['skus'], record)
+            warm['upto'] = max(warm['upto'], day_records[-1]['id'])
+            _write_json(os.path.join(self.directory, "warm", f"{day}.json"), warm)
+
+        self.segments.append({'file': name, 'first_id': first_id, 'last_id': last_id,
+                              'first_time': records[0]['timestamp'],
+                              'last_time': records[-1]['timestamp'], 'count': len(records)})
+        self.manifest['compacted_upto'] = last_id
+        _write_json(os.path.join(self.directory, "manifest.json"), self.manifest)
+
+    # Cold tier
+
+    def _segment(self, index):
+        """Records of one cold segment (the last one read is cached)"""
+        if self._segment_cache[0] != index:
+            path = os.path.join(self.directory, "cold", self.segments[index]['file'])
+            with gzip.open(path, "rb") as f:
+                data = f.read()
+            self._segment_cache = (index, [record for frame in wire.read_frames(data)
+                                           for record in frame])
+        return self._segment_cache[1]
+
+    def archived(self, first_id, last_id):
+        """Compacted transactions with first_id <= id <= last_id, in id order"""
+        result = []
+        starts = [segment['first_id'] for segment in self.segments]
+        index = max(0, bisect_right(starts, first_id) - 1)
+        while index < len(self.segments) and self.segments[index]['first_id'] <= last_id:
+            segment = self.segments[index]
+            records = self._segment(index)
+            result.extend(records[max(0, first_id - segment['first_id']):
+                                  last_id - segment['first_id'] + 1])
+            index += 1
+        return result
+
+    # Queries across tiers
+
+    def transactions(self, first_id, last_id):
+        """Raw transactions from any tier, in id order"""
+        return self.store.get_transactions(first_id, last_id)
+
+    def query(self, where, before_id, limit):
+        """A page of the store's matching transactions, continuing into the cold segments"""
+        result = self.store._query_transactions(where, before_id, limit)
+        if len(result) == limit:
+            return result
+        for index in range(len(self.segments) - 1, -1, -1):
+            segment = self.segments[index]
+            if before_id is not None and segment['first_id'] >= before_id:
+                continue
+            if (where.start and segment['last_time'] < where.start
+                    or where.end and segment['first_time'] > where.end):
+                continue
+            for record in reversed(self._segment(index)):
+                if (before_id is None or record['id'] < before_id) and where.matches(record):
+                    result.append(record)
+                    if len(result) == limit:
+                        return result
+        return result
+
+    def count(self, where):
+        """Number of matching transactions in the store and every tier"""
+        count = self.store._count_transactions(where)
+        start, end = where.start, where.end
+        whole_days = ((not start or start.endswith("00:00:00"))
+                      and (not end or end.endswith("23:59:59")))
+        if where.text is None and whole_days:
+            # Warm summaries answer type / SKU / whole-day filters
+            slots = {'IN': (INS,), 'OUT': (OUTS,), None: (INS, OUTS)}[where.trans_type]
+            for day in self.days(start and start[:10], end and end[:10]):
+                summaries = self.warm_day(day)
+                rows = [summaries.get(where.sku)] if where.sku else summaries.values()
+                count += sum(row[slot] for row in rows if row for slot in slots)
+            return count
+        for index, segment in enumerate(self.segments):
+            if (where.start and segment['last_time'] < where.start
+                    or where.end and segment['first_time'] > where.end):
+                continue
+            count += sum(1 for record in self._segment(index) if where.matches(record))
+        return count
+
+    # Warm tier
+
+    def days(self, start=None, end=None):
+        """Dates (YYYY-MM-DD) with warm summaries, oldest first"""
+        names = sorted(name[:-5] for name in os.listdir(os.path.join(self.directory, "warm"))
+                       if name.endswith(".json"))
+        return [day for day in names if (not start or day >= start) and (not end or day <= end)]
+
+    def warm_day(self, day):
+        """{sku: [ins, in_units, outs, out_units, in_cost cents]} of one compacted day"""
+        return self._warm(day)['skus']
+
+    def _warm(self, day):
+        path = os.path.join(self.directory, "warm", f"{day}.json")
+        if not os.path.exists(path):
+            return {'upto': 0, 'skus': {}}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def daily(self, sku=None, start=None, end=None):
+        """Per-day, per-SKU movement totals across warm and hot tiers
+
+        start / end are dates (YYYY-MM-DD, inclusive). Returns rows
+        (day, sku, ins, in_units, outs, out_units, in_cost cents), by day
+        and SKU.
+        """
+        start = str(start) if isinstance(start, date) else start
+        end = str(end) if isinstance(end, date) else end
+        totals = {}
+        for day in self.days(start, end):
+            for key, summary in self.warm_day(day).items():
+                if sku is None or key == sku:
+                    totals[(day, key)] = list(summary)
+        store = self.store
+        hot = store.get_transactions(store.first_transaction_id(), store.transaction_count())
+        for record in hot:
+            day = record['timestamp'][:10]
+            if (sku is not None and record['sku'] != sku or start and day < start
+                    or end and day > end):
+                continue
+            summary = totals.get((day, record['sku']))
+            if summary is None:
+                summary = totals[(day, record['sku'])] = [0, 0, 0, 0, 0]
+            _add(summary, record)
+        return [(day, key, *summary) for (day, key), summary in sorted(totals.items())]
+
+    def stats(self):
+        """Sizes of the tiers"""
+        store = self.store
+        cold_bytes = sum(os.path.getsize(os.path.join(self.directory, "cold", segment['file']))
+                         for segment in self.segments)
+        return {
+            'hot': store.transaction_count() - store.first_transaction_id() + 1,
+            'warm_days': len(self.days()),
+            'cold': sum(segment['count'] for segment in self.segments),
+            'cold_segments': len(self.segments),
+            'cold_bytes': cold_bytes,
+        }
+
+
+def _summarize(summaries, record):
+    """Add a record to {sku: summary}"""
+    summary = summaries.get(record['sku'])
+    if summary is None:
+        summary = summaries[record['sku']] = [0, 0, 0, 0, 0]
+    _add(summary, record)
+
+
+def _add(summary, record):
+    if record['type'] == 'IN':
+        summary[INS] += 1
+        summary[IN_UNITS] += record['quantity']
+        summary[IN_COST] += record['quantity'] * (record.get('unit_cost') or 0)
+    else:
+        summary[OUTS] += 1
+        summary[OUT_UNITS] += record['quantity']
+
+
+def _same(archived, held):
+    """Whether an archived record and the store's record with its id are one movement"""
+    fields = ('sku', 'type', 'quantity', 'timestamp', 'uid')
+    return (len(archived) == len(held) == 1
+            and all(archived[0].get(field) == held[0].get(field) for field in fields))
+
+
+def _prefix(records, cutoff):
+    """Leading records older than the cutoff"""
+    for position, record in enumerate(records):
+        if record['timestamp'] >= cutoff:
+            return records[:position]
+    return records
+
+
+def _write_json(path, value):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(value, f, separators=(',', ':'))
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Sharded Ingestion
+Applies movement streams on several cores at once.
+
+A single store applies movements on one thread. ShardedIngest starts a
+pool of worker processes instead, each owning one shard: a store of its
+own (in memory, or a SQLite / key-value file per shard) holding the
+products whose SKU hashes to it, their stock levels and their log.
+
+    with ShardedIngest(shards=8) as engine:
+        engine.add_products(catalogue)
+        applied, failures = engine.ingest(movements)
+        results = engine.apply_movements(more)  # like Store.apply_movements
+
+Each chunk of the stream is partitioned by SKU (numpy argsort of the
+shard numbers) and every shard gets its part through a shared-memory
+ring buffer (one request and one response ring per worker, see Ring);
+the workers apply their parts concurrently. The next chunk is sent while
+workers are still busy with the last one, as long as it fits in the
+ring, so workers rarely wait for the parent.
+
+The parent's work per movement has to stay well below a worker's, or it
+caps the speed-up: parts travel marshalled (pickled only if they hold
+other types, such as Decimal costs), and ingest() only gathers back the
+applied count and the failures. apply_movements() returns a result per
+movement, at some extra cost in the parent.
+
+Movements of one SKU always go to the same shard, so per-SKU order and
+stock checks are the same as in a single store. atomic=True is
+all-or-nothing per shard, not across shards. Transaction ids count per
+shard; every record has a uid (ids.py), which orders and merges the
+shard logs.
+"""
+
+import marshal
+import os
+import pickle
+import struct
+import zlib
+from collections import deque
+from multiprocessing import get_context, shared_memory
+from operator import itemgetter
+
+import numpy as np
+
+import ids
+from storage import BACKENDS
+
+RING_SIZE = 1 << 22
+CHUNK_SIZE = 50000
+
+# Request kinds
+STOP, PRODUCTS, INGEST, MOVEMENTS, LEVELS, COUNTS, CATALOGUE, LOG = range(8)
+# Reply status
+OK, ERROR = range(2)
+
+
+def shard_of(sku, shards):
+    """Shard of a SKU (stable across processes, unlike hash())"""
+    return zlib.crc32(sku.encode()) % shards
+
+
+class Ring:
+    """Single-producer, single-consumer byte pipe in shared memory
+
+    Positions are running byte counts (write, read) at the start of the
+    segment; the data area wraps around. A lock guards the positions, so
+    data written before a position update is visible to the other side
+    after it reads the position. Semaphores wake a reader waiting for
+    data and a writer waiting for space. Messages are length-prefixed and
+    may be larger than the ring; they then stream through it.
+    """
+
+    POSITIONS = struct.Struct("<QQ")
+    POSITION = struct.Struct("<Q")
+    LENGTH = struct.Struct("<I")
+
+    def __init__(self, context, capacity=RING_SIZE):
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(create=True, size=self.POSITIONS.size + capacity)
+        self.POSITIONS.pack_into(self.shm.buf, 0, 0, 0)
+        self.lock = context.Lock()
+        self.data = context.Semaphore(0)
+        self.space = context.Semaphore(0)
+        self.owner = True
+
+    def __getstate__(self):
+        # Sent to a worker when it is started
+        return (self.shm.name, self.capacity, self.lock, self.data, self.space)
+
+    def __setstate__(self, state):
+        name, self.capacity, self.lock, self.data, self.space = state
+        # Workers share the parent's resource tracker; the parent unlinks
+        self.shm = shared_memory.SharedMemory(name)
+        self.owner = False
+
+    def _positions(self):
+        with self.lock:
+            return self.POSITIONS.unpack_from(self.shm.buf, 0)
+
+    def free(self):
+        written, read = self._positions()
+        return self.capacity - (written - read)
+
+    def write(self, data, alive):
+        """Write all of data, waiting for space while the reader catches up"""
+        view = memoryview(data)
+        buf = self.shm.buf
+        base = self.POSITIONS.size
+        while view:
+            written, read = self._positions()
+            free = self.capacity - (written - read)
+            if not free:
+                _wait(self.space, alive)
+                continue
+            take = min(free, len(view))
+            start = written % self.capacity
+            first = min(take, self.capacity - start)
+            buf[base + start:base + start + first] = view[:first]
+            if take > first:
+                buf[base:base + take - first] = view[first:take]
+            with self.lock:
+                self.POSITION.pack_into(buf, 0, written + take)
+            self.data.release()
+            view = view[take:]
+
+    def read(self, size, alive):
+        """Read exactly size bytes, waiting for the writer"""
+        out = bytearray(size)
+        buf = self.shm.buf
+        base = self.POSITIONS.size
+        done = 0
+        while done < size:
+            written, read = self._positions()
+            available = written - read
+            if not available:
+                _wait(self.data, alive)
+                continue
+            take = min(available, size - done)
+            start = read % self.capacity
+            first = min(take, self.capacity - start)
+            out[done:done + first] = buf[base + start:base + start + first]
+            if take > first:
+                out[done + first:done + take] = buf[base:base + take - first]
+            with self.lock:
+                self.POSITION.pack_into(buf, self.POSITION.size, read + take)
+            self.space.release()
+            done += take
+        return out
+
+    def write_message(self, payload, alive):
+        self.write(self.LENGTH.pack(len(payload)) + payload, alive)
+
+    def read_message(self, alive):
+        size, = self.LENGTH.unpack(self.read(self.LENGTH.size, alive))
+        return self.read(size, alive)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def encode(message):
+    """Message bytes: marshal when it can, else pickle"""
+    try:
+        return b"M" + marshal.dumps(message)
+    except ValueError:
+        return b"P" + pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+
+
+def decode(payload):
+    view = memoryview(payload)
+    return marshal.loads(view[1:]) if payload[0] == ord("M") else pickle.loads(view[1:])
+
+
+def _wait(semaphore, alive):
+    while not semaphore.acquire(timeout=0.5):
+        if not alive():
+            raise RuntimeError("Shard peer process exited")
+
+
+def _handle(store, message):
+    kind = message[0]
+    if kind == INGEST:
+        applied = 0
+        failures = []
+        for index, (ok, text) in enumerate(store.apply_movements(message[1], message[2])):
+            if ok:
+                applied += 1
+            else:
+                failures.append((index, text))
+        return applied, failures
+    if kind == MOVEMENTS:
+        results = store.apply_movements(message[1], message[2])
+        return [ok for ok, _ in results], [text for _, text in results]
+    if kind == PRODUCTS:
+        return store.add_products(message[1])
+    if kind == LEVELS:
+        return [store.get_stock_level(sku) for sku in message[1]]
+    if kind == CATALOGUE:
+        return store.products()
+    if kind == LOG:
+        return store.get_transactions(1, store.transaction_count())
+    return store.product_count(), store.transaction_count()
+
+
+def _serve(backend, path, requests, responses):
+    """Worker process: apply the requests of one shard to its own store"""
+    store = BACKENDS[backend](path)
+    parent = os.getppid()
+
+    def alive():
+        return os.getppid() == parent
+
+    try:
+        while True:
+            message = decode(requests.read_message(alive))
+            if message[0] == STOP:
+                return
+            try:
+                reply = (OK, _handle(store, message))
+            except Exception as e:
+                reply = (ERROR, f"{type(e).__name__}: {e}")
+            responses.write_message(encode(reply), alive)
+    finally:
+        store.close()
+        requests.close()
+        responses.close()
+
+
+class ShardedIngest:
+    """Pool of shard worker processes fed through shared-memory rings
+
+    backend / path select each shard's store like get_store; shard i of a
+    file backend uses "<path>.<i>". Not thread-safe: one thread drives the
+    engine.
+    """
+
+    def __init__(self, shards=None, backend="memory", path=None, ring_size=RING_SIZE,
+                 chunk_size=CHUNK_SIZE):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown storage backend '{backend}'. Choose from: {', '.join(BACKENDS)}")
+        self.shards = shards or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._shard_cache = {}
+        context = get_context("spawn")
+        self._requests = [Ring(context, ring_size) for _ in range(self.shards)]
+        self._responses = [Ring(context, ring_size) for _ in range(self.shards)]
+        # Callbacks for the replies still to be read, oldest first, per shard
+        self._pending = [deque() for _ in range(self.shards)]
+        self._workers = []
+        for index in range(self.shards):
+            shard_path = f"{path}.{index}" if path and backend != "memory" else None
+            worker = context.Process(target=_serve, name=f"plumberry-shard-{index}", daemon=True,
+                                     args=(backend, shard_path, self._requests[index],
+                                           self._responses[index]))
+            worker.start()
+            self._workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Messaging
+
+    def _send(self, shard, message, on_reply):
+        payload = encode(message)
+        ring = self._requests[shard]
+        # Only block on a full request ring when no reply is outstanding:
+        # the worker may itself be waiting for us to read its replies
+        while self._pending[shard] and ring.free() < len(payload) + Ring.LENGTH.size:
+            self._collect(shard)
+        ring.write_message(payload, self._workers[shard].is_alive)
+        self._pending[shard].append(on_reply)
+
+    def _collect(self, shard):
+        status, value = decode(self._responses[shard].read_message(self._workers[shard].is_alive))
+        on_reply = self._pending[shard].popleft()
+        if status == ERROR:
+            raise RuntimeError(f"Shard {shard}: {value}")
+        on_reply(value)
+
+    def _gather(self):
+        for shard in range(self.shards):
+            while self._pending[shard]:
+                self._collect(shard)
+
+    def _partition(self, items, key=0):
+        """[(shard, part, positions)] of a list of items, by the SKU at item[key]
+
+        Parts keep the input order; positions are numpy index arrays.
+        """
+        cache = self._shard_cache
+        try:
+            shards = [cache[item[key]] for item in items]
+        except KeyError:
+            for item in items:
+                if item[key] not in cache:
+                    cache[item[key]] = shard_of(item[key], self.shards)
+            shards = [cache[item[key]] for item in items]
+        shards = np.array(shards, dtype=np.intp)
+        order = np.argsort(shards, kind='stable')
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(shards, minlength=self.shards))))
+        parts = []
+        for shard in range(self.shards):
+            positions = order[bounds[shard]:bounds[shard + 1]]
+            if len(positions) == 1:
+                parts.append((shard, [items[positions[0]]], positions))
+            elif len(positions):
+                parts.append((shard, list(itemgetter(*positions.tolist())(items)), positions))
+        return parts
+
+    def _chunks(self, items):
+        items = items if isinstance(items, list) else list(items)
+        for start in range(0, len(items), self.chunk_size):
+            yield start, items[start:start + self.chunk_size]
+
+    # Operations
+
+    def add_products(self, products):
+        """Bulk-load (name, sku, category, price, quantity) rows into their shards
+
+        Returns the number of products added.
+        """
+        added = [0]
+
+        def count(value):
+            added[0] += value
+
+        for _, chunk in self._chunks(products):
+            for shard, part, _ in self._partition(chunk, key=1):
+                self._send(shard, (PRODUCTS, part), count)
+        self._gather()
+        return added[0]
+
+    def ingest(self, movements, atomic=False):
+        """Apply (sku, type, quantity, notes[, unit_cost]) movements across the shards
+
+        Returns (applied, failures): the number of movements applied and
+        (position, message) for each rejected one, by position.
+        """
+        applied = [0]
+        failures = []
+
+        def gather(positions):
+            def on_reply(reply):
+                applied[0] += reply[0]
+                failures.extend((int(positions[index]), text) for index, text in reply[1])
+            return on_reply
+
+        for start, chunk in self._chunks(movements):
+            for shard, part, positions in self._partition(chunk):
+                self._send(shard, (INGEST, part, atomic), gather(positions + start))
+        self._gather()
+        failures.sort()
+        return applied[0], failures
+
+    def apply_movements(self, movements, atomic=False):
+        """Like ingest, but one (success, message) tuple per movement, in input order"""
+        movements = movements if isinstance(movements, list) else list(movements)
+        flags = np.zeros(len(movements), dtype=bool)
+        messages = np.empty(len(movements), dtype=object)
+
+        def place(positions):
+            def on_reply(reply):
+                flags[positions] = reply[0]
+                messages[positions] = reply[1]
+            return on_reply
+
+        for start, chunk in self._chunks(movements):
+            for shard, part, positions in self._partition(chunk):
+                self._send(shard, (MOVEMENTS, part, atomic), place(positions + start))
+        self._gather()
+        return list(zip(flags.tolist(), messages.tolist()))
+
+    def stock_levels(self, skus):
+        """{sku: quantity} for the given SKUs (None for unknown SKUs)"""
+        levels = {}
+        for _, chunk in self._chunks((sku,) for sku in skus):
+            for shard, part, _ in self._partition(chunk):
+                names = [sku for sku, in part]
+                self._send(shard, (LEVELS, names),
+                           lambda values, names=names: levels.update(zip(names, values)))
+        self._gather()
+        return levels
+
+    def get_stock_level(self, sku):
+        return self.stock_levels([sku])[sku]
+
+    def counts(self):
+        """(products, transactions) held by each shard"""
+        counts = []
+        for shard in range(self.shards):
+            self._send(shard, (COUNTS,), lambda value: counts.append(tuple(value)))
+            self._gather()
+        return counts
+
+    def transaction_count(self):
+        return sum(transactions for _, transactions in self.counts())
+
+    def products(self):
+        """Products of every shard, shard by shard (ids count per shard)"""
+        products = []
+        for shard in range(self.shards):
+            self._send(shard, (CATALOGUE,), products.extend)
+            self._gather()
+        return products
+
+    def transactions(self):
+        """Transactions of every shard, merged in uid order (ids count per shard)"""
+        logs = [None] * self.shards
+
+        def keep(shard):
+            def on_reply(log):
+                logs[shard] = log
+            return on_reply
+
+        for shard in range(self.shards):
+            self._send(shard, (LOG,), keep(shard))
+        self._gather()
+        return list(ids.merge_logs(*logs))
+
+    def close(self):
+        """Stop the workers (they close their stores) and free the rings"""
+        if not self._workers:
+            return
+        for shard, worker in enumerate(self._workers):
+            if self._pending[shard]:
+                # Interrupted mid-request: the worker may be blocked on its replies
+                worker.terminate()
+            elif worker.is_alive():
+                self._requests[shard].write_message(encode((STOP,)), worker.is_alive)
+        for worker in self._workers:
+            worker.join()
+        for ring in self._requests + self._responses:
+            ring.close()
+        self._workers = []
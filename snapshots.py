@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Read Snapshots
+Immutable, versioned views of the inventory for reports and exports.
+
+The in-memory store keeps its products in a PersistentVector: a 32-way
+trie whose nodes are tagged with the "epoch" they were created in. Taking
+a snapshot just keeps a reference to the current root and starts a new
+epoch, which is O(1). Writers change nodes of the current epoch in place
+and copy a node (plus its path to the root) only the first time they
+touch it after a snapshot, so a long report never blocks add_stock /
+remove_stock and never sees half of a batch.
+"""
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+
+
+class _Node:
+    __slots__ = ('epoch', 'slots')
+
+    def __init__(self, epoch, slots=None):
+        self.epoch = epoch
+        self.slots = slots if slots is not None else [None] * WIDTH
+
+
+class PersistentVector:
+    """Append/set vector with O(1) frozen views (copy-on-write trie)"""
+
+    def __init__(self):
+        self.epoch = 0
+        self.root = _Node(0)
+        self.shift = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def get(self, index):
+        return _get(self.root, self.shift, index)
+
+    def set(self, index, value):
+        """Replace the value at index (index < len)"""
+        if self.root.epoch != self.epoch:
+            self.root = _Node(self.epoch, list(self.root.slots))
+        node = self.root
+        shift = self.shift
+        while shift:
+            slot = (index >> shift) & MASK
+            child = node.slots[slot]
+            if child is None:
+                child = node.slots[slot] = _Node(self.epoch)
+            elif child.epoch != self.epoch:
+                child = node.slots[slot] = _Node(self.epoch, list(child.slots))
+            node = child
+            shift -= BITS
+        node.slots[index & MASK] = value
+
+    def append(self, value):
+        if self.size == WIDTH << self.shift:
+            # Trie is full: grow one level
+            self.root = _Node(self.epoch, [self.root] + [None] * (WIDTH - 1))
+            self.shift += BITS
+        self.size += 1
+        self.set(self.size - 1, value)
+
+    def extend(self, values):
+        """Append many values; builds the trie bottom-up when empty"""
+        values = list(values)
+        if self.size or len(values) <= WIDTH:
+            for value in values:
+                self.append(value)
+            return
+        epoch = self.epoch
+        level = [_Node(epoch, _padded(values[i:i + WIDTH])) for i in range(0, len(values), WIDTH)]
+        shift = 0
+        while len(level) > 1:
+            level = [_Node(epoch, _padded(level[i:i + WIDTH])) for i in range(0, len(level), WIDTH)]
+            shift += BITS
+        self.root = level[0]
+        self.shift = shift
+        self.size = len(values)
+
+    def freeze(self):
+        """Pin the current contents; later writes copy instead of mutating"""
+        view = FrozenVector(self.root, self.shift, self.size)
+        self.epoch += 1
+        return view
+
+    def __iter__(self):
+        return _iter(self.root, self.shift, self.size)
+
+
+class FrozenVector:
+    """Read-only view of a PersistentVector at one point in time"""
+
+    __slots__ = ('root', 'shift', 'size')
+
+    def __init__(self, root, shift, size):
+        self.root = root
+        self.shift = shift
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def get(self, index):
+        return _get(self.root, self.shift, index)
+
+    def __iter__(self):
+        return _iter(self.root, self.shift, self.size)
+
+
+def _padded(slots):
+    if len(slots) < WIDTH:
+        slots.extend([None] * (WIDTH - len(slots)))
+    return slots
+
+
+def _get(node, shift, index):
+    while shift:
+        node = node.slots[(index >> shift) & MASK]
+        shift -= BITS
+    return node.slots[index & MASK]
+
+
+def _iter(root, shift, size):
+    """Yield the first `size` values in index order"""
+    if shift == 0:
+        yield from root.slots[:size]
+        return
+    span = 1 << shift
+    for i, child in enumerate(root.slots):
+        start = i * span
+        if start >= size:
+            return
+        yield from _iter(child, shift - BITS, min(span, size - start))
+
+
+class Snapshot:
+    """Consistent, read-only view of a store at one version
+
+    Use as a context manager so backends that hold resources for the
+    snapshot (e.g. an open SQLite read transaction) release them.
+    """
+
+    def __init__(self, version):
+        self.version = version
+
+    def products(self):
+        raise NotImplementedError
+
+    def get_product(self, sku):
+        raise NotImplementedError
+
+    def product_count(self):
+        return len(self.products())
+
+    def recent_transactions(self, limit=20):
+        raise NotImplementedError
+
+    def transaction_count(self):
+        raise NotImplementedError
+
+    def total_value(self):
+        """Inventory value (price * quantity) across all products"""
+        return sum(p['price'] * p['quantity'] for p in self.products())
+
+    def close(self):
+        """Release the snapshot"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class VectorSnapshot(Snapshot):
+    """Snapshot over a frozen PersistentVector and an append-only log"""
+
+    def __init__(self, version, vector, sku_index, transactions, length, first_id=1):
+        super().__init__(version)
+        self._vector = vector
+        self._sku_index = sku_index
+        # The log holds ids first_id .. first_id + length - 1
+        self._transactions = transactions
+        self._length = length
+        self._first_id = first_id
+
+    def products(self):
+        return list(self._vector)
+
+    def get_product(self, sku):
+        # The SKU index is append-only; ignore products added after the pin
+        position = self._sku_index.get(sku)
+        if position is None or position >= len(self._vector):
+            return None
+        return self._vector.get(position)
+
+    def product_count(self):
+        return len(self._vector)
+
+    def recent_transactions(self, limit=20):
+        end = self._length
+        return list(reversed(self._transactions[max(0, end - limit):end])) if limit else []
+
+    def transaction_count(self):
+        return self._first_id - 1 + self._length
+
+
+class MaterializedSnapshot(Snapshot):
+    """Snapshot holding a full copy of the products
+
+    Used by backends without native snapshots. Transactions are
+    append-only, so the log is pinned by count and read lazily through
+    `recent(limit, count)`.
+    """
+
+    def __init__(self, version, products, recent, transaction_count):
+        super().__init__(version)
+        self._products = products
+        self._by_sku = {p['sku']: p for p in products}
+        self._recent = recent
+        self._transaction_count = transaction_count
+
+    def products(self):
+        return list(self._products)
+
+    def get_product(self, sku):
+        return self._by_sku.get(sku)
+
+    def product_count(self):
+        return len(self._products)
+
+    def recent_transactions(self, limit=20):
+        return self._recent(limit, self._transaction_count)
+
+    def transaction_count(self):
+        return self._transaction_count
@@ -1,90 +1,49 @@
 import tkinter as tk
 from tkinter import messagebox, ttk
-from datetime import datetime
 
-# In-memory storage for stock transactions
-transactions = []
-transaction_id_counter = 1
+from history_view import HistoryList
+from querycache import QueryCache
+from storage import LOW_STOCK_THRESHOLD, PRODUCTS, STOCK, TRANSACTIONS, get_store, load_sample_products
 
-# Import products from inventory_management
-# For demo, we'll maintain a local copy
-stock_data = {
-    "PLM001": {"name": "Plumberry Jam", "quantity": 50},
-    "PLM002": {"name": "Dried Plumberries", "quantity": 100},
-    "PLM003": {"name": "Plumberry Juice", "quantity": 75},
-    "PLM004": {"name": "Plumberry Tea", "quantity": 60}
-}
+# Storage backend shared with the other front ends (see storage.py)
+store = get_store()
+# False when a persistent backend already holds data from an earlier run
+sample_data = load_sample_products(store)
+# Display texts are re-read only after the data they show changes
+query_cache = QueryCache(store)
 
 def add_stock(sku, quantity, notes=""):
     """Add stock to inventory (incoming)"""
-    global transaction_id_counter
-    
-    if sku not in stock_data:
-        return False, f"Product with SKU {sku} not found!"
-    
-    stock_data[sku]["quantity"] += quantity
-    
-    transaction = {
-        'id': transaction_id_counter,
-        'sku': sku,
-        'product_name': stock_data[sku]["name"],
-        'type': 'IN',
-        'quantity': quantity,
-        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'notes': notes
-    }
-    transactions.append(transaction)
-    transaction_id_counter += 1
-    
-    return True, f"Added {quantity} units to {stock_data[sku]['name']}"
+    return store.add_stock(sku, quantity, notes)
 
 def remove_stock(sku, quantity, notes=""):
     """Remove stock from inventory (outgoing/sales)"""
-    global transaction_id_counter
-    
-    if sku not in stock_data:
-        return False, f"Product with SKU {sku} not found!"
-    
-    if stock_data[sku]["quantity"] < quantity:
-        return False, f"Insufficient stock! Available: {stock_data[sku]['quantity']}"
-    
-    stock_data[sku]["quantity"] -= quantity
-    
-    transaction = {
-        'id': transaction_id_counter,
-        'sku': sku,
-        'product_name': stock_data[sku]["name"],
-        'type': 'OUT',
-        'quantity': quantity,
-        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'notes': notes
-    }
-    transactions.append(transaction)
-    transaction_id_counter += 1
-    
-    return True, f"Removed {quantity} units from {stock_data[sku]['name']}"
+    return store.remove_stock(sku, quantity, notes)
 
 def get_stock_level(sku):
     """Get current stock level for a product"""
-    if sku in stock_data:
-        return stock_data[sku]["quantity"]
-    return None
+    return store.get_stock_level(sku)
 
+@query_cache.memoize(depends=(PRODUCTS, STOCK))
 def get_all_stock():
     """Get all stock levels"""
     result = "Current Stock Levels:\n" + "="*50 + "\n"
-    for sku, data in stock_data.items():
-        status = "🔴 LOW" if data["quantity"] < 30 else "🟢 OK"
-        result += f"{status} SKU: {sku}, Product: {data['name']}, Stock: {data['quantity']}\n"
+    with store.snapshot() as snap:
+        products = snap.products()
+    for data in products:
+        status = "🔴 LOW" if data["quantity"] < LOW_STOCK_THRESHOLD else "🟢 OK"
+        result += f"{status} SKU: {data['sku']}, Product: {data['name']}, Stock: {data['quantity']}\n"
     return result
 
+@query_cache.memoize(depends=(TRANSACTIONS,))
 def get_transaction_history():
     """Get transaction history"""
-    if not transactions:
+    recent = store.recent_transactions(20)  # Show last 20 transactions
+    if not recent:
         return "No transactions recorded."
     
     result = "Transaction History:\n" + "="*50 + "\n"
-    for trans in reversed(transactions[-20:]):  # Show last 20 transactions
+    for trans in recent:
         symbol = "➕" if trans['type'] == 'IN' else "➖"
         result += f"{symbol} ID: {trans['id']}, {trans['product_name']} ({trans['sku']})\n"
         result += f"   Qty: {trans['quantity']}, Time: {trans['timestamp']}\n"
@@ -150,17 +109,13 @@ def remove_stock_button_click():
         messagebox.showerror("Error", "Invalid quantity!")
 
 def update_displays():
-    """Update stock and transaction displays"""
+    """Update the stock display (the history list follows commits by itself)"""
     stock_text.delete(1.0, tk.END)
     stock_text.insert(1.0, get_all_stock())
-    
-    trans_text.delete(1.0, tk.END)
-    trans_text.insert(1.0, get_transaction_history())
 
 def view_transaction_history():
     """View transaction history button click"""
-    trans_text.delete(1.0, tk.END)
-    trans_text.insert(1.0, get_transaction_history())
+    history_list.scroll_to_top()
 
 if __name__ == "__main__":
     # Create main window
@@ -223,18 +178,16 @@ if __name__ == "__main__":
                                  font=("Arial", 12, "bold"), bg='#f0f0f0', padx=10, pady=10)
     history_frame.pack(padx=20, pady=5, fill='both', expand=True)
     
-    trans_text = tk.Text(history_frame, height=10, width=80, wrap='word')
-    trans_scrollbar = tk.Scrollbar(history_frame, command=trans_text.yview)
-    trans_text.configure(yscrollcommand=trans_scrollbar.set)
-    
-    trans_text.pack(side='left', fill='both', expand=True)
-    trans_scrollbar.pack(side='right', fill='y')
+    # Virtualized: new movements are appended as they commit
+    history_list = HistoryList(history_frame, store, rows=10)
+    history_list.pack(fill='both', expand=True)
     
-    # Add some sample transactions
-    add_stock("PLM001", 20, "Restock from supplier")
-    remove_stock("PLM002", 15, "Customer order #1234")
-    add_stock("PLM003", 30, "New shipment")
-    remove_stock("PLM004", 10, "Store sale")
+    # Add some sample transactions (to a fresh store only)
+    if sample_data:
+        add_stock("PLM001", 20, "Restock from supplier")
+        remove_stock("PLM002", 15, "Customer order #1234")
+        add_stock("PLM003", 30, "New shipment")
+        remove_stock("PLM004", 10, "Store sale")
     
     # Initial display
     update_displays()
@@ -0,0 +1,1404 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Storage Backends
+Pluggable storage for products and stock transactions.
+
+Every front end talks to a Store instead of its own module globals. The
+backend is chosen by configuration:
+
+    PLUMBERRY_BACKEND   memory (default), sqlite or kv
+    PLUMBERRY_DB        path of the database file for sqlite / kv
+    PLUMBERRY_AUDIT     path of a hash-chained audit journal (see audit.py)
+    PLUMBERRY_ANOMALIES set to watch movements for anomalies (see anomalies.py)
+    PLUMBERRY_NODE      node number (0-1023) for transaction uids (see ids.py)
+    PLUMBERRY_RETENTION directory of compacted history tiers (see retention.py)
+    PLUMBERRY_HOT_DAYS  days of raw movements kept in the store (default 30)
+"""
+
+import itertools
+import json
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import datetime
+from operator import itemgetter
+
+import ids
+import metrics
+from snapshots import MaterializedSnapshot, PersistentVector, Snapshot, VectorSnapshot
+from valuation import to_cents
+
+LOW_STOCK_THRESHOLD = 30
+
+SAMPLE_PRODUCTS = [
+    ("Plumberry Jam", "PLM001", "Preserves", 12.99, 50),
+    ("Dried Plumberries", "PLM002", "Dried Fruits", 8.50, 100),
+    ("Plumberry Juice", "PLM003", "Beverages", 5.99, 75),
+    ("Plumberry Tea", "PLM004", "Beverages", 7.25, 60),
+]
+
+
+# Sections of the change feed (Store.changes)
+PRODUCTS = 'products'
+STOCK = 'stock'
+TRANSACTIONS = 'transactions'
+ORDERS = 'orders'
+SECTIONS = (PRODUCTS, STOCK, TRANSACTIONS, ORDERS)
+
+# Fixed product fields; anything else is a user-defined attribute
+PRODUCT_FIELDS = ('id', 'name', 'sku', 'category', 'price', 'quantity')
+
+
+def timestamp_now():
+    """Current time in the format used by transaction records"""
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class TransactionFilter:
+    """Filters of a transaction history query (None means any)"""
+
+    __slots__ = ('trans_type', 'sku', 'start', 'end', 'text')
+
+    def __init__(self, trans_type=None, sku=None, start=None, end=None, text=None):
+        self.trans_type = trans_type or None
+        self.sku = sku or None
+        self.start = start or None
+        self.end = end or None
+        self.text = text.lower() if text else None
+
+    def matches(self, record):
+        return ((self.trans_type is None or record['type'] == self.trans_type)
+                and (self.sku is None or record['sku'] == self.sku)
+                and (self.start is None or record['timestamp'] >= self.start)
+                and (self.end is None or record['timestamp'] <= self.end)
+                and (self.text is None or self.text in (record['notes'] or "").lower()))
+
+
+@metrics.instrumented
+class Store:
+    """Base class for storage backends
+
+    Products and transactions are plain dicts with the same keys the front
+    ends have always used. Records handed out by a store are read-only;
+    all changes go through add_product / add_stock / remove_stock /
+    apply_movements.
+
+    Backends implement the small set of underscore methods at the bottom.
+    `version` increases with every change; reports that must not see
+    writes half-way through should read from snapshot(). changes() tells
+    which parts of the data (SECTIONS) moved since a given version.
+    """
+
+    name = "base"
+    version = 0
+    # Version of the last change to each section; replaced, never mutated
+    section_versions = dict.fromkeys(SECTIONS, 0)
+    # Optional audit.AuditLog; sees every committed batch of transactions
+    journal = None
+    # Callbacks given each committed batch of transaction records
+    subscribers = ()
+    # Optional retention.Retention holding transactions compacted out of the store
+    retention = None
+    # Optional anomalies.AnomalyDetector watching the movements
+    anomalies = None
+    # Optional notifications.Notifier delivering stock events
+    notifier = None
+    # Optional pricing.PricingEngine holding scheduled prices and promotions
+    pricing = None
+
+    @metrics.timed("add_product")
+    def add_product(self, name, sku, category, price, quantity):
+        """Add a new product to inventory"""
+        # Checked and inserted under one write lock, so a SKU is only added once
+        with self._writing():
+            if self._find(sku) is not None:
+                return False, "SKU already exists!"
+
+            self._insert_product({
+                'name': name,
+                'sku': sku,
+                'category': category,
+                'price': price,
+                'quantity': quantity
+            })
+        self._changed(PRODUCTS, STOCK)
+        return True, "Product added successfully!"
+
+    @metrics.timed("add_products")
+    def add_products(self, products):
+        """Bulk-load (name, sku, category, price, quantity) rows
+
+        Rows whose SKU already exists are skipped. Returns the number of
+        products added.
+        """
+        return self._add_products(products)
+
+    def _add_products(self, products):
+        added = 0
+        for name, sku, category, price, quantity in products:
+            added += self.add_product(name, sku, category, price, quantity)[0]
+        return added
+
+    @metrics.timed("add_stock")
+    def add_stock(self, sku, quantity, notes="", unit_cost=None):
+        """Add stock to inventory (incoming), optionally at a unit cost"""
+        return self._apply_movements([(sku, 'IN', quantity, notes, unit_cost)], False)[0]
+
+    @metrics.timed("remove_stock")
+    def remove_stock(self, sku, quantity, notes=""):
+        """Remove stock from inventory (outgoing/sales)"""
+        return self._apply_movements([(sku, 'OUT', quantity, notes)], False)[0]
+
+    @metrics.timed("apply_movements")
+    def apply_movements(self, movements, atomic=False):
+        """Apply a batch of (sku, type, quantity, notes[, unit_cost]) movements
+
+        unit_cost (IN only) is the purchase cost per unit; it defaults to
+        the product's price and is recorded in integer cents. Returns one (success, message) tuple per movement. All accepted
+        movements are written in a single commit. With atomic=True the
+        batch is all-or-nothing: if any movement is rejected, none of them
+        are applied.
+        """
+        return self._apply_movements(movements, atomic)
+
+    def _apply_movements(self, movements, atomic, order=None):
+        # Levels are read, checked and written under one write lock (one
+        # SQLite transaction), so concurrent writers never lose an update
+        with self._writing():
+            results, records = self._write_movements(movements, atomic, order)
+        self._publish(records)
+        return results
+
+    def _publish(self, records):
+        """Hand committed records to the journal and subscribers, outside the write lock"""
+        if records:
+            if self.journal is not None:
+                self.journal.append(records)
+            for callback in self.subscribers:
+                callback(records)
+
+    def _write_movements(self, movements, atomic, order):
+        results = []
+        levels = {}
+        products = {}
+        price_costs = {}
+        records = []
+        # Per-line work dominates large batches (orders): bind what the loop calls
+        add_result = results.append
+        add_record = records.append
+        find = self._find
+        timestamp = timestamp_now()
+        order_id = order['id'] if order is not None else None
+
+        for movement in movements:
+            # Plain unpacking; a starred target costs more than the rest of the line
+            if len(movement) == 4:
+                (sku, trans_type, quantity, notes), unit_cost = movement, None
+            else:
+                sku, trans_type, quantity, notes, unit_cost = movement
+            product = products.get(sku)
+            if product is None:
+                product = find(sku)
+                if product is None:
+                    if trans_type != 'IN':
+                        metrics.incr("failed_removals")
+                    add_result((False, f"Product with SKU {sku} not found!"))
+                    continue
+                products[sku] = product
+                levels[sku] = product['quantity']
+
+            if quantity <= 0:
+                add_result((False, "Quantity must be positive!"))
+                continue
+
+            if trans_type == 'IN':
+                if unit_cost is not None:
+                    cost = to_cents(unit_cost)
+                    if cost < 0:
+                        add_result((False, "Unit cost must be positive!"))
+                        continue
+                else:
+                    cost = price_costs.get(sku)
+                    if cost is None:
+                        cost = price_costs[sku] = to_cents(product['price'])
+                levels[sku] += quantity
+                message = f"Added {quantity} units to {product['name']}"
+            else:
+                level = levels[sku]
+                if level < quantity:
+                    metrics.incr("failed_removals")
+                    add_result((False, f"Insufficient stock! Available: {level}"))
+                    continue
+                levels[sku] = level - quantity
+                if level - quantity < LOW_STOCK_THRESHOLD <= level:
+                    metrics.incr("low_stock_events")
+                cost = None
+                message = f"Removed {quantity} units from {product['name']}"
+
+            add_record({
+                'sku': sku,
+                'product_name': product['name'],
+                'type': trans_type,
+                'quantity': quantity,
+                'timestamp': timestamp,
+                'notes': notes,
+                'unit_cost': cost,
+                'order_id': order_id
+            })
+            add_result((True, message))
+
+        if atomic and len(records) != len(results):
+            return [(False, "Batch rejected, movement not applied") if ok else (ok, message)
+                    for ok, message in results], []
+
+        if records:
+            for record, uid in zip(records, ids.generator().block(len(records))):
+                record['uid'] = uid
+            if order is not None:
+                order = {**order, 'status': 'committed', 'committed_at': timestamp}
+            self._commit(levels, records, order)
+            if order is None:
+                self._changed(STOCK, TRANSACTIONS)
+            else:
+                self._changed(STOCK, TRANSACTIONS, ORDERS)
+        return results, records
+
+    def subscribe(self, callback):
+        """Call callback(records) after every committed batch of transactions
+
+        Callbacks run on the writing thread, so they should only hand the
+        records over (e.g. to a queue, like anomalies.AnomalyDetector).
+        """
+        self.subscribers = self.subscribers + (callback,)
+
+    def unsubscribe(self, callback):
+        """Stop calling a callback given to subscribe()"""
+        self.subscribers = tuple(subscriber for subscriber in self.subscribers
+                                 if subscriber != callback)
+
+    @metrics.timed("save_order")
+    def save_order(self, order):
+        """Store a new order document; returns it with 'id' and 'number' set
+
+        An order is a dict with kind ('PO' purchase / 'SO' sales), party
+        (supplier or customer), lines [{'sku', 'quantity', 'unit_cost'}],
+        notes and status ('open', 'committed' or 'cancelled').
+        """
+        order = _new_order(order)
+        with self._writing():
+            self._save_order(order)
+        self._changed(ORDERS)
+        return order
+
+    @metrics.timed("place_order")
+    def place_order(self, order):
+        """save_order and commit_order in one write transaction
+
+        Returns (order, results). An order naming an unknown SKU is not
+        saved (order None, one result saying which). If a line is
+        rejected otherwise, nothing moves and the order stays open, as if
+        only save_order had run.
+        """
+        order = _new_order(order)
+        with self._writing():
+            for sku in dict.fromkeys(line['sku'] for line in order['lines']):
+                if self._find(sku) is None:
+                    return None, [(False, f"Product with SKU {sku} not found!")]
+            self._save_order(order)
+            results, records = self._write_movements(_order_movements(order), True, order)
+        self._changed(ORDERS)
+        self._publish(records)
+        if records:
+            order = {**order, 'status': 'committed', 'committed_at': records[0]['timestamp']}
+        return order, results
+
+    @metrics.timed("commit_order")
+    def commit_order(self, order_id):
+        """Apply every line of an open order as one all-or-nothing batch
+
+        The movements reference the order (order_id, and its number as the
+        notes) and the order is marked committed in the same commit.
+        Returns one (success, message) tuple per line.
+        """
+        # The status is checked under the same write lock, so an order commits once
+        with self._writing():
+            order = self._get_order(order_id)
+            if order is None:
+                return [(False, f"Order {order_id} not found!")]
+            if order['status'] != 'open':
+                return [(False, f"Order {order['number']} is already {order['status']}!")]
+            results, records = self._write_movements(_order_movements(order), True, order)
+        self._publish(records)
+        return results
+
+    def cancel_order(self, order_id):
+        """Cancel an open order"""
+        with self._writing():
+            order = self._get_order(order_id)
+            if order is None:
+                return False, f"Order {order_id} not found!"
+            if order['status'] != 'open':
+                return False, f"Order {order['number']} is already {order['status']}!"
+            self._save_order({**order, 'status': 'cancelled'})
+        self._changed(ORDERS)
+        return True, f"Order {order['number']} cancelled"
+
+    def get_order(self, order_id):
+        """Order document by id, or None"""
+        return self._get_order(order_id)
+
+    def orders(self, since_id=0):
+        """Orders with id > since_id, in id order"""
+        return list(self._iter_orders(since_id))
+
+    @metrics.timed("set_attributes")
+    def set_attributes(self, sku, attributes):
+        """Set user-defined attributes of a product (supplier, flavor, ...)
+
+        attributes is {name: value} with JSON values; None removes the
+        attribute. Other attributes are kept.
+        """
+        if self._find(sku) is None:
+            return False, f"Product with SKU {sku} not found!"
+        reserved = [name for name in attributes if name in PRODUCT_FIELDS]
+        if reserved:
+            return False, f"'{reserved[0]}' is a product field, not an attribute!"
+        current = self._get_attributes(sku)
+        for name, value in attributes.items():
+            if value is None:
+                current.pop(name, None)
+            else:
+                current[name] = value
+        self._set_attributes(sku, current)
+        self._changed(PRODUCTS)
+        return True, "Attributes updated successfully!"
+
+    @metrics.timed("set_prices")
+    def set_prices(self, prices):
+        """Change the prices of many products in one write
+
+        prices is {sku: price} or (sku, price) pairs; unknown SKUs are
+        skipped. Returns {sku: previous price} of the products changed.
+        """
+        previous = self._set_prices(dict(prices))
+        if previous:
+            self._changed(PRODUCTS)
+        return previous
+
+    def get_attributes(self, sku):
+        """User-defined attributes of a product ({} if none)"""
+        return self._get_attributes(sku)
+
+    def all_attributes(self):
+        """{sku: attributes} of every product that has any"""
+        return self._all_attributes()
+
+    @metrics.timed("get_product")
+    def get_product(self, sku):
+        """Search for a product by SKU"""
+        return self._find(sku)
+
+    @metrics.timed("get_stock_level")
+    def get_stock_level(self, sku):
+        """Get current stock level for a product"""
+        product = self._find(sku)
+        return product['quantity'] if product is not None else None
+
+    @metrics.timed("products")
+    def products(self):
+        """Get all products in insertion order"""
+        return list(self._iter_products())
+
+    @metrics.timed("search_products")
+    def search_products(self, term):
+        """Products whose SKU or name contains term (case-insensitive)"""
+        return self._search_products(term)
+
+    def _search_products(self, term):
+        term = term.lower()
+        return [p for p in self._iter_products()
+                if term in p['sku'].lower() or term in p['name'].lower()]
+
+    def product_count(self):
+        """Number of products in inventory"""
+        return sum(1 for _ in self._iter_products())
+
+    @metrics.timed("recent_transactions")
+    def recent_transactions(self, limit=20):
+        """Get the last `limit` transactions, newest first"""
+        return self._recent(limit)
+
+    def transaction_count(self):
+        """Number of recorded transactions (the last id, compacted ones included)"""
+        raise NotImplementedError
+
+    def first_transaction_id(self):
+        """Oldest transaction id still held; older ones were compacted"""
+        return 1
+
+    def get_transactions(self, first_id, last_id):
+        """Transactions with first_id <= id <= last_id, in id order
+
+        Compacted ids are read back from the retention archive, if any.
+        """
+        hot = self.first_transaction_id()
+        last_id = min(last_id, self.transaction_count())
+        records = []
+        if first_id < hot and self.retention is not None:
+            records = self.retention.archived(max(1, first_id), min(last_id, hot - 1))
+        return records + self._transaction_range(max(hot, first_id), last_id)
+
+    def drop_transactions(self, last_id):
+        """Remove transactions up to last_id from the store
+
+        Used by retention.Retention once they are archived and summarized.
+        """
+        if min(last_id, self.transaction_count()) >= self.first_transaction_id():
+            self._drop_transactions(min(last_id, self.transaction_count()))
+            self._changed(TRANSACTIONS)
+
+    @metrics.timed("query_transactions")
+    def query_transactions(self, trans_type=None, sku=None, start=None, end=None, text=None,
+                           before_id=None, limit=50):
+        """One page of matching transactions, newest first
+
+        Filters: trans_type ('IN'/'OUT'), sku, start/end timestamps
+        ('YYYY-MM-DD HH:MM:SS', inclusive) and text (case-insensitive,
+        within notes). Pages are keyset-paginated: pass the smallest id of
+        the previous page as before_id to get the next one. Compacted
+        transactions are included when a retention archive is attached.
+        """
+        where = TransactionFilter(trans_type, sku, start, end, text)
+        if self.retention is not None:
+            return self.retention.query(where, before_id, limit)
+        return self._query_transactions(where, before_id, limit)
+
+    @metrics.timed("count_transactions")
+    def count_transactions(self, trans_type=None, sku=None, start=None, end=None, text=None):
+        """Number of transactions matching the query_transactions filters"""
+        where = TransactionFilter(trans_type, sku, start, end, text)
+        if self.retention is not None:
+            return self.retention.count(where)
+        return self._count_transactions(where)
+
+    def _query_transactions(self, where, before_id, limit):
+        # Scan backwards in chunks; backends with indexes override this
+        result = []
+        last_id = self.transaction_count()
+        if before_id is not None:
+            last_id = min(last_id, before_id - 1)
+        hot = self.first_transaction_id()
+        while last_id >= hot and len(result) < limit:
+            first_id = max(hot, last_id - 999)
+            for record in reversed(self._transaction_range(first_id, last_id)):
+                if where.matches(record):
+                    result.append(record)
+                    if len(result) == limit:
+                        break
+            last_id = first_id - 1
+        return result
+
+    def _count_transactions(self, where):
+        count = 0
+        total = self.transaction_count()
+        for first_id in range(self.first_transaction_id(), total + 1, 1000):
+            records = self._transaction_range(first_id, min(total, first_id + 999))
+            count += sum(1 for record in records if where.matches(record))
+        return count
+
+    def changes(self, *sections):
+        """Change feed: the version of the last change to any of `sections`
+
+        A reader remembers the value it last rendered from and recomputes
+        only when it moves; polling costs a dict lookup. No sections means
+        any change.
+        """
+        self._poll_changes()
+        versions = self.section_versions
+        return max(versions[section] for section in sections or SECTIONS)
+
+    def _changed(self, *sections):
+        self.version += 1
+        self.section_versions = {**self.section_versions, **dict.fromkeys(sections, self.version)}
+
+    def _poll_changes(self):
+        """Pick up changes made outside this store object"""
+
+    @metrics.timed("snapshot")
+    def snapshot(self):
+        """Pin a consistent read-only view of products and transactions"""
+        return self._snapshot()
+
+    def _snapshot(self):
+        # Copy the products; backends override this with something cheaper
+        with self._writing():
+            count = self.transaction_count()
+            recent = self._recent(count)
+            products = self.products()
+        return MaterializedSnapshot(self.version, products,
+                                    lambda limit, upto: recent[:limit], count)
+
+    def close(self):
+        """Release any resources held by the backend"""
+
+    # Backend primitives
+
+    def _find(self, sku):
+        raise NotImplementedError
+
+    def _insert_product(self, product):
+        raise NotImplementedError
+
+    def _writing(self):
+        """Context manager held while a batch of movements is checked and
+        committed; no other write may change stock levels meanwhile"""
+        raise NotImplementedError
+
+    def _commit(self, levels, records, order=None):
+        """Write new stock levels {sku: quantity}, transaction records and,
+        for an order commit, the updated order, all in one commit (called
+        within _writing)"""
+        raise NotImplementedError
+
+    def _save_order(self, order):
+        """Insert (assigning 'id' and 'number') or replace an order"""
+        raise NotImplementedError
+
+    def _get_order(self, order_id):
+        raise NotImplementedError
+
+    def _iter_orders(self, since_id):
+        raise NotImplementedError
+
+    def _iter_products(self):
+        raise NotImplementedError
+
+    def _recent(self, limit):
+        raise NotImplementedError
+
+    def _get_attributes(self, sku):
+        raise NotImplementedError
+
+    def _set_attributes(self, sku, attributes):
+        """Replace the attributes of a product"""
+        raise NotImplementedError
+
+    def _set_prices(self, prices):
+        """Write {sku: price} for the known SKUs; returns their previous prices"""
+        raise NotImplementedError
+
+    def _all_attributes(self):
+        raise NotImplementedError
+
+    def _transaction_range(self, first_id, last_id):
+        raise NotImplementedError
+
+    def _drop_transactions(self, last_id):
+        raise NotImplementedError
+
+
+def _new_order(order):
+    return {'status': 'open', 'created': timestamp_now(), 'committed_at': None, 'notes': "",
+            **order}
+
+
+def _order_movements(order):
+    """Movements of an order's lines, noted with its number"""
+    trans_type = 'IN' if order['kind'] == 'PO' else 'OUT'
+    number = order['number']
+    return [(line['sku'], trans_type, line['quantity'], number, line.get('unit_cost'))
+            for line in order['lines']]
+
+
+def _timestamp(record):
+    return record['timestamp']
+
+
+class InMemoryStore(Store):
+    """Dictionaries and lists, reset when the application closes
+
+    Products live in a copy-on-write vector (see snapshots.py) and are
+    replaced rather than mutated, so snapshot() is O(1) and a pinned
+    report never sees a later write. Live lookups go through a plain
+    SKU -> record dict. The transaction log is indexed by SKU and type
+    (ascending id arrays) and, being in time order, bisected by date.
+    """
+
+    name = "memory"
+
+    def __init__(self, path=None):
+        self._products = PersistentVector()
+        self._positions = {}
+        self._by_sku = {}
+        self.transactions = []
+        self._first_id = 1
+        self._next_transaction_id = 1
+        self._ids_by_sku = {}
+        self._ids_by_type = {}
+        self._orders = {}
+        self._attributes = {}
+        self._lock = threading.RLock()
+
+    def product_count(self):
+        return len(self._products)
+
+    def transaction_count(self):
+        return self._next_transaction_id - 1
+
+    def first_transaction_id(self):
+        return self._first_id
+
+    def _log(self):
+        """The transaction list and the id of its first entry"""
+        with self._lock:
+            return self.transactions, self._first_id
+
+    def _snapshot(self):
+        with self._lock:
+            return VectorSnapshot(self.version, self._products.freeze(), self._positions,
+                                  self.transactions, len(self.transactions), self._first_id)
+
+    def _find(self, sku):
+        return self._by_sku.get(sku)
+
+    def _writing(self):
+        return self._lock
+
+    def _insert_product(self, product):
+        with self._lock:
+            position = len(self._products)
+            product = {'id': position + 1, **product}
+            self._products.append(product)
+            self._positions[product['sku']] = position
+            self._by_sku[product['sku']] = product
+
+    def _get_attributes(self, sku):
+        return dict(self._attributes.get(sku, {}))
+
+    def _set_attributes(self, sku, attributes):
+        with self._lock:
+            if attributes:
+                self._attributes[sku] = dict(attributes)
+            else:
+                self._attributes.pop(sku, None)
+
+    def _all_attributes(self):
+        with self._lock:
+            return {sku: dict(attributes) for sku, attributes in self._attributes.items()}
+
+    def _set_prices(self, prices):
+        previous = {}
+        with self._lock:
+            by_sku = self._by_sku
+            positions = self._positions
+            for sku, price in prices.items():
+                product = by_sku.get(sku)
+                if product is None:
+                    continue
+                previous[sku] = product['price']
+                product = by_sku[sku] = {**product, 'price': price}
+                self._products.set(positions[sku], product)
+        return previous
+
+    def _add_products(self, products):
+        with self._lock:
+            by_sku = self._by_sku
+            positions = self._positions
+            position = len(self._products)
+            new = []
+            for name, sku, category, price, quantity in products:
+                if sku in by_sku:
+                    continue
+                product = by_sku[sku] = {'id': position + 1, 'name': name, 'sku': sku,
+                                         'category': category, 'price': price,
+                                         'quantity': quantity}
+                positions[sku] = position
+                new.append(product)
+                position += 1
+            self._products.extend(new)
+        if new:
+            self._changed(PRODUCTS, STOCK)
+        return len(new)
+
+    def _commit(self, levels, records, order=None):
+        with self._lock:
+            by_sku = self._by_sku
+            positions = self._positions
+            set_product = self._products.set
+            for sku, quantity in levels.items():
+                product = by_sku[sku] = {**by_sku[sku], 'quantity': quantity}
+                set_product(positions[sku], product)
+            by_sku = self._ids_by_sku
+            by_type = self._ids_by_type
+            for trans_id, record in enumerate(records, self._next_transaction_id):
+                record['id'] = trans_id
+                id_list = by_sku.get(record['sku'])
+                if id_list is None:
+                    id_list = by_sku[record['sku']] = array('q')
+                id_list.append(trans_id)
+                id_list = by_type.get(record['type'])
+                if id_list is None:
+                    id_list = by_type[record['type']] = array('q')
+                id_list.append(trans_id)
+            self._next_transaction_id += len(records)
+            self.transactions.extend(records)
+            if order is not None:
+                self._orders[order['id']] = order
+
+    def _save_order(self, order):
+        with self._lock:
+            if 'id' not in order:
+                order['id'] = len(self._orders) + 1
+                order['number'] = f"{order['kind']}-{order['id']:06d}"
+            self._orders[order['id']] = order
+
+    def _get_order(self, order_id):
+        return self._orders.get(order_id)
+
+    def _iter_orders(self, since_id):
+        # Ids are dense and dicts keep insertion order
+        with self._lock:
+            return list(itertools.islice(self._orders.values(), since_id, None))
+
+    def _iter_products(self):
+        return iter(self._products)
+
+    def _recent(self, limit):
+        return list(reversed(self.transactions[-limit:])) if limit else []
+
+    def _transaction_range(self, first_id, last_id):
+        # Ids are consecutive positions in the list
+        transactions, base = self._log()
+        return transactions[first_id - base:last_id - base + 1]
+
+    def _drop_transactions(self, last_id):
+        with self._lock:
+            # Replace rather than trim: pinned snapshots keep the old list
+            self.transactions = self.transactions[last_id - self._first_id + 1:]
+            self._first_id = last_id + 1
+            for index in (self._ids_by_sku, self._ids_by_type):
+                for key, id_list in list(index.items()):
+                    cut = bisect_right(id_list, last_id)
+                    if cut == len(id_list):
+                        del index[key]
+                    elif cut:
+                        index[key] = id_list[cut:]
+
+    def _query_plan(self, where, before_id=None):
+        """Id bounds [lo, hi) from the dates and cursor, and an id index"""
+        with self._lock:
+            # Indexes and list as of the same compaction
+            transactions, base = self.transactions, self._first_id
+            if where.sku:
+                id_list = self._ids_by_sku.get(where.sku, ())
+            elif where.trans_type:
+                id_list = self._ids_by_type.get(where.trans_type, ())
+            else:
+                id_list = None
+        count = len(transactions)
+        lo, hi = base, base + count
+        if where.start:
+            lo = bisect_left(transactions, where.start, 0, count, key=_timestamp) + base
+        if where.end:
+            hi = bisect_right(transactions, where.end, 0, count, key=_timestamp) + base
+        if before_id is not None:
+            hi = min(hi, before_id)
+        # Filters the chosen index does not answer on its own
+        residual = where.text is not None or (where.sku is not None and where.trans_type is not None)
+        return transactions, base, lo, hi, id_list, residual
+
+    def _query_transactions(self, where, before_id, limit):
+        transactions, base, lo, hi, id_list, residual = self._query_plan(where, before_id)
+        if id_list is None:
+            candidates = range(hi - 1, lo - 1, -1)
+        else:
+            candidates = (id_list[k] for k in range(bisect_left(id_list, hi) - 1,
+                                                    bisect_left(id_list, lo) - 1, -1))
+        result = []
+        for trans_id in candidates:
+            record = transactions[trans_id - base]
+            if not residual or where.matches(record):
+                result.append(record)
+                if len(result) == limit:
+                    break
+        return result
+
+    def _count_transactions(self, where):
+        transactions, base, lo, hi, id_list, residual = self._query_plan(where)
+        if id_list is None:
+            id_list = range(lo, hi)
+            left, right = 0, max(0, hi - lo)
+        else:
+            left, right = bisect_left(id_list, lo), bisect_left(id_list, hi)
+        if not residual:
+            return max(0, right - left)
+        return sum(1 for k in range(left, right) if where.matches(transactions[id_list[k] - base]))
+
+
+class SQLiteStore(Store):
+    """SQLite database in WAL mode
+
+    Statements are kept as constants so the connection's statement cache
+    reuses the prepared form, and batches are written with executemany
+    inside a single transaction.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            sku TEXT NOT NULL UNIQUE,
+            category TEXT,
+            price REAL,
+            quantity INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY,
+            sku TEXT NOT NULL,
+            product_name TEXT,
+            type TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            notes TEXT,
+            unit_cost INTEGER,
+            order_id INTEGER,
+            uid INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            party TEXT,
+            status TEXT NOT NULL,
+            created TEXT NOT NULL,
+            committed_at TEXT,
+            notes TEXT,
+            lines TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS attributes (
+            sku TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (sku, name)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_transactions_sku ON transactions (sku, id);
+        CREATE INDEX IF NOT EXISTS idx_transactions_timestamp ON transactions (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_transactions_type ON transactions (type, id);
+    """
+
+    FIND_SQL = "SELECT id, name, sku, category, price, quantity FROM products WHERE sku = ?"
+    ALL_PRODUCTS_SQL = "SELECT id, name, sku, category, price, quantity FROM products ORDER BY id"
+    SEARCH_SQL = ("SELECT id, name, sku, category, price, quantity FROM products "
+                  "WHERE sku LIKE ? ESCAPE '\\' OR name LIKE ? ESCAPE '\\' ORDER BY id")
+    INSERT_PRODUCT_SQL = ("INSERT INTO products (name, sku, category, price, quantity) "
+                          "VALUES (:name, :sku, :category, :price, :quantity)")
+    INSERT_PRODUCT_IGNORE_SQL = ("INSERT OR IGNORE INTO products (name, sku, category, price, quantity) "
+                                 "VALUES (?, ?, ?, ?, ?)")
+    UPDATE_LEVEL_SQL = "UPDATE products SET quantity = ? WHERE sku = ?"
+    UPDATE_PRICE_BY_ID_SQL = "UPDATE products SET price = ? WHERE id = ?"
+    INSERT_TRANSACTION_SQL = ("INSERT INTO transactions (id, sku, product_name, type, quantity, timestamp, "
+                              "notes, unit_cost, order_id, uid) VALUES (:id, :sku, :product_name, :type, "
+                              ":quantity, :timestamp, :notes, :unit_cost, :order_id, :uid)")
+    # Last id: compacted transactions are deleted, so not COUNT(*)
+    COUNT_SQL = ("SELECT MAX(COALESCE((SELECT MAX(id) FROM transactions), 0), "
+                 "COALESCE((SELECT value FROM meta WHERE name = 'compacted_upto'), 0))")
+    FIRST_ID_SQL = "SELECT COALESCE((SELECT value FROM meta WHERE name = 'compacted_upto'), 0) + 1"
+    RECENT_SQL = ("SELECT id, sku, product_name, type, quantity, timestamp, notes, unit_cost, order_id, uid "
+                  "FROM transactions ORDER BY id DESC LIMIT ?")
+    QUERY_SQL = ("SELECT id, sku, product_name, type, quantity, timestamp, notes, unit_cost, order_id, uid "
+                 "FROM transactions")
+    RANGE_SQL = ("SELECT id, sku, product_name, type, quantity, timestamp, notes, unit_cost, order_id, uid "
+                 "FROM transactions WHERE id BETWEEN ? AND ? ORDER BY id")
+    INSERT_ORDER_SQL = ("INSERT INTO orders (kind, party, status, created, committed_at, notes, lines) "
+                        "VALUES (:kind, :party, :status, :created, :committed_at, :notes, :lines)")
+    UPDATE_ORDER_SQL = "UPDATE orders SET status = :status, committed_at = :committed_at WHERE id = :id"
+    ATTRIBUTES_SQL = "SELECT name, value FROM attributes WHERE sku = ?"
+    ALL_ATTRIBUTES_SQL = "SELECT sku, name, value FROM attributes"
+    INSERT_ATTRIBUTE_SQL = "INSERT INTO attributes (sku, name, value) VALUES (?, ?, ?)"
+    ORDER_SQL = "SELECT * FROM orders WHERE id = ?"
+    ORDERS_SINCE_SQL = "SELECT * FROM orders WHERE id > ? ORDER BY id"
+
+    def __init__(self, path="plumberry.db"):
+        self.path = path
+        self.conn = self._connect()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        # Databases from before unit costs / orders / uids were recorded
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(transactions)")}
+        for column in ('unit_cost', 'order_id', 'uid'):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE transactions ADD COLUMN {column} INTEGER")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_order "
+                          "ON transactions (order_id) WHERE order_id IS NOT NULL")
+        self._readers = []
+        self._data_version = None
+        # Threads sharing the connection take turns at write transactions
+        self._write_lock = threading.RLock()
+
+    def _connect(self):
+        import sqlite3
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                               cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _poll_changes(self):
+        # data_version moves when another connection (or process) commits;
+        # which tables it touched is unknown, so every section changes
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            if self._data_version is not None:
+                self._changed(*SECTIONS)
+            self._data_version = data_version
+
+    def _snapshot(self):
+        """Open a read transaction; WAL lets writers continue meanwhile"""
+        if self.path == ":memory:":
+            return super()._snapshot()
+        reader = self._readers.pop() if self._readers else self._connect()
+        return SQLiteSnapshot(self.version, reader, self._readers.append)
+
+    def product_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def transaction_count(self):
+        return self.conn.execute(self.COUNT_SQL).fetchone()[0]
+
+    def first_transaction_id(self):
+        return self.conn.execute(self.FIRST_ID_SQL).fetchone()[0]
+
+    def close(self):
+        for reader in self._readers:
+            reader.close()
+        self.conn.close()
+
+    def _find(self, sku):
+        row = self.conn.execute(self.FIND_SQL, (sku,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def _insert_product(self, product):
+        cursor = self.conn.execute(self.INSERT_PRODUCT_SQL, product)
+        product['id'] = cursor.lastrowid
+
+    @contextmanager
+    def _writing(self):
+        """One write transaction; BEGIN IMMEDIATE locks out other processes
+        before the stock levels are read"""
+        with self._write_lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _commit(self, levels, records, order=None):
+        conn = self.conn
+        try:
+            conn.executemany(self.UPDATE_LEVEL_SQL, [(q, sku) for sku, q in levels.items()])
+            # ids continue after the last one, even if it was compacted away
+            first_id = conn.execute(self.COUNT_SQL).fetchone()[0] + 1
+            for offset, record in enumerate(records):
+                record['id'] = first_id + offset
+            conn.executemany(self.INSERT_TRANSACTION_SQL, records)
+            if order is not None:
+                conn.execute(self.UPDATE_ORDER_SQL, order)
+        except BaseException:
+            for record in records:
+                record.pop('id', None)
+            raise
+
+    def _drop_transactions(self, last_id):
+        with self._writing():
+            self.conn.execute("DELETE FROM transactions WHERE id <= ?", (last_id,))
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('compacted_upto', ?)",
+                              (last_id,))
+
+    def _add_products(self, products):
+        conn = self.conn
+        before = conn.total_changes
+        with self._writing():
+            conn.executemany(self.INSERT_PRODUCT_IGNORE_SQL, products)
+        added = conn.total_changes - before
+        if added:
+            self._changed(PRODUCTS, STOCK)
+        return added
+
+    def _save_order(self, order):
+        if 'id' in order:
+            self.conn.execute(self.UPDATE_ORDER_SQL, order)
+            return
+        cursor = self.conn.execute(self.INSERT_ORDER_SQL, {**order, 'lines': json.dumps(order['lines'])})
+        order['id'] = cursor.lastrowid
+        order['number'] = f"{order['kind']}-{order['id']:06d}"
+
+    def _get_order(self, order_id):
+        row = self.conn.execute(self.ORDER_SQL, (order_id,)).fetchone()
+        return _order_from_row(row) if row is not None else None
+
+    def _iter_orders(self, since_id):
+        return [_order_from_row(row) for row in self.conn.execute(self.ORDERS_SINCE_SQL, (since_id,))]
+
+    def _get_attributes(self, sku):
+        # Values are stored as JSON so numbers stay numbers
+        return {row[0]: json.loads(row[1]) for row in self.conn.execute(self.ATTRIBUTES_SQL, (sku,))}
+
+    def _set_attributes(self, sku, attributes):
+        conn = self.conn
+        with self._writing():
+            conn.execute("DELETE FROM attributes WHERE sku = ?", (sku,))
+            conn.executemany(self.INSERT_ATTRIBUTE_SQL,
+                             [(sku, name, json.dumps(value)) for name, value in attributes.items()])
+
+    def _set_prices(self, prices):
+        conn = self.conn
+        skus = list(prices)
+        rows = []
+        with self._writing():
+            # Within SQLite's limit on bound parameters
+            for start in range(0, len(skus), 500):
+                chunk = skus[start:start + 500]
+                rows.extend(conn.execute(
+                    f"SELECT id, sku, price FROM products WHERE sku IN ({','.join('?' * len(chunk))})",
+                    chunk))
+            # In rowid order: each table page is written once, whatever the
+            # order of the SKUs
+            rows.sort(key=itemgetter(0))
+            conn.executemany(self.UPDATE_PRICE_BY_ID_SQL,
+                             [(prices[sku], product_id) for product_id, sku, _ in rows])
+        return {sku: price for _, sku, price in rows}
+
+    def _all_attributes(self):
+        result = {}
+        for sku, name, value in self.conn.execute(self.ALL_ATTRIBUTES_SQL):
+            result.setdefault(sku, {})[name] = json.loads(value)
+        return result
+
+    def _search_products(self, term):
+        pattern = "%" + _like_escape(term) + "%"
+        return [dict(row) for row in self.conn.execute(self.SEARCH_SQL, (pattern, pattern))]
+
+    def _iter_products(self):
+        for row in self.conn.execute(self.ALL_PRODUCTS_SQL):
+            yield dict(row)
+
+    def _recent(self, limit):
+        return [dict(row) for row in self.conn.execute(self.RECENT_SQL, (limit,))]
+
+    def _transaction_range(self, first_id, last_id):
+        return [dict(row) for row in self.conn.execute(self.RANGE_SQL, (first_id, last_id))]
+
+    @staticmethod
+    def _where_sql(where, before_id=None):
+        clauses = []
+        params = []
+        for clause, value in (("type = ?", where.trans_type), ("sku = ?", where.sku),
+                              ("timestamp >= ?", where.start), ("timestamp <= ?", where.end),
+                              ("id < ?", before_id)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        if where.text is not None:
+            clauses.append("notes LIKE ? ESCAPE '\\'")
+            params.append("%" + _like_escape(where.text) + "%")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _query_transactions(self, where, before_id, limit):
+        sql, params = self._where_sql(where, before_id)
+        return [dict(row) for row in self.conn.execute(
+            self.QUERY_SQL + sql + " ORDER BY id DESC LIMIT ?", params + [limit])]
+
+    def _count_transactions(self, where):
+        sql, params = self._where_sql(where)
+        return self.conn.execute("SELECT COUNT(*) FROM transactions" + sql, params).fetchone()[0]
+
+
+def _like_escape(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _order_from_row(row):
+    order = dict(row)
+    order['lines'] = json.loads(order['lines'])
+    order['number'] = f"{order['kind']}-{order['id']:06d}"
+    return order
+
+
+class SQLiteSnapshot(Snapshot):
+    """Snapshot backed by an open SQLite read transaction"""
+
+    def __init__(self, version, conn, release):
+        super().__init__(version)
+        self.conn = conn
+        self._release = release
+        conn.execute("BEGIN")
+        # The read transaction is pinned by its first read
+        self._transaction_count = conn.execute(SQLiteStore.COUNT_SQL).fetchone()[0]
+
+    def products(self):
+        return [dict(row) for row in self.conn.execute(SQLiteStore.ALL_PRODUCTS_SQL)]
+
+    def get_product(self, sku):
+        row = self.conn.execute(SQLiteStore.FIND_SQL, (sku,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def product_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def recent_transactions(self, limit=20):
+        return [dict(row) for row in self.conn.execute(SQLiteStore.RECENT_SQL, (limit,))]
+
+    def transaction_count(self):
+        return self._transaction_count
+
+    def total_value(self):
+        return self.conn.execute("SELECT COALESCE(SUM(price * quantity), 0) FROM products").fetchone()[0]
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.execute("COMMIT")
+            self._release(self.conn)
+            self.conn = None
+
+
+class KeyValueStore(Store):
+    """Embedded key-value file (stdlib dbm)
+
+    Records are JSON values under prefixed keys, in the spirit of LMDB:
+        p:<sku>            product record
+        a:<sku>            user-defined product attributes
+        t:<zero-padded id> transaction record
+        o:<zero-padded id> order document
+        meta:<name>        id counters and the first id not compacted
+    dbm has no multi-key transactions, so a batch is written key by key
+    and flushed once at the end.
+    """
+
+    name = "kv"
+
+    def __init__(self, path="plumberry.kv"):
+        import dbm
+        self.path = path
+        self.db = dbm.open(path, 'c')
+        self._next_product_id = self._meta('next_product_id')
+        self._next_transaction_id = self._meta('next_transaction_id')
+        self._first_transaction_id = self._meta('first_transaction_id')
+        self._next_order_id = self._meta('next_order_id')
+        # Product records are read-modify-write JSON values
+        self._lock = threading.RLock()
+
+    def _meta(self, name):
+        value = self.db.get(b"meta:" + name.encode())
+        return int(value) if value is not None else 1
+
+    def _set_meta(self, name, value):
+        self.db[b"meta:" + name.encode()] = str(value).encode()
+
+    @staticmethod
+    def _transaction_key(trans_id):
+        return b"t:%016d" % trans_id
+
+    @staticmethod
+    def _order_key(order_id):
+        return b"o:%016d" % order_id
+
+    def product_count(self):
+        return self._next_product_id - 1
+
+    def transaction_count(self):
+        return self._next_transaction_id - 1
+
+    def first_transaction_id(self):
+        return self._first_transaction_id
+
+    def _snapshot(self):
+        # Products and the last id as of the same commit
+        with self._lock:
+            products, count = self.products(), self.transaction_count()
+        return MaterializedSnapshot(self.version, products, self._recent_upto, count)
+
+    def close(self):
+        self.db.close()
+
+    def _find(self, sku):
+        value = self.db.get(b"p:" + sku.encode())
+        return json.loads(value) if value is not None else None
+
+    def _insert_product(self, product):
+        product['id'] = self._next_product_id
+        self.db[b"p:" + product['sku'].encode()] = json.dumps(product).encode()
+        self._next_product_id += 1
+        self._set_meta('next_product_id', self._next_product_id)
+
+    def _writing(self):
+        return self._lock
+
+    def _commit(self, levels, records, order=None):
+        db = self.db
+        for sku in levels:
+            key = b"p:" + sku.encode()
+            product = json.loads(db[key])
+            product['quantity'] = levels[sku]
+            db[key] = json.dumps(product).encode()
+        for record in records:
+            record['id'] = self._next_transaction_id
+            db[self._transaction_key(record['id'])] = json.dumps(record).encode()
+            self._next_transaction_id += 1
+        self._set_meta('next_transaction_id', self._next_transaction_id)
+        if order is not None:
+            db[self._order_key(order['id'])] = json.dumps(order).encode()
+        if hasattr(db, 'sync'):
+            db.sync()
+
+    def _save_order(self, order):
+        if 'id' not in order:
+            order['id'] = self._next_order_id
+            order['number'] = f"{order['kind']}-{order['id']:06d}"
+            self._next_order_id += 1
+            self._set_meta('next_order_id', self._next_order_id)
+        self.db[self._order_key(order['id'])] = json.dumps(order).encode()
+        if hasattr(self.db, 'sync'):
+            self.db.sync()
+
+    def _get_order(self, order_id):
+        value = self.db.get(self._order_key(order_id))
+        return json.loads(value) if value is not None else None
+
+    def _iter_orders(self, since_id):
+        return [json.loads(self.db[self._order_key(order_id)])
+                for order_id in range(since_id + 1, self._next_order_id)]
+
+    def _get_attributes(self, sku):
+        value = self.db.get(b"a:" + sku.encode())
+        return json.loads(value) if value is not None else {}
+
+    def _set_attributes(self, sku, attributes):
+        key = b"a:" + sku.encode()
+        if attributes:
+            self.db[key] = json.dumps(attributes).encode()
+        elif key in self.db:
+            del self.db[key]
+        if hasattr(self.db, 'sync'):
+            self.db.sync()
+
+    def _set_prices(self, prices):
+        db = self.db
+        previous = {}
+        with self._lock:
+            for sku, price in prices.items():
+                key = b"p:" + sku.encode()
+                value = db.get(key)
+                if value is None:
+                    continue
+                product = json.loads(value)
+                previous[sku] = product['price']
+                product['price'] = price
+                db[key] = json.dumps(product).encode()
+            if hasattr(db, 'sync'):
+                db.sync()
+        return previous
+
+    def _all_attributes(self):
+        return {key[2:].decode(): json.loads(self.db[key])
+                for key in self.db.keys() if key.startswith(b"a:")}
+
+    def _iter_products(self):
+        products = [json.loads(self.db[key]) for key in self.db.keys() if key.startswith(b"p:")]
+        return iter(sorted(products, key=lambda p: p['id']))
+
+    def _recent(self, limit):
+        return self._recent_upto(limit, self._next_transaction_id - 1)
+
+    def _transaction_range(self, first_id, last_id):
+        return [json.loads(self.db[self._transaction_key(trans_id)])
+                for trans_id in range(first_id, last_id + 1)]
+
+    def _drop_transactions(self, last_id):
+        db = self.db
+        for trans_id in range(self._first_transaction_id, last_id + 1):
+            del db[self._transaction_key(trans_id)]
+        self._first_transaction_id = last_id + 1
+        self._set_meta('first_transaction_id', self._first_transaction_id)
+        if hasattr(db, 'sync'):
+            db.sync()
+
+    def _recent_upto(self, limit, last_id):
+        result = []
+        trans_id = last_id
+        while trans_id >= self._first_transaction_id and len(result) < limit:
+            result.append(json.loads(self.db[self._transaction_key(trans_id)]))
+            trans_id -= 1
+        return result
+
+
+BACKENDS = {
+    'memory': InMemoryStore,
+    'sqlite': SQLiteStore,
+    'kv': KeyValueStore,
+}
+
+DEFAULT_PATHS = {
+    'sqlite': "plumberry.db",
+    'kv': "plumberry.kv",
+}
+
+
+def get_store(backend=None, path=None):
+    """Create the store selected by arguments or configuration
+
+    Instrumentation settings (PLUMBERRY_METRICS, see metrics.py) are
+    applied the first time a store is created.
+    """
+    metrics.configure_from_env()
+    backend = backend or os.environ.get("PLUMBERRY_BACKEND", "memory")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}'. Choose from: {', '.join(BACKENDS)}")
+    path = path or os.environ.get("PLUMBERRY_DB") or DEFAULT_PATHS.get(backend)
+    store = BACKENDS[backend](path)
+    journal = os.environ.get("PLUMBERRY_AUDIT")
+    if journal:
+        import audit
+        store.journal = audit.AuditLog.open(journal, store)
+    if os.environ.get("PLUMBERRY_ANOMALIES"):
+        import anomalies
+        anomalies.AnomalyDetector(on_alert=anomalies.print_alert).attach(store)
+    history = os.environ.get("PLUMBERRY_RETENTION")
+    if history:
+        import retention
+        retention.Retention.attach(store, history,
+                                   int(os.environ.get("PLUMBERRY_HOT_DAYS", retention.HOT_DAYS)))
+    targets = os.environ.get("PLUMBERRY_NOTIFY")
+    if targets:
+        import notifications
+        notifications.Notifier(
+            [notifications.destination(spec.strip()) for spec in targets.split(",") if spec.strip()],
+            os.environ.get("PLUMBERRY_NOTIFY_SPOOL", notifications.SPOOL_DIR)).attach(store)
+    prices = os.environ.get("PLUMBERRY_PRICES")
+    if prices:
+        import pricing
+        # Apply what fell due while nothing was running
+        pricing.PricingEngine(store, prices).attach().run_due()
+    return store
+
+
+def load_sample_products(store):
+    """Load sample products into an empty store
+
+    Returns True if the samples were added, False if the store already
+    had data (e.g. a persistent backend from an earlier run).
+    """
+    if store.product_count():
+        return False
+    for name, sku, category, price, quantity in SAMPLE_PRODUCTS:
+        store.add_product(name, sku, category, price, quantity)
+    return True
@@ -6,7 +6,22 @@ A modern, web-based UI for managing plumberry inventory
 
 import streamlit as st
 from datetime import datetime
-import pandas as pd
+import io
+import shlex
+
+from storage import (LOW_STOCK_THRESHOLD, PRODUCTS, STOCK, TRANSACTIONS, get_store,
+                     load_sample_products)
+from anomalies import AnomalyDetector
+from categories import CategoryTree
+from indexes import ProductIndex, parse_condition
+from orders import OrderBook
+import querycache
+from replenishment import Planner
+from valuation import CostLedger
+import wire
+
+# pandas is imported by the functions and pages that build DataFrames, so
+# a rerun that shows none of them does not pay for it
 
 # Page configuration
 st.set_page_config(
@@ -42,89 +57,68 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Initialize session state
-if 'products' not in st.session_state:
-    st.session_state.products = {
-        1: {'id': 1, 'name': 'Plumberry Jam', 'sku': 'PLM001', 'category': 'Preserves', 'price': 12.99, 'quantity': 50},
-        2: {'id': 2, 'name': 'Dried Plumberries', 'sku': 'PLM002', 'category': 'Dried Fruits', 'price': 8.50, 'quantity': 100},
-        3: {'id': 3, 'name': 'Plumberry Juice', 'sku': 'PLM003', 'category': 'Beverages', 'price': 5.99, 'quantity': 75},
-        4: {'id': 4, 'name': 'Plumberry Tea', 'sku': 'PLM004', 'category': 'Beverages', 'price': 7.25, 'quantity': 60},
-    }
+if 'store' not in st.session_state:
+    # Backend chosen by PLUMBERRY_BACKEND / PLUMBERRY_DB (see storage.py)
+    st.session_state.store = get_store()
+    load_sample_products(st.session_state.store)
+    # Watches movements for outliers, bursts and shrinkage in the background;
+    # PLUMBERRY_ANOMALIES may have attached one already. It stops with the session's store
+    st.session_state.detector = (st.session_state.store.anomalies
+                                 or AnomalyDetector().attach(st.session_state.store))
+if 'ledger' not in st.session_state:
+    # Cost layers for the valuation report, caught up on each run
+    st.session_state.ledger = CostLedger()
+if 'categories' not in st.session_state:
+    # Category tree with roll-up totals, caught up on each run
+    st.session_state.categories = CategoryTree()
+if 'product_index' not in st.session_state:
+    # Hash / sorted indexes for attribute filters, kept current by the store
+    st.session_state.product_index = ProductIndex(st.session_state.store)
+if 'planner' not in st.session_state:
+    # Replenishment plan, re-planned incrementally on each run
+    st.session_state.planner = Planner(st.session_state.store)
+if 'query_cache' not in st.session_state:
+    # Results of repeated reads, dropped when what they read changes
+    st.session_state.query_cache = querycache.QueryCache(st.session_state.store)
 
-if 'transactions' not in st.session_state:
-    st.session_state.transactions = []
-
-if 'product_id_counter' not in st.session_state:
-    st.session_state.product_id_counter = 5
-
-if 'transaction_id_counter' not in st.session_state:
-    st.session_state.transaction_id_counter = 1
+store = st.session_state.store
+query_cache = st.session_state.query_cache
 
 # Functions
 def add_product(name, sku, category, price, quantity):
     """Add a new product"""
-    # Check if SKU exists
-    for product in st.session_state.products.values():
-        if product['sku'] == sku:
-            return False, "SKU already exists!"
-    
-    st.session_state.products[st.session_state.product_id_counter] = {
-        'id': st.session_state.product_id_counter,
-        'name': name,
-        'sku': sku,
-        'category': category,
-        'price': price,
-        'quantity': quantity
-    }
-    st.session_state.product_id_counter += 1
-    return True, "Product added successfully!"
+    return store.add_product(name, sku, category, price, quantity)
 
-def add_stock(sku, quantity, notes=""):
+def add_stock(sku, quantity, notes="", unit_cost=None):
     """Add stock to existing product"""
-    for product in st.session_state.products.values():
-        if product['sku'] == sku:
-            product['quantity'] += quantity
-            st.session_state.transactions.append({
-                'id': st.session_state.transaction_id_counter,
-                'sku': sku,
-                'product_name': product['name'],
-                'type': 'IN',
-                'quantity': quantity,
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'notes': notes
-            })
-            st.session_state.transaction_id_counter += 1
-            return True, f"Added {quantity} units to {product['name']}"
-    return False, "Product not found!"
+    return store.add_stock(sku, quantity, notes, unit_cost)
 
 def remove_stock(sku, quantity, notes=""):
     """Remove stock from product"""
-    for product in st.session_state.products.values():
-        if product['sku'] == sku:
-            if product['quantity'] < quantity:
-                return False, f"Insufficient stock! Available: {product['quantity']}"
-            product['quantity'] -= quantity
-            st.session_state.transactions.append({
-                'id': st.session_state.transaction_id_counter,
-                'sku': sku,
-                'product_name': product['name'],
-                'type': 'OUT',
-                'quantity': quantity,
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'notes': notes
-            })
-            st.session_state.transaction_id_counter += 1
-            return True, f"Removed {quantity} units from {product['name']}"
-    return False, "Product not found!"
+    return store.remove_stock(sku, quantity, notes)
 
-def get_inventory_df():
-    """Get inventory as DataFrame"""
-    if not st.session_state.products:
+def get_inventory_df(view=None, search_term="", conditions=None):
+    """Get inventory as DataFrame (from the live store or a snapshot)
+
+    conditions are ProductIndex.query filters on fields and attributes.
+    """
+    import pandas as pd
+    if conditions:
+        products = st.session_state.product_index.query(**conditions)
+        if search_term:
+            term = search_term.lower()
+            products = [p for p in products if term in p['sku'].lower() or term in p['name'].lower()]
+    elif search_term:
+        products = store.search_products(search_term)
+    else:
+        products = (view or store).products()
+    if not products:
         return pd.DataFrame()
     
     data = []
-    for product in st.session_state.products.values():
+    for product in products:
         value = product['price'] * product['quantity']
-        status = "🔴 LOW" if product['quantity'] < 30 else "🟢 OK"
+        status = "🔴 LOW" if product['quantity'] < LOW_STOCK_THRESHOLD else "🟢 OK"
         data.append({
             'Status': status,
             'SKU': product['sku'],
@@ -136,13 +130,16 @@ def get_inventory_df():
         })
     return pd.DataFrame(data)
 
-def get_transactions_df():
-    """Get transactions as DataFrame"""
-    if not st.session_state.transactions:
+def get_transactions_df(view=None, recent=None):
+    """Get transactions as DataFrame (from the live store or a snapshot)"""
+    import pandas as pd
+    if recent is None:
+        recent = (view or store).recent_transactions(50)
+    if not recent:
         return pd.DataFrame()
     
     data = []
-    for trans in reversed(st.session_state.transactions[-50:]):
+    for trans in recent:
         symbol = "➕ IN" if trans['type'] == 'IN' else "➖ OUT"
         data.append({
             'Type': symbol,
@@ -155,6 +152,45 @@ def get_transactions_df():
         })
     return pd.DataFrame(data)
 
+def wire_export(dump):
+    """Bytes of a binary wire export (see wire.py)"""
+    buffer = io.BytesIO()
+    dump(store, buffer)
+    return buffer.getvalue()
+
+def cached_section(key, sections, compute):
+    """Result of compute(), recomputed only when the store's sections change"""
+    return query_cache.get(key, (), compute, depends=sections)
+
+def search_depends(search_term):
+    """Dependencies of an inventory listing: a search result reads only its own SKUs"""
+    if not search_term:
+        return (PRODUCTS, STOCK)
+    return lambda df: [PRODUCTS] + [querycache.sku(value) for value in df.get('SKU', ())]
+
+def top_products_df(products, count=5):
+    """Products with the highest inventory value"""
+    import pandas as pd
+    return pd.DataFrame([{'Product': p['name'], 'Value': p['price'] * p['quantity']}
+                         for p in products]).nlargest(count, 'Value')
+
+def category_df(tree, node_id):
+    """Totals of the children of a category node"""
+    import pandas as pd
+    children = tree.children(node_id)
+    return pd.DataFrame({
+        'Category': [node.name for node in children],
+        'Count': [node.products for node in children],
+        'Units': [node.units for node in children],
+        'Value ($)': [float(node.amount) for node in children]
+    })
+
+def report_data():
+    """Products, inventory and transactions from one snapshot"""
+    # Pinned so charts and exports agree while stock keeps moving
+    with store.snapshot() as snap:
+        return snap.products(), get_inventory_df(snap), get_transactions_df(snap)
+
 # Sidebar navigation
 st.sidebar.title("🍇 Navigation")
 page = st.sidebar.radio("Go to", [
@@ -172,45 +208,80 @@ st.sidebar.info("Plumberry Inventory System v1.0\n\nManage your inventory withou
 if page == "Dashboard":
     st.title("🍇 Plumberry Inventory Dashboard")
     
-    # Metrics
-    total_products = len(st.session_state.products)
-    total_value = sum(p['price'] * p['quantity'] for p in st.session_state.products.values())
-    low_stock = sum(1 for p in st.session_state.products.values() if p['quantity'] < 30)
-    total_transactions = len(st.session_state.transactions)
+    # Each section is a fragment that reruns on its own (every few seconds
+    # when live) and recomputes only after a change to the data it shows
+    live = st.sidebar.toggle("Live updates", value=False)
+    refresh = st.sidebar.select_slider("Refresh every (s)", [1, 2, 5, 10, 30], value=2,
+                                       disabled=not live)
+    run_every = refresh if live else None
     
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        st.metric("Total Products", total_products)
-    with col2:
-        st.metric("Total Value", f"${total_value:,.2f}")
-    with col3:
-        st.metric("Low Stock Items", low_stock, delta=None if low_stock == 0 else "Alert", delta_color="inverse")
-    with col4:
-        st.metric("Total Transactions", total_transactions)
+    def dashboard_metrics():
+        with store.snapshot() as snap:
+            products = snap.products()
+            total_transactions = snap.transaction_count()
+        total_value = sum(p['price'] * p['quantity'] for p in products)
+        low_stock = sum(1 for p in products if p['quantity'] < LOW_STOCK_THRESHOLD)
+        return len(products), total_value, low_stock, total_transactions
+    
+    @st.fragment(run_every=run_every)
+    def metrics_section():
+        total_products, total_value, low_stock, total_transactions = cached_section(
+            'dashboard_metrics', (PRODUCTS, STOCK, TRANSACTIONS), dashboard_metrics)
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Total Products", total_products)
+        with col2:
+            st.metric("Total Value", f"${total_value:,.2f}")
+        with col3:
+            st.metric("Low Stock Items", low_stock, delta=None if low_stock == 0 else "Alert", delta_color="inverse")
+        with col4:
+            st.metric("Total Transactions", total_transactions)
+    
+    @st.fragment(run_every=run_every)
+    def inventory_section():
+        st.subheader("📦 Current Inventory")
+        df = cached_section('dashboard_inventory', (PRODUCTS, STOCK), get_inventory_df)
+        if not df.empty:
+            st.dataframe(df, use_container_width=True, hide_index=True)
+        else:
+            st.info("No products in inventory.")
+    
+    @st.fragment(run_every=run_every)
+    def transactions_section():
+        st.subheader("📊 Recent Transactions")
+        trans_df = cached_section('dashboard_transactions', (TRANSACTIONS,),
+                                  lambda: get_transactions_df(recent=store.recent_transactions(10)))
+        if not trans_df.empty:
+            st.dataframe(trans_df, use_container_width=True, hide_index=True)
+        else:
+            st.info("No transactions recorded.")
+    
+    # Metrics
+    metrics_section()
     
     st.markdown("---")
     
     # Current Inventory
-    st.subheader("📦 Current Inventory")
-    df = get_inventory_df()
-    if not df.empty:
-        st.dataframe(df, use_container_width=True, hide_index=True)
-    else:
-        st.info("No products in inventory.")
+    inventory_section()
+    
+    @st.fragment(run_every=run_every)
+    def anomalies_section():
+        alerts = st.session_state.detector.recent(10)
+        if alerts:
+            st.subheader("🚨 Anomalies")
+            for alert in alerts:
+                st.warning(f"**{alert.sku}** ({alert.kind}, {alert.timestamp}): {alert.message}")
     
     # Recent Transactions
     st.markdown("---")
-    st.subheader("📊 Recent Transactions")
-    trans_df = get_transactions_df()
-    if not trans_df.empty:
-        st.dataframe(trans_df.head(10), use_container_width=True, hide_index=True)
-    else:
-        st.info("No transactions recorded.")
+    transactions_section()
+    
+    anomalies_section()
 
 elif page == "Inventory Management":
     st.title("📦 Inventory Management")
     
-    tab1, tab2 = st.tabs(["➕ Add Product", "🔍 View Inventory"])
+    tab1, tab2, tab3 = st.tabs(["➕ Add Product", "🔍 View Inventory", "🏷️ Attributes"])
     
     with tab1:
         st.subheader("Add New Product")
@@ -219,7 +290,7 @@ elif page == "Inventory Management":
             with col1:
                 name = st.text_input("Product Name *")
                 sku = st.text_input("SKU *").upper()
-                category = st.text_input("Category *")
+                category = st.text_input("Category *", help="Subcategories with '>', e.g. Beverages > Juice")
             with col2:
                 price = st.number_input("Price ($) *", min_value=0.0, step=0.01, format="%.2f")
                 quantity = st.number_input("Initial Quantity *", min_value=0, step=1)
@@ -246,16 +317,25 @@ elif page == "Inventory Management":
         search_col1, search_col2 = st.columns([3, 1])
         with search_col1:
             search_term = st.text_input("Search by SKU or Product Name", "")
+        with search_col2:
+            filter_text = st.text_input("Filter", "", placeholder="price<6 supplier=Acme",
+                                        help="Conditions on fields and attributes: =, <, <=, >, >=")
         
-        df = get_inventory_df()
+        conditions = None
+        if filter_text.strip():
+            try:
+                conditions = dict(parse_condition(text) for text in shlex.split(filter_text))
+                st.caption(f"Plan: {st.session_state.product_index.explain(**conditions)}")
+            except ValueError as e:
+                st.error(str(e))
+        if conditions:
+            df = get_inventory_df(search_term=search_term, conditions=conditions)
+        else:
+            df = query_cache.get('inventory', (search_term,),
+                                 lambda: get_inventory_df(search_term=search_term),
+                                 depends=search_depends(search_term))
         
         if not df.empty:
-            if search_term:
-                df = df[
-                    df['SKU'].str.contains(search_term, case=False, na=False) |
-                    df['Product Name'].str.contains(search_term, case=False, na=False)
-                ]
-            
             st.dataframe(df, use_container_width=True, hide_index=True)
             
             # Summary
@@ -266,6 +346,33 @@ elif page == "Inventory Management":
             with col2:
                 total = sum(float(v.replace('$', '').replace(',', '')) for v in df['Value ($)'])
                 st.metric("Total Value", f"${total:,.2f}")
+        elif search_term or conditions:
+            st.info("No products match the search.")
+        else:
+            st.info("No products in inventory.")
+    
+    with tab3:
+        st.subheader("Product Attributes")
+        products = store.products()
+        if products:
+            sku = st.selectbox("Product", [p['sku'] for p in products],
+                               format_func=lambda s: f"{s} - {store.get_product(s)['name']}")
+            current = store.get_attributes(sku)
+            with st.form("attributes_form"):
+                text = st.text_area("Attributes (one NAME=VALUE per line, NAME= removes)",
+                                    "\n".join(f"{name}={value}" for name, value in current.items()),
+                                    help="e.g. supplier, flavor, pack_size, shelf_zone")
+                if st.form_submit_button("Save Attributes", use_container_width=True):
+                    attributes = dict.fromkeys(current)
+                    for line in text.splitlines():
+                        name, _, value = line.partition("=")
+                        if name.strip():
+                            attributes[name.strip()] = value.strip() or None
+                    success, message = store.set_attributes(sku, attributes)
+                    if success:
+                        st.success(message)
+                    else:
+                        st.error(message)
         else:
             st.info("No products in inventory.")
 
@@ -277,20 +384,21 @@ elif page == "Stock Transactions":
     with tab1:
         st.subheader("Add Stock (Incoming Inventory)")
         with st.form("add_stock_form"):
-            sku_list = [p['sku'] for p in st.session_state.products.values()]
+            sku_list = [p['sku'] for p in store.products()]
             sku = st.selectbox("Select Product SKU", sku_list)
             
             # Show current stock
-            current_stock = next((p['quantity'] for p in st.session_state.products.values() if p['sku'] == sku), 0)
+            current_stock = (store.get_stock_level(sku) or 0) if sku else 0
             st.info(f"Current Stock: {current_stock} units")
             
             quantity = st.number_input("Quantity to Add", min_value=1, step=1)
+            unit_cost = st.number_input("Unit Cost ($, 0 = current price)", min_value=0.0, step=0.01, format="%.2f")
             notes = st.text_area("Notes (optional)")
             
             submitted = st.form_submit_button("Add Stock", use_container_width=True)
             
             if submitted:
-                success, message = add_stock(sku, quantity, notes)
+                success, message = add_stock(sku, quantity, notes, unit_cost or None)
                 if success:
                     st.success(message)
                 else:
@@ -299,11 +407,11 @@ elif page == "Stock Transactions":
     with tab2:
         st.subheader("Remove Stock (Sales/Outgoing)")
         with st.form("remove_stock_form"):
-            sku_list = [p['sku'] for p in st.session_state.products.values()]
+            sku_list = [p['sku'] for p in store.products()]
             sku = st.selectbox("Select Product SKU", sku_list, key="remove_sku")
             
             # Show current stock
-            current_stock = next((p['quantity'] for p in st.session_state.products.values() if p['sku'] == sku), 0)
+            current_stock = (store.get_stock_level(sku) or 0) if sku else 0
             st.info(f"Available Stock: {current_stock} units")
             
             quantity = st.number_input("Quantity to Remove", min_value=1, max_value=current_stock if current_stock > 0 else 1, step=1)
@@ -321,49 +429,85 @@ elif page == "Stock Transactions":
     with tab3:
         st.subheader("Transaction History")
         
-        trans_df = get_transactions_df()
+        # Filters run in the store; pages are keyset-paginated by id
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            trans_type = st.selectbox("Filter by Type", ["All", "➕ IN", "➖ OUT"])
+        with col2:
+            sku_filter = st.selectbox("Filter by SKU", ["All"] + [p['sku'] for p in store.products()])
+        with col3:
+            page_size = st.selectbox("Rows per page", [20, 50, 100], index=1)
+        col1, col2 = st.columns(2)
+        with col1:
+            dates = st.date_input("Date range", value=(), key="history_dates")
+        with col2:
+            text = st.text_input("Notes contain").strip()
         
-        if not trans_df.empty:
-            # Filter options
-            col1, col2 = st.columns(2)
+        filters = {
+            'trans_type': {"➕ IN": 'IN', "➖ OUT": 'OUT'}.get(trans_type),
+            'sku': None if sku_filter == "All" else sku_filter,
+            'start': f"{dates[0]} 00:00:00" if len(dates) > 0 else None,
+            'end': f"{dates[-1]} 23:59:59" if len(dates) > 0 else None,
+            'text': text or None,
+        }
+        # Stack of before_id cursors of the pages visited so far
+        if st.session_state.get('history_filters') != (filters, page_size):
+            st.session_state.history_filters = (filters, page_size)
+            st.session_state.history_cursors = [None]
+        cursors = st.session_state.history_cursors
+        
+        page_rows = store.query_transactions(before_id=cursors[-1], limit=page_size, **filters)
+        total = store.count_transactions(**filters)
+        
+        if page_rows:
+            first = (len(cursors) - 1) * page_size + 1
+            st.caption(f"Showing {first:,}–{first + len(page_rows) - 1:,} of {total:,} transactions")
+            trans_df = get_transactions_df(recent=page_rows)
+            st.dataframe(trans_df, use_container_width=True, hide_index=True)
+            
+            col1, col2, col3 = st.columns([1, 1, 2])
             with col1:
-                trans_type = st.selectbox("Filter by Type", ["All", "➕ IN", "➖ OUT"])
+                if st.button("◀ Newer", disabled=len(cursors) == 1):
+                    cursors.pop()
+                    st.rerun()
             with col2:
-                limit = st.slider("Show last N transactions", 10, 100, 20)
-            
-            # Apply filters
-            filtered_df = trans_df.head(limit)
-            if trans_type != "All":
-                filtered_df = filtered_df[filtered_df['Type'] == trans_type]
-            
-            st.dataframe(filtered_df, use_container_width=True, hide_index=True)
-            
-            # Download option
-            csv = filtered_df.to_csv(index=False)
-            st.download_button(
-                label="📥 Download as CSV",
-                data=csv,
-                file_name=f"transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
-            )
+                if st.button("Older ▶", disabled=first + len(page_rows) > total):
+                    cursors.append(page_rows[-1]['id'])
+                    st.rerun()
+            with col3:
+                # Download option
+                csv = trans_df.to_csv(index=False)
+                st.download_button(
+                    label="📥 Download page as CSV",
+                    data=csv,
+                    file_name=f"transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                    mime="text/csv"
+                )
+        elif total or len(cursors) > 1:
+            cursors[:] = [None]
+            st.rerun()
+        elif any(filters.values()):
+            st.info("No transactions match these filters.")
         else:
             st.info("No transactions recorded yet.")
 
 elif page == "Reports":
+    import pandas as pd
     st.title("📈 Reports & Analytics")
     
     # Inventory Report
     st.subheader("📦 Inventory Summary Report")
     
-    df = get_inventory_df()
+    products, df, trans_df = query_cache.get('report', (), report_data,
+                                             depends=(PRODUCTS, STOCK, TRANSACTIONS))
     
     if not df.empty:
         col1, col2 = st.columns(2)
         
         with col1:
             st.markdown("#### Stock Status")
-            low_stock_items = len([p for p in st.session_state.products.values() if p['quantity'] < 30])
-            ok_stock_items = len(st.session_state.products) - low_stock_items
+            low_stock_items = len([p for p in products if p['quantity'] < LOW_STOCK_THRESHOLD])
+            ok_stock_items = len(products) - low_stock_items
             
             status_data = pd.DataFrame({
                 'Status': ['🟢 OK', '🔴 LOW'],
@@ -373,35 +517,48 @@ elif page == "Reports":
         
         with col2:
             st.markdown("#### Category Distribution")
-            category_data = {}
-            for p in st.session_state.products.values():
-                category_data[p['category']] = category_data.get(p['category'], 0) + 1
+            tree = st.session_state.categories
+            tree.sync(store)
+            # Drill down into any category that has subcategories
+            parents = sorted((tree.path(node.id), node.id) for node in tree.nodes[1:] if node.children)
+            choice = st.selectbox("Category", ["All"] + [path for path, _ in parents])
+            node_id = dict(parents).get(choice, 0)
             
-            cat_df = pd.DataFrame({
-                'Category': list(category_data.keys()),
-                'Count': list(category_data.values())
-            })
-            st.bar_chart(cat_df.set_index('Category'))
+            # A drill-down only reads the stock of its own category
+            cat_df = query_cache.get('categories', (node_id,), lambda: category_df(tree, node_id),
+                                     depends=(PRODUCTS, querycache.category(choice)) if node_id
+                                     else (PRODUCTS, STOCK))
+            st.bar_chart(cat_df.set_index('Category')['Count'])
+            if node_id:
+                st.dataframe(cat_df, use_container_width=True, hide_index=True)
         
         st.markdown("---")
         
         # Top Products by Value
         st.subheader("💰 Top Products by Inventory Value")
-        products_list = []
-        for p in st.session_state.products.values():
-            value = p['price'] * p['quantity']
-            products_list.append({
-                'Product': p['name'],
-                'Value': value
-            })
+        top_df = query_cache.get('top_products', (5,), lambda: top_products_df(products, 5),
+                                 depends=(PRODUCTS, STOCK))
+        st.bar_chart(top_df.set_index('Product'))
         
-        top_products_df = pd.DataFrame(products_list).sort_values('Value', ascending=False).head(5)
-        st.bar_chart(top_products_df.set_index('Product'))
+        # Valuation
+        st.markdown("---")
+        st.subheader("💰 Inventory Valuation")
+        as_of = st.date_input("Value as of", value=datetime.now().date())
+        ledger = st.session_state.ledger
+        ledger.sync(store)
+        valuation = ledger.valuation(as_of)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Units on Hand", valuation.quantity)
+        with col2:
+            st.metric("FIFO Cost", f"${valuation.fifo:,.2f}")
+        with col3:
+            st.metric("Weighted-Average Cost", f"${valuation.average:,.2f}")
         
         # Low Stock Alert
         st.markdown("---")
         st.subheader("⚠️ Low Stock Alerts")
-        low_stock_products = [p for p in st.session_state.products.values() if p['quantity'] < 30]
+        low_stock_products = [p for p in products if p['quantity'] < LOW_STOCK_THRESHOLD]
         
         if low_stock_products:
             for p in low_stock_products:
@@ -409,6 +566,27 @@ elif page == "Reports":
         else:
             st.success("All products are adequately stocked!")
         
+        # Replenishment
+        st.markdown("---")
+        st.subheader("🛒 Suggested Purchase Orders")
+        plan = st.session_state.planner.replan()
+        if len(plan):
+            for proposal in plan:
+                with st.expander(f"{'🔴 ' if proposal.urgent else ''}{proposal}"):
+                    st.dataframe(pd.DataFrame(
+                        [{'SKU': sku, 'Quantity': quantity, 'Unit Cost ($)': f"${unit_cost:.2f}"}
+                         for sku, quantity, unit_cost in proposal.lines]),
+                        use_container_width=True, hide_index=True)
+            ready = plan.ready()
+            if ready and st.button(f"Create {len(ready)} Purchase Order(s)"):
+                for success, message, _ in plan.create_orders(OrderBook(store)):
+                    if success:
+                        st.success(message)
+                    else:
+                        st.error(message)
+        else:
+            st.success("Nothing to reorder: stock and open purchase orders cover forecast demand.")
+        
         # Export Report
         st.markdown("---")
         st.subheader("📥 Export Options")
@@ -424,7 +602,6 @@ elif page == "Reports":
             )
         
         with col2:
-            trans_df = get_transactions_df()
             if not trans_df.empty:
                 trans_csv = trans_df.to_csv(index=False)
                 st.download_button(
@@ -433,9 +610,32 @@ elif page == "Reports":
                     file_name=f"transactions_report_{datetime.now().strftime('%Y%m%d')}.csv",
                     mime="text/csv"
                 )
+        
+        # Typed binary exports for other systems (POS), rebuilt only after changes
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                label="Download Inventory Snapshot (binary)",
+                data=cached_section('export_products', (PRODUCTS, STOCK),
+                                    lambda: wire_export(wire.dump_products)),
+                file_name=f"inventory_{datetime.now().strftime('%Y%m%d')}.plw",
+                mime="application/octet-stream"
+            )
+        with col2:
+            st.download_button(
+                label="Download Transaction Log (binary)",
+                data=cached_section('export_transactions', (TRANSACTIONS,),
+                                    lambda: wire_export(wire.dump_transactions)),
+                file_name=f"transactions_{datetime.now().strftime('%Y%m%d')}.plw",
+                mime="application/octet-stream"
+            )
     else:
         st.info("No data available for reports.")
 
+stats = query_cache.stats()
+st.sidebar.caption(f"Query cache: {stats['entries']} results, {stats['hit_rate']:.0%} hits "
+                   f"({stats['hits']}/{stats['hits'] + stats['misses']})")
+
 # Footer
 st.markdown("---")
 st.markdown(
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Inventory Valuation
+Cost layers and inventory value computed from the stock movement log.
+
+Money is handled in integer cents. Every IN movement records a unit cost
+(the product's price when none is given), and CostLedger replays the
+movements in id order, keeping for every SKU:
+
+  - FIFO cost layers: a queue of [quantity, unit cost]; OUT movements
+    consume the oldest layers first
+  - a moving weighted-average cost: on-hand quantity and total cost
+
+Each movement costs O(1) amortized, since a layer is consumed at most
+once. After every movement the ledger also appends the SKU's quantity
+and FIFO / average value to columnar logs, so the value of the whole
+inventory as of any date is a single numpy pass over those columns.
+
+Stock a product already had when the ledger first saw it becomes an
+opening layer at the product's price, dated at the SKU's first movement
+(or at the start of the log for products present on the first sync).
+"""
+
+from array import array
+from collections import deque
+from datetime import date, datetime
+from decimal import ROUND_HALF_UP, Decimal
+
+CENT = Decimal("0.01")
+
+# Timestamps are compared as integers: "2026-10-19 14:03:00" -> 20261019140300
+BEGINNING = 0
+
+
+def to_cents(amount):
+    """Exact integer cents for a price/cost (int, float, str or Decimal)"""
+    if isinstance(amount, int):
+        return amount * 100
+    if isinstance(amount, float):
+        # Whole cents (the usual case) need no Decimal round trip
+        scaled = amount * 100
+        cents = round(scaled)
+        if abs(scaled - cents) < 1e-6:
+            return cents
+        amount = repr(amount)
+    return int(Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2))
+
+
+def from_cents(cents):
+    """Decimal amount for integer cents"""
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def time_key(when):
+    """Sortable integer for a transaction timestamp, date or datetime
+
+    A date means the end of that day.
+    """
+    if when is None:
+        return 99999999999999
+    if isinstance(when, datetime):
+        return int(when.strftime("%Y%m%d%H%M%S"))
+    if isinstance(when, date):
+        return int(when.strftime("%Y%m%d")) * 1000000 + 235959
+    digits = when.replace("-", "").replace(":", "").replace(" ", "").replace("T", "")
+    if len(digits) == 8:
+        digits += "235959"
+    return int(digits)
+
+
+class Valuation:
+    """Inventory value as of one point in time (amounts in cents)"""
+
+    def __init__(self, as_of, skus, quantities, fifo_values, average_values):
+        self.as_of = as_of
+        self.skus = skus
+        self.quantities = quantities
+        self.fifo_values = fifo_values
+        self.average_values = average_values
+
+    @property
+    def quantity(self):
+        return int(self.quantities.sum())
+
+    @property
+    def fifo(self):
+        """Total value at FIFO cost (Decimal)"""
+        return from_cents(self.fifo_values.sum())
+
+    @property
+    def average(self):
+        """Total value at moving weighted-average cost (Decimal)"""
+        return from_cents(self.average_values.sum())
+
+    def rows(self):
+        """(sku, quantity, FIFO value, average value) per SKU with stock"""
+        for sku, quantity, fifo, average in zip(self.skus, self.quantities.tolist(),
+                                                self.fifo_values.tolist(),
+                                                self.average_values.tolist()):
+            if quantity:
+                yield sku, quantity, from_cents(fifo), from_cents(average)
+
+
+class CostLedger:
+    """FIFO layers and weighted-average cost per SKU
+
+    Feed it with sync(store), which replays the transactions committed
+    since the previous sync. Not thread-safe; keep one ledger per thread
+    (or per Streamlit session).
+    """
+
+    def __init__(self):
+        self.skus = []
+        self._index = {}
+        self._layers = []
+        self._quantity = []
+        self._fifo_value = []
+        self._average_value = []
+        self.last_id = 0
+        self.cogs_fifo = 0
+        self.cogs_average = 0
+        self._products_seen = 0
+        self._last_time = BEGINNING
+        self._last_stamp = (None, BEGINNING)
+        # One entry per movement: when, which SKU, and its state afterwards
+        self.times = array('q')
+        self.sku_ids = array('q')
+        self.quantities = array('q')
+        self.fifo_values = array('q')
+        self.average_values = array('q')
+
+    def _sku_id(self, sku):
+        index = self._index.get(sku)
+        if index is None:
+            index = self._index[sku] = len(self.skus)
+            self.skus.append(sku)
+            self._layers.append(deque())
+            self._quantity.append(0)
+            self._fifo_value.append(0)
+            self._average_value.append(0)
+        return index
+
+    def _log(self, index, when):
+        # Keep the log sorted by time even if commits raced on the clock
+        if when < self._last_time:
+            when = self._last_time
+        self._last_time = when
+        self.times.append(when)
+        self.sku_ids.append(index)
+        self.quantities.append(self._quantity[index])
+        self.fifo_values.append(self._fifo_value[index])
+        self.average_values.append(self._average_value[index])
+
+    def receive(self, sku, quantity, unit_cost, when=BEGINNING):
+        """Stock in at unit_cost cents per unit"""
+        index = self._sku_id(sku)
+        if quantity <= 0:
+            return
+        self._layers[index].append([quantity, unit_cost])
+        self._quantity[index] += quantity
+        self._fifo_value[index] += quantity * unit_cost
+        self._average_value[index] += quantity * unit_cost
+        self._log(index, when)
+
+    def issue(self, sku, quantity, when=BEGINNING):
+        """Stock out; returns the FIFO cost of the issued units in cents"""
+        index = self._sku_id(sku)
+        on_hand = self._quantity[index]
+        quantity = min(quantity, on_hand)
+        if quantity <= 0:
+            return 0
+
+        layers = self._layers[index]
+        cost = 0
+        remaining = quantity
+        while remaining:
+            layer = layers[0]
+            taken = min(remaining, layer[0])
+            cost += taken * layer[1]
+            remaining -= taken
+            layer[0] -= taken
+            if not layer[0]:
+                layers.popleft()
+
+        # Average cost of the issued units, rounded half up to the cent
+        total = self._average_value[index]
+        average_cost = (2 * total * quantity + on_hand) // (2 * on_hand)
+
+        self._quantity[index] = on_hand - quantity
+        self._fifo_value[index] -= cost
+        self._average_value[index] = total - average_cost
+        self.cogs_fifo += cost
+        self.cogs_average += average_cost
+        self._log(index, when)
+        return cost
+
+    def _when(self, timestamp):
+        # Movements in a batch share one timestamp string
+        if timestamp != self._last_stamp[0]:
+            self._last_stamp = (timestamp, time_key(timestamp))
+        return self._last_stamp[1]
+
+    def apply(self, record):
+        """Replay one transaction record"""
+        when = self._when(record['timestamp'])
+        if record['type'] == 'IN':
+            unit_cost = record.get('unit_cost')
+            self.receive(record['sku'], record['quantity'], 0 if unit_cost is None else unit_cost, when)
+        else:
+            self.issue(record['sku'], record['quantity'], when)
+        self.last_id = record['id']
+
+    def sync(self, store):
+        """Catch up with the transactions committed since the last sync
+
+        Products and the transaction count come from one snapshot, so
+        they agree. The new transactions are read by id range, through the
+        retention tiers if they have been compacted; a gap raises
+        ValueError rather than skipping movements. Returns the number of
+        transactions applied.
+        """
+        with store.snapshot() as snap:
+            count = snap.transaction_count()
+            opened = snap.product_count() != self._products_seen
+            products = snap.products() if opened else ()
+        # Transactions are append-only, so ids up to count are fixed
+        new = store.get_transactions(self.last_id + 1, count) if count > self.last_id else []
+        if len(new) != count - self.last_id:
+            raise ValueError(f"Transactions {self.last_id + 1}-{count} are not all in the store "
+                             f"or its retention tiers: found {len(new)} of {count - self.last_id}")
+
+        # Stock products had before the ledger saw them: opened just before
+        # their first movement, else at the start of the log (first sync)
+        # or now
+        pending = {}
+        later = []
+        if opened:
+            self._products_seen = len(products)
+            net = {}
+            for record in new:
+                sign = 1 if record['type'] == 'IN' else -1
+                net[record['sku']] = net.get(record['sku'], 0) + sign * record['quantity']
+            initial = not self.times and not self.last_id
+            for product in products:
+                sku = product['sku']
+                if sku in self._index:
+                    continue
+                opening = (product['quantity'] - net.get(sku, 0), to_cents(product['price']))
+                if sku in net:
+                    pending[sku] = opening
+                elif initial:
+                    self.receive(sku, *opening, BEGINNING)
+                else:
+                    later.append((sku, opening))
+
+        for record in new:
+            if pending and record['sku'] in pending:
+                self.receive(record['sku'], *pending.pop(record['sku']), self._when(record['timestamp']))
+            self.apply(record)
+        if later:
+            now = time_key(datetime.now())
+            for sku, opening in later:
+                self.receive(sku, *opening, now)
+        return len(new)
+
+    # Queries
+
+    def quantity(self, sku):
+        index = self._index.get(sku)
+        return self._quantity[index] if index is not None else 0
+
+    def layers(self, sku):
+        """Remaining FIFO layers, oldest first: [(quantity, unit cost), ...]"""
+        index = self._index.get(sku)
+        if index is None:
+            return []
+        return [(quantity, from_cents(cost)) for quantity, cost in self._layers[index]]
+
+    def average_cost(self, sku):
+        """Moving weighted-average unit cost (Decimal, to the cent)"""
+        index = self._index.get(sku)
+        if index is None or not self._quantity[index]:
+            return None
+        return (from_cents(self._average_value[index]) / self._quantity[index]).quantize(
+            CENT, rounding=ROUND_HALF_UP)
+
+    def valuation(self, as_of=None):
+        """Value of every SKU as of a date/datetime/timestamp (None: now)
+
+        Finds each SKU's last movement at or before `as_of` and reads its
+        logged state, vectorized over the whole log.
+        """
+        import numpy as np
+
+        times = np.frombuffer(self.times, dtype=np.int64)
+        cutoff = int(np.searchsorted(times, time_key(as_of), side='right'))
+        sku_ids = np.frombuffer(self.sku_ids, dtype=np.int64)[:cutoff]
+
+        last = np.full(len(self.skus), -1, dtype=np.int64)
+        np.maximum.at(last, sku_ids, np.arange(cutoff, dtype=np.int64))
+        seen = last >= 0
+        last = last[seen]
+        skus = np.array(self.skus, dtype=object)[seen] if len(self.skus) else np.array([], dtype=object)
+        return Valuation(as_of, skus.tolist(),
+                         np.frombuffer(self.quantities, dtype=np.int64)[last],
+                         np.frombuffer(self.fifo_values, dtype=np.int64)[last],
+                         np.frombuffer(self.average_values, dtype=np.int64)[last])
+
+
+def value_inventory(store, as_of=None, ledger=None):
+    """Valuation of a store's inventory (builds or refreshes a ledger)"""
+    ledger = ledger or CostLedger()
+    ledger.sync(store)
+    return ledger.valuation(as_of)
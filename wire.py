@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Plumberry Inventory Management System - Binary Wire Format
+Compact, typed interchange of product snapshots and movement batches.
+
+A wire stream is an 8-byte header followed by frames:
+
+    b"PLMWIRE" + version byte
+    frame:   kind (4s), record count, string table size, crc32 (uint32 each)
+             records: count fixed-width little-endian records
+             string table: UTF-8 bytes, zero-padded to a multiple of 8
+
+Strings inside records are (offset, length) pairs into the frame's string
+table, so repeated SKUs, categories and notes are stored once per frame.
+Money is integer cents, timestamps are YYYYMMDDhhmmss integers.
+
+    PROD  name, sku, category, price (cents), quantity              40 bytes
+    MOVE  sku, product_name, notes, type (0 IN / 1 OUT), quantity,
+          unit_cost (cents, -1 none), id, order_id, timestamp,
+          uid (0 none, see ids.py)                                  80 bytes
+
+Every record is a whole number of 8-byte words and every section starts
+8-byte aligned, so a reader maps a frame without copying: Frame.column()
+is a strided memoryview over one field of all records, and rows are
+unpacked lazily with struct.unpack_from. Frames are self-contained, so
+writers stream them out as they fill and readers handle one at a time.
+"""
+
+import mmap
+import struct
+import zlib
+
+from valuation import from_cents, time_key, to_cents
+
+MAGIC = b"PLMWIRE"
+# 2: movements carry their uid
+VERSION = 2
+HEADER = MAGIC + bytes([VERSION])
+FRAME = struct.Struct("<4sIII")
+
+PRODUCTS = b"PROD"
+MOVEMENTS = b"MOVE"
+RECORDS = {
+    PRODUCTS: struct.Struct("<IIIIIIqq"),
+    MOVEMENTS: struct.Struct("<IIIIIIqqqqqqq"),
+}
+# Field -> (word type, index in words of that type) for Frame.column
+FIELDS = {
+    PRODUCTS: {'name': ('I', 0), 'sku': ('I', 2), 'category': ('I', 4),
+               'price': ('q', 3), 'quantity': ('q', 4)},
+    MOVEMENTS: {'sku': ('I', 0), 'product_name': ('I', 2), 'notes': ('I', 4),
+                'type': ('q', 3), 'quantity': ('q', 4), 'unit_cost': ('q', 5),
+                'id': ('q', 6), 'order_id': ('q', 7), 'timestamp': ('q', 8),
+                'uid': ('q', 9)},
+}
+TYPES = ('IN', 'OUT')
+TYPE_CODES = {'IN': 0, 'OUT': 1}
+
+FRAME_RECORDS = 65536
+
+
+def _timestamp(when):
+    """'YYYY-MM-DD HH:MM:SS' back from a YYYYMMDDhhmmss integer"""
+    digits = f"{when:014d}"
+    return (f"{digits[0:4]}-{digits[4:6]}-{digits[6:8]} "
+            f"{digits[8:10]}:{digits[10:12]}:{digits[12:14]}")
+
+
+class WireWriter:
+    """Streaming writer: buffers up to frame_records records, then emits a frame
+
+    Use as a context manager (or call close()) so the last frame is written.
+    """
+
+    def __init__(self, f, frame_records=FRAME_RECORDS):
+        self.f = f
+        self.frame_records = frame_records
+        self.records_written = 0
+        self._kind = None
+        self._records = bytearray()
+        self._count = 0
+        self._strings = bytearray()
+        self._refs = {}
+        f.write(HEADER)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _string(self, text):
+        """(offset, length) of a string in the current frame's table"""
+        ref = self._refs.get(text)
+        if ref is None:
+            data = (text or "").encode()
+            ref = self._refs[text] = (len(self._strings), len(data))
+            self._strings += data
+        return ref
+
+    def _start(self, kind):
+        if self._kind != kind:
+            self.flush()
+            self._kind = kind
+
+    def _added(self):
+        self._count += 1
+        if self._count == self.frame_records:
+            self.flush()
+
+    def write_products(self, products):
+        """Write (name, sku, category, price, quantity) rows or product dicts"""
+        pack = RECORDS[PRODUCTS].pack
+        self._start(PRODUCTS)
+        refs = self._refs
+        for product in products:
+            if isinstance(product, dict):
+                product = (product['name'], product['sku'], product['category'],
+                           product['price'], product['quantity'])
+            name, sku, category, price, quantity = product
+            name = refs.get(name) or self._string(name)
+            sku = refs.get(sku) or self._string(sku)
+            category = refs.get(category) or self._string(category)
+            self._records += pack(name[0], name[1], sku[0], sku[1], category[0], category[1],
+                                  to_cents(price), quantity)
+            self._count += 1
+            if self._count == self.frame_records:
+                self.flush()
+                self._kind = PRODUCTS
+                refs = self._refs
+
+    def write_movements(self, movements):
+        """Write transaction records (dicts) or (sku, type, quantity[, notes[, unit_cost]]) tuples
+
+        Tuple unit costs are amounts (like Store.apply_movements); record
+        unit costs are already cents.
+        """
+        pack = RECORDS[MOVEMENTS].pack
+        string = self._string
+        last_stamp = (None, 0)
+        for movement in movements:
+            if isinstance(movement, dict):
+                sku, trans_type, quantity = movement['sku'], movement['type'], movement['quantity']
+                name, notes = movement.get('product_name'), movement.get('notes')
+                unit_cost = movement.get('unit_cost')
+                record_id, order_id = movement.get('id') or 0, movement.get('order_id') or 0
+                uid = movement.get('uid') or 0
+                stamp = movement.get('timestamp')
+                if stamp != last_stamp[0]:
+                    last_stamp = (stamp, time_key(stamp) if stamp else 0)
+                when = last_stamp[1]
+            else:
+                sku, trans_type, quantity, *rest = movement
+                notes = rest[0] if rest else ""
+                unit_cost = to_cents(rest[1]) if len(rest) > 1 and rest[1] is not None else None
+                name, record_id, order_id, when, uid = None, 0, 0, 0, 0
+            self._start(MOVEMENTS)
+            self._records += pack(*string(sku), *string(name), *string(notes),
+                                  TYPE_CODES[trans_type], quantity,
+                                  -1 if unit_cost is None else unit_cost,
+                                  record_id, order_id, when, uid)
+            self._added()
+
+    def flush(self):
+        """Emit the buffered records as one frame"""
+        if not self._count:
+            return
+        strings = self._strings + bytes(-len(self._strings) % 8)
+        body = self._records + strings
+        self.f.write(FRAME.pack(self._kind, self._count, len(strings), zlib.crc32(body)))
+        self.f.write(body)
+        self.records_written += self._count
+        self._records = bytearray()
+        self._strings = bytearray()
+        self._refs = {}
+        self._count = 0
+
+    def close(self):
+        self.flush()
+
+
+class Frame:
+    """One frame of records, read in place from a buffer"""
+
+    def __init__(self, kind, count, records, strings):
+        self.kind = kind
+        self.count = count
+        self.records = records
+        self.strings = strings
+        self._record = RECORDS[kind]
+
+    def __len__(self):
+        return self.count
+
+    def _text(self, offset, length):
+        return str(self.strings[offset:offset + length], "utf-8")
+
+    def column(self, field):
+        """Zero-copy strided view of one field across all records
+
+        Numeric fields are int64 ('q'); string fields give the uint32
+        table offsets (their lengths are the next column over).
+        """
+        word, index = FIELDS[self.kind][field]
+        words = self.records.cast(word)
+        stride = self._record.size // words.itemsize
+        return words[index::stride]
+
+    def row(self, index):
+        """Record as Python values: a product row tuple or a transaction dict"""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self._decode(self._record.unpack_from(self.records, index * self._record.size),
+                            self._text)
+
+    __getitem__ = row
+
+    def __iter__(self):
+        # One pass over the records; each distinct string is decoded once
+        strings = bytes(self.strings)
+        cache = {}
+
+        def text(offset, length):
+            # Empty strings share their offset with the next string
+            value = cache.get(offset) if length else ""
+            if value is None:
+                value = cache[offset] = strings[offset:offset + length].decode()
+            return value
+
+        decode = self._decode
+        for values in self._record.iter_unpack(self.records):
+            yield decode(values, text)
+
+    def _decode(self, values, text):
+        if self.kind == PRODUCTS:
+            return (text(values[0], values[1]), text(values[2], values[3]),
+                    text(values[4], values[5]), values[6] / 100, values[7])
+        trans_type, quantity, unit_cost, record_id, order_id, when, uid = values[6:]
+        return {
+            'id': record_id or None,
+            'sku': text(values[0], values[1]),
+            'product_name': text(values[2], values[3]),
+            'type': TYPES[trans_type],
+            'quantity': quantity,
+            'timestamp': _timestamp(when) if when else None,
+            'notes': text(values[4], values[5]),
+            'unit_cost': None if unit_cost < 0 else unit_cost,
+            'order_id': order_id or None,
+            'uid': uid or None,
+        }
+
+    def movements(self):
+        """(sku, type, quantity, notes, unit_cost) tuples for Store.apply_movements"""
+        for record in self:
+            unit_cost = record['unit_cost']
+            yield (record['sku'], record['type'], record['quantity'], record['notes'],
+                   None if unit_cost is None else from_cents(unit_cost))
+
+
+def _check_header(header):
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a Plumberry wire stream")
+    if header[len(MAGIC)] != VERSION:
+        raise ValueError(f"Unsupported wire format version {header[len(MAGIC)]}")
+
+
+def _frame(kind, count, strings_size, crc, body, verify):
+    if kind not in RECORDS:
+        raise ValueError(f"Unknown frame kind {kind!r}")
+    if verify and zlib.crc32(body) != crc:
+        raise ValueError("Wire frame failed its checksum")
+    size = count * RECORDS[kind].size
+    return Frame(kind, count, body[:size], body[size:size + strings_size])
+
+
+def read_frames(buffer, verify=True):
+    """Frames of an in-memory stream (bytes, bytearray, mmap), without copying"""
+    view = memoryview(buffer)
+    _check_header(view[:len(HEADER)])
+    position = len(HEADER)
+    while position < len(view):
+        kind, count, strings_size, crc = FRAME.unpack_from(view, position)
+        position += FRAME.size
+        end = position + count * RECORDS.get(kind, FRAME).size + strings_size
+        if end > len(view):
+            raise ValueError("Truncated wire frame")
+        yield _frame(kind, count, strings_size, crc, view[position:end], verify)
+        position = end
+
+
+def iter_frames(f, verify=True):
+    """Frames read one at a time from a stream (file, socket.makefile)"""
+    _check_header(f.read(len(HEADER)))
+    while True:
+        header = f.read(FRAME.size)
+        if not header:
+            return
+        if len(header) < FRAME.size:
+            raise ValueError("Truncated wire frame")
+        kind, count, strings_size, crc = FRAME.unpack(header)
+        size = count * RECORDS.get(kind, FRAME).size + strings_size
+        body = bytearray(size)
+        if f.readinto(body) != size:
+            raise ValueError("Truncated wire frame")
+        yield _frame(kind, count, strings_size, crc, memoryview(body), verify)
+
+
+def open_file(path, verify=True):
+    """Frames of a wire file, memory-mapped"""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return read_frames(mapped, verify)
+
+
+# Store exchange
+
+def dump_products(store, f, frame_records=FRAME_RECORDS):
+    """Write a consistent snapshot of the store's products; returns the count"""
+    with store.snapshot() as snap:
+        products = snap.products()
+    with WireWriter(f, frame_records) as writer:
+        writer.write_products(products)
+    return writer.records_written
+
+
+def dump_transactions(store, f, first_id=1, frame_records=FRAME_RECORDS):
+    """Write transactions from first_id on, in id order; returns the count"""
+    last_id = store.transaction_count()
+    with WireWriter(f, frame_records) as writer:
+        for start in range(first_id, last_id + 1, frame_records):
+            writer.write_movements(store.get_transactions(start, min(last_id, start + frame_records - 1)))
+    return writer.records_written
+
+
+def load(store, frames, atomic=False):
+    """Apply a wire stream to a store
+
+    Products are bulk-loaded (existing SKUs skipped) and each movement
+    frame is applied as one batch. Returns (products added, results).
+    """
+    added = 0
+    results = []
+    for frame in frames:
+        if frame.kind == PRODUCTS:
+            added += store.add_products(frame)
+        else:
+            results.extend(store.apply_movements(frame.movements(), atomic=atomic))
+    return added, results
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Exchange Plumberry data in the binary wire format")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("export-products", "write the product catalogue"),
+                            ("export-transactions", "write the transaction log")):
+        export = sub.add_parser(name, help=help_text)
+        export.add_argument("output", help="file to write ('-' for stdout)")
+        if name == "export-transactions":
+            export.add_argument("--from-id", type=int, default=1)
+    load_parser = sub.add_parser("import", help="apply products and movements from a wire file")
+    load_parser.add_argument("path")
+    load_parser.add_argument("--atomic", action="store_true",
+                             help="reject a movement frame if any line fails")
+    info = sub.add_parser("info", help="describe a wire file")
+    info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        for number, frame in enumerate(open_file(args.path)):
+            print(f"frame {number}: {frame.kind.decode()} x {frame.count:,} "
+                  f"({len(frame.records) + len(frame.strings):,} bytes)")
+        return
+
+    from storage import get_store, load_sample_products
+    store = get_store()
+    load_sample_products(store)
+    try:
+        if args.command == "import":
+            added, results = load(store, open_file(args.path), args.atomic)
+            failed = [message for ok, message in results if not ok]
+            for message in failed:
+                print(message, file=sys.stderr)
+            print(f"✅ Added {added:,} products, applied {len(results) - len(failed):,} movements")
+            return
+        f = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            if args.command == "export-products":
+                count = dump_products(store, f)
+            else:
+                count = dump_transactions(store, f, args.from_id)
+        finally:
+            if f is not sys.stdout.buffer:
+                f.close()
+        print(f"✅ Wrote {count:,} records to {args.output}", file=sys.stderr)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()